@@ -2,11 +2,14 @@ import asyncio
 import logging
 import time
 import urllib.parse
+from collections import deque
+from typing import AsyncIterator, Iterable, Optional
 
 import pandas as pd
 import aiohttp
 from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
 
+from backends.trace_cache import MISSING, TraceCache
 from common.trace_util import TRACE_DF_COLUMNS, extract_spans
 
 
@@ -17,64 +20,330 @@ class TraceLimitException(Exception):
     """Exception for when the requested limit of traces is not met"""
 
 
+def has_root_span(trace: TracesData) -> bool:
+    """Whether a trace holds its root span, i.e. a span without a parent"""
+    return any(
+        not span.parent_span_id
+        for resource_spans in trace.resource_spans
+        for scope_spans in resource_spans.scope_spans
+        for span in scope_spans.spans
+    )
+
+
 class TempoClient:
-    """Convenience class for interacting with Tempo gRPC API"""
+    """Convenience class for interacting with Tempo gRPC API
+
+    All requests share a single pooled aiohttp session, so connections to Tempo
+    are kept alive and reused across calls. The session is created lazily on
+    first use and must be released with close() (or by using the client as an
+    async context manager).
+
+    With a TraceCache, traces fetched by id are cached, and concurrent requests
+    for the same id share a single request to Tempo.
+    """
 
     QUERY_HEADERS = {"Accept": "application/protobuf"}
 
-    def __init__(self, tempo_url):
+    def __init__(
+        self,
+        tempo_url,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        timeout: float = 30,
+        keepalive_timeout: float = 60,
+        cache: Optional[TraceCache] = None,
+    ):
+        """
+        Args:
+            tempo_url (str): URL of Tempo REST endpoint
+            limit (int, optional): total number of pooled connections. Defaults to 100.
+            limit_per_host (int, optional): number of pooled connections per host. Defaults to 20.
+            timeout (float, optional): total timeout of a request in seconds. Defaults to 30.
+            keepalive_timeout (float, optional): seconds to keep idle connections open. Defaults to 60.
+            cache (TraceCache, optional): cache of traces fetched by id. Defaults to no caching.
+        """
         self._tempo_url = tempo_url
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._timeout = timeout
+        self._keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache
+        self._fetching: dict[str, asyncio.Future] = {}
+        # traces that could not be fetched while streaming span batches
+        self.trace_errors = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Pooled session shared by all requests, created inside the running event loop on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled session and its connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
 
     async def search(
         self,
-        session: aiohttp.ClientSession,
         start_delta: int,
         limit: int,
-        query: str,
+        query: str = '{trace:rootService != ""}',
     ) -> list[str]:
         """Search Tempo for arbitrary traces
 
         Args:
-            session (aiohttp.ClientSession): aiohttp Session
             start_delta (int): Number of seconds in past to search for traces.
             limit (int): maximum among of traces to pull back from Tempo
+            query (str): TraceQL query the traces must match
         Returns:
             list[str]: trace ids from tempo meeting request criteria
         """
         logger.info("Searching tempo for %d traces", limit)
         end = int(time.time()) - 20
         start = end - start_delta
+        trace_ids = await self._search_range(start, end, limit, query)
+        logger.info("Trace search complete")
+        return trace_ids
+
+    async def _search_range(self, start: int, end: int, limit: int, query: str) -> list[str]:
         traceql = urllib.parse.quote(query)
         url = f"{self._tempo_url}/api/search?q={traceql}&start={start}&end={end}&limit={limit}"
-        async with session.get(url) as response:
+        async with self.session.get(url) as response:
+            response.raise_for_status()
             trace_data = await response.json()
-            trace_ids = [t["traceID"] for t in trace_data["traces"]]
-            logger.info("Trace search complete")
-            return trace_ids
+            return [t["traceID"] for t in trace_data.get("traces", [])]
+
+    async def search_windows(
+        self,
+        start_delta: int,
+        limit: int,
+        query: str = '{trace:rootService != ""}',
+        windows: int = 1,
+        concurrency: int = 4,
+    ) -> list[str]:
+        """Search Tempo over consecutive time windows, concurrently
+
+        A single search over a long range is cut short by Tempo's search limits.
+        The range is split into ``windows`` equal windows, each searched for up to
+        ``limit`` traces, with at most ``concurrency`` searches at a time. Ids are
+        deduplicated and taken from the most recent window first. The search stops,
+        cancelling the older windows, as soon as the most recent windows searched so
+        far give ``limit`` ids. A window whose search fails is logged and skipped.
+
+        Args:
+            start_delta (int): Number of seconds in past to search for traces.
+            limit (int): maximum number of trace ids to return
+            query (str): TraceQL query the traces must match
+            windows (int, optional): number of time windows. Defaults to 1.
+            concurrency (int, optional): maximum number of concurrent searches. Defaults to 4.
+
+        Returns:
+            list[str]: up to ``limit`` unique trace ids, most recent windows first
+        """
+        logger.info("Searching tempo for %d traces in %d windows", limit, windows)
+        end = int(time.time()) - 20
+        windows = max(1, min(windows, start_delta))
+        bounds = [end - start_delta * i // windows for i in range(windows + 1)]
+        slots = asyncio.Semaphore(concurrency)
+
+        async def search_window(i: int) -> list[str]:
+            async with slots:
+                try:
+                    return await self._search_range(bounds[i + 1], bounds[i], limit, query)
+                except Exception as e:
+                    logger.warning(
+                        "Search of window %d (%d-%d) failed: %s", i, bounds[i + 1], bounds[i], e
+                    )
+                    return []
 
-    async def find_trace_by_id(
-        self, session: aiohttp.ClientSession, trace_id: str
-    ) -> TracesData:
+        searches = [asyncio.ensure_future(search_window(i)) for i in range(windows)]
+        trace_ids: dict[str, None] = {}
+        try:
+            # windows are merged in order, so the result does not depend on which search finishes first
+            for search in searches:
+                trace_ids.update(dict.fromkeys(await search))
+                if len(trace_ids) >= limit:
+                    break
+        finally:
+            for search in searches:
+                search.cancel()
+        logger.info("Trace search complete, %d traces found", len(trace_ids))
+        return list(trace_ids)[:limit]
+
+    async def find_trace_by_id(self, trace_id: str) -> Optional[TracesData]:
         """Find a trace in Tempo by it's trace id
 
         Args:
-            session (aiohttp.ClientSession): aiohttp Session
             trace_id (str): ID of trace
 
         Returns:
-            TraceByIDResponse: response from Tempo containing trace info
+            Optional[TracesData]: response from Tempo containing trace info,
+                None when Tempo does not have the trace (404 or an empty trace)
+
+        Raises:
+            aiohttp.ClientResponseError: on any other error response, e.g. 429 or 5xx
         """
+        if self.cache is None:
+            return await self._fetch_trace(trace_id)
+
+        trace = self.cache.get(trace_id)
+        if trace is MISSING:
+            return None
+        if trace is not None:
+            return trace
+        fetching = self._fetching.get(trace_id)
+        if fetching is None:
+            fetching = asyncio.ensure_future(self._fetch_trace(trace_id))
+            self._fetching[trace_id] = fetching
+            fetching.add_done_callback(lambda _: self._fetching.pop(trace_id, None))
+        # shield, so a cancelled caller does not cancel the request others wait on
+        return await asyncio.shield(fetching)
+
+    async def _fetch_trace(self, trace_id: str) -> Optional[TracesData]:
         url = f"{self._tempo_url}/api/traces/{trace_id}"
-        async with session.get(url, headers=self.QUERY_HEADERS) as response:
-            message = TracesData()
+        async with self.session.get(url, headers=self.QUERY_HEADERS) as response:
+            if response.status != 404:
+                # server errors and throttling are errors, not missing traces
+                response.raise_for_status()
             payload = await response.read()
             if response.status == 200:
-                message.ParseFromString(payload)
-            else:
-                logger.warning(
-                    "Could not retrieve trace with id %s: %s", trace_id, payload
-                )
-            return message
+                message = TracesData.FromString(payload)
+                if message.resource_spans:
+                    if self.cache is not None:
+                        self.cache.put(trace_id, message, len(payload), partial=not has_root_span(message))
+                    return message
+            # not ingested yet, or already expired
+            if self.cache is not None:
+                self.cache.put_missing(trace_id)
+            logger.debug("Trace with id %s not found", trace_id)
+            return None
+
+    async def search_trace_ids(
+        self,
+        start_delta: int,
+        limit: int,
+        query: str = '{trace:rootService != ""}',
+        min_count: Optional[int] = None,
+        windows: int = 1,
+    ) -> list[str]:
+        """Search Tempo for ``limit`` traces, accepting at least ``min_count``
+
+        Args:
+            start_delta (int): Number of seconds in past to search for traces.
+            limit (int): maximum number of trace ids to return
+            query (str): TraceQL query the traces must match
+            min_count (int, optional): fewest trace ids accepted. Defaults to limit.
+            windows (int, optional): number of time windows searched, see search_windows. Defaults to 1.
+
+        Raises:
+            TraceLimitException: when Tempo has fewer than ``min_count`` traces
+        """
+        if min_count is None:
+            min_count = limit
+        trace_ids = await self.search_windows(start_delta, limit, query, windows)
+        if len(trace_ids) < min_count:
+            raise TraceLimitException(
+                f"Requested {limit} traces (at least {min_count}) but only {len(trace_ids)} were received"
+            )
+        if len(trace_ids) < limit:
+            logger.warning("Requested %d traces, continuing with %d", limit, len(trace_ids))
+        return trace_ids
+
+    async def stream_span_batches(
+        self,
+        trace_ids: Iterable[str],
+        batch_traces: int = 500,
+        concurrency: Optional[int] = None,
+        arrow: bool = False,
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Fetch traces and yield their spans in batches, as the traces arrive
+
+        At most ``concurrency`` traces are fetched at a time, and only their
+        TracesData and the rows of the current batch are held in memory. Batches
+        follow the order of ``trace_ids``. A trace that cannot be fetched, or that Tempo
+        does not have, is logged, counted in ``trace_errors`` and skipped, without
+        failing the other traces.
+
+        Args:
+            trace_ids (Iterable[str]): ids of the traces to fetch
+            batch_traces (int, optional): traces per batch. Defaults to 500.
+            concurrency (int, optional): maximum number of concurrent requests.
+                Defaults to the number of pooled connections per host.
+            arrow (bool, optional): yield pyarrow RecordBatches instead of data frames, 
+                requires the optional pyarrow package. Defaults to False.
+
+        Yields:
+            pd.DataFrame: spans of up to ``batch_traces`` traces, with TRACE_DF_COLUMNS
+        """
+        if arrow:
+            try:
+                import pyarrow as pa
+            except ImportError as e:
+                raise ImportError("stream_span_batches(arrow=True) requires pyarrow, install it with pip install pyarrow") from e
+
+        def batch(rows):
+            df = pd.DataFrame(rows, columns=TRACE_DF_COLUMNS)
+            return pa.RecordBatch.from_pandas(df, preserve_index=False) if arrow else df
+
+        if concurrency is None:
+            concurrency = self._limit_per_host
+        trace_ids = iter(trace_ids)
+        fetches: deque[tuple[str, asyncio.Future]] = deque()
+
+        def schedule() -> None:
+            while len(fetches) < concurrency:
+                trace_id = next(trace_ids, None)
+                if trace_id is None:
+                    return
+                fetches.append((trace_id, asyncio.ensure_future(self.find_trace_by_id(trace_id))))
+
+        rows: list[list] = []
+        batch_count = 0
+        try:
+            schedule()
+            while fetches:
+                trace_id, fetch = fetches.popleft()
+                try:
+                    trace = await fetch
+                except Exception as e:
+                    self.trace_errors += 1
+                    logger.warning("Could not retrieve trace with id %s: %r", trace_id, e)
+                    continue
+                finally:
+                    schedule()
+                if trace is None or not trace.resource_spans:
+                    self.trace_errors += 1
+                    logger.warning("Trace with id %s was not found", trace_id)
+                    continue
+                rows.extend(extract_spans(trace.resource_spans))
+                batch_count += 1
+                if batch_count >= batch_traces:
+                    yield batch(rows)
+                    rows, batch_count = [], 0
+            if batch_count:
+                yield batch(rows)
+        finally:
+            # the consumer stopped early, or a fetch failed hard
+            for _, fetch in fetches:
+                fetch.cancel()
 
     async def build_span_df(
         self, start_delta: int, limit: int, query: str = '{trace:rootService != ""}'
@@ -89,20 +358,8 @@ class TempoClient:
         Returns:
             pd.DataFrame: data frame containing trace data
         """
-
-        tcp_connection = aiohttp.TCPConnector(limit=2)
-        async with aiohttp.ClientSession(connector=tcp_connection) as session:
-            trace_ids = await self.search(session, start_delta, limit, query)
-            if len(trace_ids) < limit:
-                raise TraceLimitException(
-                    f"Requested {limit} traces but only {len(trace_ids)} were received"
-                )
-            tasks = [
-                asyncio.ensure_future(self.find_trace_by_id(session, t_id))
-                for t_id in trace_ids
-            ]
-            traces = await asyncio.gather(*tasks)
-
-        span_extract = extract_spans(r for t in traces for r in t.resource_spans)
-        df = pd.DataFrame(span_extract, columns=TRACE_DF_COLUMNS)
-        return df
+        trace_ids = await self.search_trace_ids(start_delta, limit, query)
+        batches = [batch async for batch in self.stream_span_batches(trace_ids)]
+        if not batches:
+            return pd.DataFrame(columns=TRACE_DF_COLUMNS)
+        return pd.concat(batches, ignore_index=True)
@@ -0,0 +1,136 @@
+import asyncio
+
+import aiohttp
+import pytest
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, Span, TracesData
+
+from backends.tempo_client import TempoClient, has_root_span
+from backends.trace_cache import TraceCache
+
+
+def traces_data(root=True):
+    spans = [Span(trace_id=b"t" * 16, span_id=b"child000", parent_span_id=b"root0000")]
+    if root:
+        spans.append(Span(trace_id=b"t" * 16, span_id=b"root0000"))
+    return TracesData(resource_spans=[ResourceSpans(scope_spans=[ScopeSpans(spans=spans)])])
+
+
+class FakeResponse:
+    def __init__(self, status, payload=b""):
+        self.status = status
+        self._payload = payload
+
+    async def read(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    """Answers every trace id with the response registered for it, counting the requests"""
+
+    closed = False
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        return self.responses[url.rsplit("/", 1)[1]]
+
+    async def close(self):
+        pass
+
+
+def client(responses, cache=None):
+    tempo_client = TempoClient("http://tempo", cache=cache)
+    tempo_client._session = FakeSession(responses)
+    return tempo_client
+
+
+RESPONSES = {
+    "complete": FakeResponse(200, traces_data().SerializeToString()),
+    "partial": FakeResponse(200, traces_data(root=False).SerializeToString()),
+    "empty": FakeResponse(200, b""),
+    "missing": FakeResponse(404, b"trace not found"),
+    "throttled": FakeResponse(429),
+    "failing": FakeResponse(500),
+}
+
+
+def test_has_root_span():
+    assert has_root_span(traces_data())
+    assert not has_root_span(traces_data(root=False))
+
+
+def test_find_trace_by_id():
+    async def run():
+        tempo_client = client(RESPONSES)
+        assert await tempo_client.find_trace_by_id("complete") == traces_data()
+        # only 404 and empty traces are missing, other errors are raised
+        assert await tempo_client.find_trace_by_id("empty") is None
+        assert await tempo_client.find_trace_by_id("missing") is None
+        for trace_id, status in (("throttled", 429), ("failing", 500)):
+            with pytest.raises(aiohttp.ClientResponseError) as error:
+                await tempo_client.find_trace_by_id(trace_id)
+            assert error.value.status == status
+
+    asyncio.run(run())
+
+
+def test_find_trace_by_id_caches_traces_and_missing_ids():
+    async def run():
+        cache = TraceCache()
+        tempo_client = client(RESPONSES, cache)
+        for _ in range(3):
+            assert await tempo_client.find_trace_by_id("complete") is not None
+            assert await tempo_client.find_trace_by_id("missing") is None
+        assert tempo_client.session.requests == 2
+        # errors are not remembered as missing
+        for _ in range(2):
+            with pytest.raises(aiohttp.ClientResponseError):
+                await tempo_client.find_trace_by_id("failing")
+        assert tempo_client.session.requests == 4
+
+    asyncio.run(run())
+
+
+def test_partial_traces_are_cached_for_partial_ttl():
+    async def run():
+        cache = TraceCache(ttl=300, partial_ttl=0)
+        tempo_client = client(RESPONSES, cache)
+        await tempo_client.find_trace_by_id("partial")
+        await tempo_client.find_trace_by_id("complete")
+        assert len(cache) == 1
+
+    asyncio.run(run())
+
+
+def test_concurrent_requests_share_a_fetch():
+    async def run():
+        tempo_client = client(RESPONSES, TraceCache())
+        traces = await asyncio.gather(*(tempo_client.find_trace_by_id("complete") for _ in range(5)))
+        assert all(trace == traces_data() for trace in traces)
+        assert tempo_client.session.requests == 1
+
+    asyncio.run(run())
+
+
+def test_stream_span_batches_counts_missing_and_failed_traces():
+    async def run():
+        tempo_client = client(RESPONSES)
+        trace_ids = ["complete", "missing", "empty", "failing", "partial", "throttled"]
+        batches = [batch async for batch in tempo_client.stream_span_batches(trace_ids, batch_traces=1)]
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert tempo_client.trace_errors == 4
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+
+from backends.trace_cache import MISSING, TraceCache
+
+
+def test_get_put_and_ttl():
+    cache = TraceCache(ttl=10)
+    trace = TracesData()
+    assert cache.get("a", now=0) is None
+    cache.put("a", trace, 100, now=0)
+    assert cache.get("a", now=9) is trace
+    assert cache.get("a", now=10) is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses, cache.expirations) == (1, 2, 1)
+
+
+def test_partial_traces_expire_after_partial_ttl():
+    cache = TraceCache(ttl=300, partial_ttl=5)
+    cache.put("partial", TracesData(), 10, now=0, partial=True)
+    cache.put("complete", TracesData(), 10, now=0)
+    assert cache.get("partial", now=4) is not None
+    assert cache.get("partial", now=5) is None
+    assert cache.get("complete", now=299) is not None
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = TraceCache(max_entries=2, max_bytes=100)
+    cache.put("a", TracesData(), 10, now=0)
+    cache.put("b", TracesData(), 10, now=0)
+    cache.get("a", now=1)
+    cache.put("c", TracesData(), 10, now=1)
+    # b was the least recently used
+    assert cache.get("b", now=1) is None
+    assert cache.get("a", now=1) is not None
+    # evicts c, now the least recently used, to stay within max_bytes
+    cache.put("d", TracesData(), 90, now=1)
+    assert len(cache) == 2 and cache.bytes == 100
+    assert cache.get("c", now=1) is None
+    assert cache.evictions == 2
+    # a trace larger than the cache is not cached at all
+    cache.put("e", TracesData(), 101, now=1)
+    assert cache.get("e", now=1) is None and cache.get("d", now=1) is not None
+
+
+def test_missing_ids():
+    cache = TraceCache(negative_ttl=5)
+    cache.put_missing("a", now=0)
+    assert cache.get("a", now=4) is MISSING
+    assert cache.get("a", now=5) is None
+    assert cache.negative_hits == 1
+    # a trace put after all replaces the negative entry
+    cache.put_missing("b", now=0)
+    cache.put("b", TracesData(), 10, now=1)
+    assert cache.get("b", now=2) is not MISSING
+
+
+def test_disabled():
+    cache = TraceCache(max_entries=0)
+    cache.put("a", TracesData(), 10, now=0)
+    cache.put_missing("b", now=0)
+    assert cache.get("a", now=0) is None and cache.get("b", now=0) is None
+    assert TraceCache(negative_ttl=0).get("b") is None
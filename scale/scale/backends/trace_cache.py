@@ -0,0 +1,147 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+
+
+# returned by TraceCache.get for trace ids Tempo recently did not find
+MISSING = object()
+
+
+class TraceCache:
+    """Bounded in-process cache of traces fetched from Tempo
+
+    Parsed traces are kept for ``ttl`` seconds, bounded to ``max_entries`` traces
+    and ``max_bytes`` of serialized trace data, evicting the least recently used
+    first. Partial traces, whose root span Tempo has not ingested yet, are only kept
+    for ``partial_ttl`` seconds so the rest of the trace is fetched soon after.
+    Trace ids Tempo answered 404 for are remembered for ``negative_ttl`` seconds,
+    so ids that are not ingested yet are not requested over and over.
+
+    Cached messages are shared by every caller and must not be modified.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 300,
+        negative_ttl: float = 5,
+        partial_ttl: float = 5,
+    ):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._partial_ttl = partial_ttl
+        # trace id -> (trace, serialized size, expiry)
+        self._traces: OrderedDict[str, tuple[TracesData, int, float]] = OrderedDict()
+        # trace id -> expiry
+        self._missing: OrderedDict[str, float] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+    def get(self, trace_id: str, now: Optional[float] = None) -> Union[TracesData, object, None]:
+        """Looks up a trace
+
+        Args:
+            trace_id (str): trace id
+            now (float, optional): current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            Union[TracesData, object, None]: the cached trace, MISSING if Tempo recently
+                did not find it, None on a miss
+        """
+        if now is None:
+            now = time.monotonic()
+        entry = self._traces.get(trace_id)
+        if entry is not None:
+            trace, size, expiry = entry
+            if expiry > now:
+                self.hits += 1
+                self._traces.move_to_end(trace_id)
+                return trace
+            self._remove(trace_id)
+            self.expirations += 1
+
+        expiry = self._missing.get(trace_id)
+        if expiry is not None:
+            if expiry > now:
+                self.negative_hits += 1
+                return MISSING
+            del self._missing[trace_id]
+
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        trace_id: str,
+        trace: TracesData,
+        size: int,
+        now: Optional[float] = None,
+        partial: bool = False,
+    ) -> None:
+        """Caches a fetched trace
+
+        Args:
+            trace_id (str): trace id
+            trace (TracesData): parsed trace
+            size (int): size of the serialized trace in bytes
+            now (float, optional): current monotonic time. Defaults to time.monotonic().
+            partial (bool, optional): the trace has no root span yet, kept for ``partial_ttl``. Defaults to False.
+        """
+        ttl = self._partial_ttl if partial else self._ttl
+        if size > self._max_bytes or self._max_entries <= 0 or ttl <= 0:
+            return
+        if now is None:
+            now = time.monotonic()
+        if trace_id in self._traces:
+            self._remove(trace_id)
+        self._missing.pop(trace_id, None)
+        self._traces[trace_id] = (trace, size, now + ttl)
+        self.bytes += size
+        while len(self._traces) > self._max_entries or self.bytes > self._max_bytes:
+            self._remove(next(iter(self._traces)))
+            self.evictions += 1
+
+    def put_missing(self, trace_id: str, now: Optional[float] = None) -> None:
+        """Remembers that Tempo did not find a trace"""
+        if self._negative_ttl <= 0 or self._max_entries <= 0:
+            return
+        if now is None:
+            now = time.monotonic()
+        self._missing[trace_id] = now + self._negative_ttl
+        self._missing.move_to_end(trace_id)
+        while len(self._missing) > self._max_entries:
+            self._missing.popitem(last=False)
+
+    def _remove(self, trace_id: str) -> None:
+        _, size, _ = self._traces.pop(trace_id)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._traces),
+            "bytes": self.bytes,
+            "missing": len(self._missing),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hit_rate,
+        }
@@ -0,0 +1,57 @@
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, Span, TracesData
+
+from common.trace_buffer import TraceBuffer
+
+
+def add(buffer, trace_id, span_id, parent_span_id=b"", now=0, resource_spans=None):
+    span = Span(trace_id=trace_id, span_id=span_id, parent_span_id=parent_span_id)
+    return buffer.add_span(resource_spans or ResourceSpans(), ScopeSpans(), span, now=now)
+
+
+def test_traces_released_after_linger():
+    buffer = TraceBuffer(linger=5)
+    add(buffer, b"a", b"1", now=0)
+    add(buffer, b"b", b"1", now=3)
+    add(buffer, b"a", b"2", b"1", now=4)
+    assert buffer.pop_ready(now=4) == []
+    ready = buffer.pop_ready(now=5)
+    assert [buffered.trace_id for buffered in ready] == [b"a"]
+    assert len(ready[0].spans) == 2
+    assert (len(buffer), buffer.span_count) == (1, 1)
+    assert [buffered.trace_id for buffered in buffer.pop_all()] == [b"b"]
+    assert buffer.span_count == 0
+
+
+def test_oldest_traces_released_past_max_spans():
+    buffer = TraceBuffer(linger=60, max_spans=3)
+    add(buffer, b"a", b"1", now=0)
+    add(buffer, b"a", b"2", b"1", now=0)
+    add(buffer, b"b", b"1", now=1)
+    assert buffer.pop_ready(now=2) == []
+    add(buffer, b"c", b"1", now=2)
+    ready = buffer.pop_ready(now=2)
+    assert [buffered.trace_id for buffered in ready] == [b"a"]
+    assert (buffer.span_count, buffer.overflow_count) == (2, 1)
+
+
+def test_is_complete():
+    buffer = TraceBuffer(linger=5)
+    buffered = add(buffer, b"a", b"2", b"1")
+    assert not buffered.is_complete()
+    add(buffer, b"a", b"1")
+    assert buffered.is_complete()
+
+
+def test_to_traces_data_groups_spans_by_resource():
+    traces_data = TracesData()
+    for service in ["frontend", "cart"]:
+        resource_spans = traces_data.resource_spans.add(schema_url=service)
+        resource_spans.resource.dropped_attributes_count = 1
+        scope_spans = resource_spans.scope_spans.add()
+        scope_spans.scope.name = service
+        scope_spans.spans.add(trace_id=b"a", span_id=service.encode())
+    buffer = TraceBuffer(linger=5)
+    buffer.add_traces_data(traces_data)
+    (buffered,) = buffer.pop_all()
+    assert buffered.sampled
+    assert buffered.to_traces_data() == traces_data
@@ -0,0 +1,160 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from opentelemetry.proto.trace.v1.trace_pb2 import (
+    ResourceSpans,
+    ScopeSpans,
+    Span,
+    TracesData,
+)
+
+
+class BufferedTrace:
+    """Spans collected for a single trace id while it lingers in a TraceBuffer"""
+
+    __slots__ = ("trace_id", "first_seen", "spans", "sampled")
+
+    def __init__(self, trace_id: bytes, first_seen: float):
+        self.trace_id = trace_id
+        self.first_seen = first_seen
+        self.spans: list[tuple[ResourceSpans, ScopeSpans, Span]] = []
+        self.sampled = False
+
+    @property
+    def hex_id(self) -> str:
+        return bytes.hex(self.trace_id)
+
+    def is_complete(self) -> bool:
+        """Checks that the buffered spans form a full tree
+
+        Returns:
+            bool: True if there is a root span and every parent span is present
+        """
+        span_ids = {span.span_id for _, _, span in self.spans}
+        has_root = False
+        for _, _, span in self.spans:
+            if not span.parent_span_id:
+                has_root = True
+            elif span.parent_span_id not in span_ids:
+                return False
+        return has_root
+
+    def to_traces_data(self) -> TracesData:
+        """Groups the buffered spans back under their resource and scope
+
+        Returns:
+            TracesData: trace data containing every buffered span
+        """
+        traces_data = TracesData()
+        last_resource_spans = last_scope_spans = None
+        for resource_spans, scope_spans, span in self.spans:
+            if resource_spans is not last_resource_spans:
+                current_resource_spans = traces_data.resource_spans.add(
+                    schema_url=resource_spans.schema_url
+                )
+                current_resource_spans.resource.CopyFrom(resource_spans.resource)
+                last_resource_spans = resource_spans
+                last_scope_spans = None
+            if scope_spans is not last_scope_spans:
+                current_scope_spans = current_resource_spans.scope_spans.add(
+                    schema_url=scope_spans.schema_url
+                )
+                current_scope_spans.scope.CopyFrom(scope_spans.scope)
+                last_scope_spans = scope_spans
+            current_scope_spans.spans.append(span)
+        return traces_data
+
+
+class TraceBuffer:
+    """Time bounded buffer that groups spans by trace id
+
+    Spans are held for ``linger`` seconds after the first span of their trace
+    arrives, giving the rest of the trace a chance to show up. When the buffer
+    holds more than ``max_spans`` spans, the oldest traces are released early.
+    """
+
+    def __init__(self, linger: float, max_spans: int = 100000):
+        self._linger = linger
+        self._max_spans = max_spans
+        self._traces: OrderedDict[bytes, BufferedTrace] = OrderedDict()
+        self._span_count = 0
+        self.overflow_count = 0
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+    @property
+    def span_count(self) -> int:
+        return self._span_count
+
+    def add_span(
+        self,
+        resource_spans: ResourceSpans,
+        scope_spans: ScopeSpans,
+        span: Span,
+        sampled: bool = False,
+        now: Optional[float] = None,
+    ) -> BufferedTrace:
+        """Adds a span to the buffer of its trace
+
+        Args:
+            resource_spans (ResourceSpans): resource the span was exported under
+            scope_spans (ScopeSpans): scope the span was exported under
+            span (Span): the span itself
+            sampled (bool, optional): marks the whole trace as sampled. Defaults to False.
+            now (float, optional): current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            BufferedTrace: buffered trace the span was added to
+        """
+        buffered = self._traces.get(span.trace_id)
+        if buffered is None:
+            buffered = BufferedTrace(
+                span.trace_id, time.monotonic() if now is None else now
+            )
+            self._traces[span.trace_id] = buffered
+        buffered.spans.append((resource_spans, scope_spans, span))
+        buffered.sampled |= sampled
+        self._span_count += 1
+        return buffered
+
+    def add_traces_data(self, traces_data: TracesData, sampled: bool = True) -> None:
+        """Adds every span of a TracesData message to the buffer"""
+        now = time.monotonic()
+        for resource_spans in traces_data.resource_spans:
+            for scope_spans in resource_spans.scope_spans:
+                for span in scope_spans.spans:
+                    self.add_span(resource_spans, scope_spans, span, sampled, now)
+
+    def pop_ready(self, now: Optional[float] = None) -> list[BufferedTrace]:
+        """Removes and returns traces whose linger time has passed, plus the
+        oldest traces needed to get the buffer back under its span cap
+
+        Args:
+            now (float, optional): current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            list[BufferedTrace]: released traces, oldest first
+        """
+        if now is None:
+            now = time.monotonic()
+        deadline = now - self._linger
+        ready = []
+        while self._traces:
+            buffered = next(iter(self._traces.values()))
+            if buffered.first_seen > deadline:
+                if self._span_count <= self._max_spans:
+                    break
+                self.overflow_count += 1
+            self._traces.popitem(last=False)
+            self._span_count -= len(buffered.spans)
+            ready.append(buffered)
+        return ready
+
+    def pop_all(self) -> list[BufferedTrace]:
+        """Removes and returns every buffered trace"""
+        ready = list(self._traces.values())
+        self._traces.clear()
+        self._span_count = 0
+        return ready
@@ -0,0 +1,541 @@
+"""Benchmarks the hot paths of the sampler and modeler and flags regressions
+
+Every benchmark runs in-process on two workloads: synthetic traces shaped like
+the otel-demo, and a recorded dataset replayed from tests/data. Rates are compared
+with a stored baseline, and a benchmark whose median rate dropped by more than
+--tolerance is reported as a regression, with a non-zero exit status. Results are
+keyed by benchmark and workload parameters, so a baseline is only compared with
+runs on the same workload.
+
+    python -m experiments.benchmark --save_baseline
+    python -m experiments.benchmark
+    python -m experiments.benchmark --only sampler --repeat 30
+
+Rates depend on the machine, so the baseline is not committed: record one with
+--save_baseline on the machine the comparisons run on.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import NamedTuple, Optional
+from unittest.mock import MagicMock
+
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+from opentelemetry.proto.trace.v1.trace_pb2 import Span, TracesData
+
+from experiments.replay import (
+    FILE_PATH,
+    TESTS_DIR,
+    ReplayEvent,
+    _group_resource_spans,
+    assemble_traces,
+    load_dataset,
+    load_sampler_config,
+    train_sampler,
+)
+
+from common.trace_util import extract_spans
+from config.config_manager import ConfigManager
+from models import LatencyTracker, Trace
+from trace_processor import TraceProcessor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(FILE_PATH, "benchmark_baseline.json")
+DEFAULT_DATASET = os.path.join(TESTS_DIR, "data", "logs", "full_request.log.bz2")
+CONFIG_DIR = os.path.join(TESTS_DIR, "configs", "otel-demo")
+
+SERVICES = [
+    "frontend",
+    "adservice",
+    "cartservice",
+    "checkoutservice",
+    "currencyservice",
+    "paymentservice",
+    "productcatalogservice",
+    "recommendationservice",
+    "shippingservice",
+]
+OPERATIONS = [
+    "GET /api/products/{id}",
+    "POST /api/cart",
+    "GET /api/recommendations",
+    "oteldemo.CartService/GetCart",
+    "oteldemo.CurrencyService/Convert",
+    "oteldemo.PaymentService/Charge",
+    "SELECT products",
+    "HGET",
+]
+
+
+class Workload(NamedTuple):
+    """Export requests and the traces they add up to, and the parameters they were made with"""
+
+    name: str
+    params: str
+    requests: list[ReplayEvent]
+    traces: list[ReplayEvent]
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.params}"
+
+    @property
+    def spans(self) -> int:
+        return sum(event.spans for event in self.requests)
+
+
+def synthetic_workload(traces: int, spans_per_trace: int, seed: int = 0) -> Workload:
+    """Random traces with one request each, the same for the same seed
+
+    Spans hang off a random earlier span of their trace and about 5% of them are
+    40 times slower than usual, so the sampler has anomalies to find. Operation
+    names carry ids, like real HTTP routes, for the sanitizer to strip.
+    """
+    rng = random.Random(seed)
+    start = 1_700_000_000_000_000_000
+    requests = []
+    for _ in range(traces):
+        trace_id = rng.getrandbits(128).to_bytes(16, "big")
+        span_ids = [rng.getrandbits(64).to_bytes(8, "big") for _ in range(spans_per_trace)]
+        spans = []
+        for index, span_id in enumerate(span_ids):
+            duration = rng.uniform(1, 50) * 1e6 * (40 if rng.random() < 0.05 else 1)
+            operation = rng.choice(OPERATIONS).replace("{id}", str(rng.randrange(10000)))
+            span = Span(
+                trace_id=trace_id,
+                span_id=span_id,
+                parent_span_id=span_ids[rng.randrange(index)] if index else b"",
+                name=operation,
+                kind=Span.SPAN_KIND_SERVER,
+                start_time_unix_nano=start + index * 1000,
+                end_time_unix_nano=start + index * 1000 + int(duration),
+                attributes=[
+                    KeyValue(key="http.method", value=AnyValue(string_value="GET")),
+                    KeyValue(key="http.status_code", value=AnyValue(int_value=200)),
+                ],
+            )
+            service = SERVICES[0] if not index else rng.choice(SERVICES)
+            spans.append((service, "", "", span))
+        request = ExportTraceServiceRequest(resource_spans=_group_resource_spans(spans))
+        requests.append(ReplayEvent(start, len(spans), request))
+        start += 10_000_000
+    traces_data = [
+        ReplayEvent(event.time_ns, event.spans, TracesData(resource_spans=event.message.resource_spans))
+        for event in requests
+    ]
+    params = f"traces={traces},spans_per_trace={spans_per_trace},seed={seed}"
+    return Workload("synthetic", params, requests, traces_data)
+
+
+def recorded_workload(path: str, limit: int = 0) -> Workload:
+    """Requests of a recorded dataset, see experiments.replay for the supported formats"""
+    requests = load_dataset(path, limit)
+    params = f"dataset={os.path.basename(path)},limit={limit}"
+    return Workload("recorded", params, requests, assemble_traces(requests))
+
+
+def _span_rows(workload: Workload) -> list[list]:
+    return list(
+        extract_spans(
+            resource_spans for event in workload.requests for resource_spans in event.message.resource_spans
+        )
+    )
+
+
+def _model_traces(workload: Workload) -> list[Trace]:
+    """Traces the modeler would keep, those with a root span"""
+    traces = []
+    for event in workload.traces:
+        try:
+            traces.append(Trace.from_proto(trace_data=event.message))
+        except ValueError:
+            continue
+    return traces
+
+
+def _trained_sampler(workload: Workload, *args: str):
+    from trace_handler import TraceSampler
+
+    trace_sampler = TraceSampler(load_sampler_config(["--skip_span_count=0", *args]))
+    # train on the whole workload, so every operation is known before it is scored
+    train_sampler(trace_sampler, workload.requests)
+    return trace_sampler
+
+
+class Benchmark:
+    """A hot path timed over a workload
+
+    setup prepares everything run needs and returns how many units (spans,
+    traces, calls) one run processes. Only run is timed.
+    """
+
+    name = ""
+    unit = "spans"
+    # False for benchmarks whose input does not come from the workload, run only once
+    uses_workload = True
+
+    async def setup(self, workload: Workload) -> int:
+        raise NotImplementedError
+
+    async def run(self) -> None:
+        raise NotImplementedError
+
+    async def teardown(self) -> None:
+        pass
+
+
+class SamplerExport(Benchmark):
+    """TraceSampler.Export on every request, scoring span by span or in batches"""
+
+    unit = "spans"
+
+    def __init__(self, batch_scoring: bool = False):
+        self.name = "sampler_export_batch" if batch_scoring else "sampler_export"
+        self._args = ["--batch_scoring"] if batch_scoring else []
+
+    async def setup(self, workload: Workload) -> int:
+        self._sampler = _trained_sampler(workload, *self._args)
+        self._sampler.start_scoring_pool()
+        self._requests = [event.message for event in workload.requests]
+        return workload.spans
+
+    async def run(self) -> None:
+        for request in self._requests:
+            await self._sampler.Export(request, None)
+
+    async def teardown(self) -> None:
+        await self._sampler.close()
+
+
+class SamplerFeaturize(Benchmark):
+    """TraceSampler.featurize on every span, operations already sanitized"""
+
+    name = "sampler_featurize"
+    unit = "spans"
+
+    async def setup(self, workload: Workload) -> int:
+        self._sampler = _trained_sampler(workload)
+        self._spans = [
+            (service, self._sampler.sanitize_operation(operation), duration)
+            for _, _, _, service, operation, _, duration in _span_rows(workload)
+        ]
+        return len(self._spans)
+
+    async def run(self) -> None:
+        featurize = self._sampler.featurize
+        for service, operation, duration in self._spans:
+            featurize(service, operation, duration)
+
+    async def teardown(self) -> None:
+        await self._sampler.close()
+
+
+class SamplerScoreOne(Benchmark):
+    """score_one of the trained model on every featurized span"""
+
+    name = "sampler_score_one"
+    unit = "spans"
+
+    async def setup(self, workload: Workload) -> int:
+        self._sampler = _trained_sampler(workload)
+        self._records = [
+            self._sampler.featurize(service, self._sampler.sanitize_operation(operation), duration)
+            for _, _, _, service, operation, _, duration in _span_rows(workload)
+        ]
+        return len(self._records)
+
+    async def run(self) -> None:
+        score_one = self._sampler._hst.score_one
+        for record in self._records:
+            score_one(record)
+
+    async def teardown(self) -> None:
+        await self._sampler.close()
+
+
+class ExtractSpans(Benchmark):
+    """extract_spans over the spans of every request, as the sampler trains on them"""
+
+    name = "extract_spans"
+    unit = "spans"
+
+    async def setup(self, workload: Workload) -> int:
+        self._resource_spans = [
+            resource_spans for event in workload.requests for resource_spans in event.message.resource_spans
+        ]
+        return workload.spans
+
+    async def run(self) -> None:
+        for _ in extract_spans(self._resource_spans):
+            pass
+
+
+class ParseSpans(Benchmark):
+    """Trace.parse_spans on every trace fetched by the modeler"""
+
+    name = "trace_parse_spans"
+    unit = "spans"
+
+    async def setup(self, workload: Workload) -> int:
+        self._traces = [event.message for event in workload.traces]
+        return sum(event.spans for event in workload.traces)
+
+    async def run(self) -> None:
+        for traces_data in self._traces:
+            Trace.parse_spans(traces_data)
+
+
+class TraceBuild(Benchmark):
+    """Trace._build, linking the parsed spans of every trace into a tree"""
+
+    name = "trace_build"
+    unit = "spans"
+
+    async def setup(self, workload: Workload) -> int:
+        self._traces = _model_traces(workload)
+        return sum(len(trace.span_dict) for trace in self._traces)
+
+    async def run(self) -> None:
+        for trace in self._traces:
+            trace._children = {}
+            trace._build()
+
+
+class TrackerTrack(Benchmark):
+    """LatencyTracker.track of every trace into a fresh tracker"""
+
+    name = "tracker_track"
+    unit = "traces"
+
+    async def setup(self, workload: Workload) -> int:
+        self._traces = _model_traces(workload)
+        return len(self._traces)
+
+    async def run(self) -> None:
+        tracker = LatencyTracker()
+        for trace in self._traces:
+            tracker.track(trace)
+
+
+class HybridDetection(Benchmark):
+    """TraceProcessor._hybrid_detection of every tracked service, repeated ``rounds`` times"""
+
+    name = "hybrid_detection"
+    unit = "calls"
+
+    def __init__(self, rounds: int = 100):
+        self._rounds = rounds
+
+    async def setup(self, workload: Workload) -> int:
+        self._processor = TraceProcessor("", ConfigManager(CONFIG_DIR), MagicMock())
+        for trace in _model_traces(workload):
+            self._processor._tracker.track(trace)
+        self._services = [
+            service
+            for service in self._processor._tracker.service_data
+            if len(self._processor._tracker.get_latencies(service))
+        ]
+        return self._rounds * len(self._services)
+
+    async def run(self) -> None:
+        tracker = self._processor._tracker
+        for _ in range(self._rounds):
+            for service in self._services:
+                self._processor._hybrid_detection(service, tracker.get_latencies(service))
+
+    async def teardown(self) -> None:
+        await self._processor.close()
+
+
+class ConfigLookups(Benchmark):
+    """ConfigManager lookups of every configured resource, repeated ``rounds`` times"""
+
+    name = "config_lookups"
+    unit = "lookups"
+    uses_workload = False
+
+    def __init__(self, rounds: int = 1000):
+        self._rounds = rounds
+
+    async def setup(self, workload: Workload) -> int:
+        self._config = ConfigManager(CONFIG_DIR)
+        self._resources = self._config.get_all_resources()
+        return 3 * self._rounds * len(self._resources)
+
+    async def run(self) -> None:
+        config = self._config
+        for _ in range(self._rounds):
+            for resource in self._resources:
+                config.get_latency_threshold(resource)
+                config.get_target_deployment(resource)
+                config.get_resource_config(resource)
+
+
+BENCHMARKS = [
+    SamplerExport,
+    lambda: SamplerExport(batch_scoring=True),
+    SamplerFeaturize,
+    SamplerScoreOne,
+    ExtractSpans,
+    ParseSpans,
+    TraceBuild,
+    TrackerTrack,
+    HybridDetection,
+    ConfigLookups,
+]
+
+
+async def measure(benchmark: Benchmark, workload: Workload, repeat: int) -> Optional[dict]:
+    """Times ``repeat`` runs after a warm up run
+
+    Returns:
+        Optional[dict]: best and median run time and the median rate, None for an empty workload
+    """
+    units = await benchmark.setup(workload)
+    try:
+        if not units:
+            return None
+        await benchmark.run()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await benchmark.run()
+            times.append(time.perf_counter() - start)
+    finally:
+        await benchmark.teardown()
+
+    median = statistics.median(times)
+    return {
+        "unit": benchmark.unit,
+        "units": units,
+        "best_s": min(times),
+        "median_s": median,
+        "rate": units / median,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints every result next to its baseline
+
+    Returns:
+        list[str]: the benchmarks whose rate dropped by more than the tolerance
+    """
+    regressions = []
+    print(f"{'benchmark':<72} {'rate':>20} {'baseline':>12} {'change':>8}")
+    for key, result in results.items():
+        rate = f"{result['rate']:,.0f} {result['unit']}/s"
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"{key:<72} {rate:>20} {'-':>12} {'new':>8}")
+            continue
+        change = result["rate"] / previous["rate"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<72} {rate:>20} {previous['rate']:>12,.0f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="", help="Run only the benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=15, help="Timed runs per benchmark, the median counts")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Rate drop from the baseline, as a fraction, beyond which a benchmark regressed",
+    )
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="Baseline results file, local to this machine"
+    )
+    parser.add_argument(
+        "--save_baseline", action="store_true", help="Store these results as the new baseline"
+    )
+    parser.add_argument("--synthetic_traces", type=int, default=500)
+    parser.add_argument("--spans_per_trace", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--dataset", default=DEFAULT_DATASET, help="Recorded dataset, empty to skip the recorded workload"
+    )
+    parser.add_argument("--dataset_limit", type=int, default=0, help="Use only the first N recorded requests")
+    parser.add_argument("--output", default="", help="Write the results as JSON to this file")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = get_args()
+    workloads = [synthetic_workload(args.synthetic_traces, args.spans_per_trace, args.seed)]
+    if args.dataset:
+        workloads.append(recorded_workload(args.dataset, args.dataset_limit))
+
+    results = {}
+    for factory in BENCHMARKS:
+        for workload in workloads:
+            benchmark = factory()
+            if args.only not in benchmark.name:
+                continue
+            if not benchmark.uses_workload and workload is not workloads[0]:
+                continue
+            logger.info("Running %s on the %s workload", benchmark.name, workload.name)
+            result = await measure(benchmark, workload, args.repeat)
+            if result is not None:
+                key = f"{benchmark.name}[{workload.key}]" if benchmark.uses_workload else benchmark.name
+                results[key] = result
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            stored = json.load(file)
+        baseline = stored["results"]
+        if stored.get("machine") != platform.machine() or stored.get("python") != platform.python_version():
+            logger.warning(
+                "Baseline recorded with Python %s on %s, rates may not be comparable",
+                stored.get("python"),
+                stored.get("machine"),
+            )
+    elif not args.save_baseline:
+        logger.info("No baseline at %s, record one with --save_baseline", args.baseline)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.save_baseline:
+        # keep the baseline of benchmarks that were not run this time
+        with open(args.baseline, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": {**baseline, **results},
+                },
+                file,
+                indent=2,
+                sort_keys=True,
+            )
+        logger.info("Saved the baseline to %s", args.baseline)
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.CRITICAL)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+    logger.propagate = False
+    sys.exit(asyncio.run(main()))
@@ -8,7 +8,6 @@ from opentelemetry.proto.collector.trace.v1 import (
 )
 from modeler.src.models import Trace
 import asyncio
-import aiohttp
 from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
 from mock import MagicMock
 import pathlib
@@ -33,14 +32,13 @@ async def main():
     config_path = os.path.join(TESTS_DIR , "configs", "otel-demo", "config.yaml")
     processor = TraceProcessor("", ConfigManager(config_path), MagicMock())
 
-    client = TempoClient("http://localhost:32000")
-    tcp_connection = aiohttp.TCPConnector(limit=20)
-    async with aiohttp.ClientSession(connector=tcp_connection) as session:
+    async with TempoClient("http://localhost:32000") as client:
         query = '{.service.name != "otelgen"} && {trace:rootService != ""}'
         # query = '{name = "microservices"}'
         # query = '{name = "mobile_web"}'
-        trace_ids = await client.search(session, (24*60*60), 200, query)
-        traces_datas: list[TracesData] = [await client.find_trace_by_id(session, t_id) for t_id in trace_ids]
+        trace_ids = await client.search((24*60*60), 200, query)
+        traces_datas: list[TracesData] = [await client.find_trace_by_id(t_id) for t_id in trace_ids]
+        traces_datas = [td for td in traces_datas if td is not None]
         start = time.time()
         for i in range(ITERATIONS):
             for td in traces_datas:
@@ -0,0 +1,430 @@
+"""Replays recorded span datasets through the sampler or the modeler, in-process
+
+Recorded spans are turned back into the OTLP messages the services receive:
+ExportTraceServiceRequests for TraceSampler.Export, and one TracesData per trace
+for Trace.from_proto and TraceProcessor.analyze_trace. No Tempo, collector or
+cluster is needed, so throughput numbers are reproducible.
+
+Supported datasets:
+- span CSVs as written by Trace.to_df (tests/data/spans/spans_11_7.csv.bz2)
+- span CSVs in the TRACE_DF_COLUMNS layout (tests/data/spans/spans_tracemesh_style_11_11.csv.bz2)
+- tlm debug logs of the full export requests (tests/data/logs/full_request.log.bz2)
+
+Pacing follows the recorded timestamps: --speed 1 replays in real time, --speed N
+N times faster, and --speed 0 as fast as possible.
+
+    python -m experiments.replay --target sampler --speed 0
+    python -m experiments.replay --target modeler --dataset ../../tests/data/logs/full_request.log.bz2 --speed 10
+"""
+import argparse
+import ast
+import asyncio
+import bz2
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+from typing import Iterable, Iterator, NamedTuple, Optional
+from unittest.mock import MagicMock
+
+import pandas as pd
+from google.protobuf.json_format import ParseDict
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, InstrumentationScope, KeyValue
+from opentelemetry.proto.resource.v1.resource_pb2 import Resource
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, Span, TracesData
+
+FILE_PATH = pathlib.Path(__file__).parent.resolve()
+SCALE_DIR = os.path.join(FILE_PATH, "..")
+TESTS_DIR = os.path.join(FILE_PATH, "..", "..", "..", "tests")
+DEFAULT_DATASET = os.path.join(TESTS_DIR, "data", "spans", "spans_11_7.csv.bz2")
+DEFAULT_CONFIG = os.path.join(TESTS_DIR, "configs", "otel-demo")
+sys.path.append(os.path.join(SCALE_DIR, "modeler", "src"))
+sys.path.append(os.path.join(SCALE_DIR, "orchestration", "src"))
+sys.path.append(os.path.join(SCALE_DIR, "sampler", "src"))
+# the generated grpc stubs import sampler.v1, which must not resolve to the sampler service package
+sys.path.insert(0, os.path.join(SCALE_DIR, "generated"))
+
+from common.trace_buffer import TraceBuffer
+from common.trace_util import extract_spans
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LOG_MARKER = "Full Trace request: "
+# rows read from a span CSV at a time
+CSV_CHUNK_ROWS = 10000
+
+
+class ReplayEvent(NamedTuple):
+    """A recorded message and the time it was complete, in unix nanoseconds"""
+
+    time_ns: int
+    spans: int
+    message: object
+
+
+def _end_time(resource_spans_list) -> int:
+    return max(
+        span.end_time_unix_nano
+        for resource_spans in resource_spans_list
+        for scope_spans in resource_spans.scope_spans
+        for span in scope_spans.spans
+    )
+
+
+def _span_count(resource_spans_list) -> int:
+    return sum(
+        len(scope_spans.spans)
+        for resource_spans in resource_spans_list
+        for scope_spans in resource_spans.scope_spans
+    )
+
+
+def _group_resource_spans(spans: list[tuple[str, str, str, Span]]) -> list[ResourceSpans]:
+    """Groups (service, scope name, scope version, span) under one ResourceSpans per service"""
+    services: dict[str, dict[tuple[str, str], list[Span]]] = {}
+    for service, scope_name, scope_version, span in spans:
+        services.setdefault(service, {}).setdefault((scope_name, scope_version), []).append(span)
+    return [
+        ResourceSpans(
+            resource=Resource(
+                attributes=[KeyValue(key="service.name", value=AnyValue(string_value=service))]
+            ),
+            scope_spans=[
+                ScopeSpans(
+                    scope=InstrumentationScope(name=scope_name, version=scope_version),
+                    spans=scope_spans,
+                )
+                for (scope_name, scope_version), scope_spans in scopes.items()
+            ],
+        )
+        for service, scopes in services.items()
+    ]
+
+
+def _literal(value):
+    # attribute, event and status columns hold the repr of MessageToDict output
+    return ast.literal_eval(value) if isinstance(value, str) else value
+
+
+def _spans_from_model_csv(df: pd.DataFrame):
+    """Spans of a chunk of a CSV written by Trace.to_df, where ids are base64 as in MessageToDict"""
+    fields = [
+        "trace_id", "span_id", "parent_span_id", "name", "kind",
+        "start_time_unix_nano", "end_time_unix_nano", "attributes", "events", "status",
+    ]
+    fields = [field for field in fields if field in df.columns]
+    for row in df.to_dict("records"):
+        span_dict = {}
+        for field in fields:
+            value = row[field]
+            if isinstance(value, float) and pd.isna(value):
+                continue
+            if field in ("attributes", "events", "status"):
+                value = _literal(value)
+            elif field.endswith("unix_nano"):
+                value = str(int(value))
+            span_dict[field] = value
+        yield (
+            row["trace_id"],
+            row.get("service_name") or "unknown_service",
+            row.get("scope_name") if isinstance(row.get("scope_name"), str) else "",
+            row.get("scope_version") if isinstance(row.get("scope_version"), str) else "",
+            ParseDict(span_dict, Span()),
+        )
+
+
+def _spans_from_trace_df_csv(df: pd.DataFrame):
+    """Spans of a chunk of a CSV in the TRACE_DF_COLUMNS layout, with hex ids and durations in ms"""
+    has_service = "ServiceName" in df.columns
+    for row in df.to_dict("records"):
+        start = int(row["StartTimeUnixNano"])
+        parent = row["ParentID"]
+        span = Span(
+            trace_id=bytes.fromhex(row["TraceID"].rjust(32, "0")),
+            span_id=bytes.fromhex(row["SpanID"]),
+            parent_span_id=b"" if parent == "root" else bytes.fromhex(parent),
+            name=row["OperationName"],
+            start_time_unix_nano=start,
+            end_time_unix_nano=start + int(row["Duration"] * 1e6),
+        )
+        service = row["ServiceName"] if has_service else "unknown_service"
+        yield row["TraceID"], service, "", "", span
+
+
+def load_spans_csv(path: str) -> Iterator[ReplayEvent]:
+    """One export request per trace, complete at the end of its last span
+
+    The CSV is read in chunks, and a request is yielded as soon as the rows of its
+    trace end. Both recorded layouts keep the spans of a trace together, a trace
+    whose rows are not contiguous is exported in several requests.
+    """
+    chunks = iter(pd.read_csv(path, chunksize=CSV_CHUNK_ROWS))
+    first = next(chunks, None)
+    if first is None:
+        return
+    spans_from_csv = _spans_from_model_csv if "trace_id" in first.columns else _spans_from_trace_df_csv
+    rows = itertools.chain.from_iterable(
+        spans_from_csv(chunk) for chunk in itertools.chain([first], chunks)
+    )
+
+    for _, trace_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        spans = [
+            (service, scope_name, scope_version, span)
+            for _, service, scope_name, scope_version, span in trace_rows
+        ]
+        request = ExportTraceServiceRequest(resource_spans=_group_resource_spans(spans))
+        yield ReplayEvent(_end_time(request.resource_spans), len(spans), request)
+
+
+def load_request_log(path: str) -> Iterator[ReplayEvent]:
+    """The export requests logged by the tlm TraceService at debug level, as they were received"""
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rt") as file:
+        for line in file:
+            marker = line.find(REQUEST_LOG_MARKER)
+            if marker < 0:
+                continue
+            request = ParseDict(
+                ast.literal_eval(line[marker + len(REQUEST_LOG_MARKER):]),
+                ExportTraceServiceRequest(),
+            )
+            if not _span_count(request.resource_spans):
+                continue
+            yield ReplayEvent(
+                _end_time(request.resource_spans), _span_count(request.resource_spans), request
+            )
+
+
+def load_dataset(path: str, limit: int = 0) -> list[ReplayEvent]:
+    """Export requests of a recorded dataset, oldest first
+
+    Args:
+        path (str): span CSV or request log
+        limit (int, optional): read only the first ``limit`` requests of the file, 0 for all. Defaults to 0.
+    """
+    if ".log" in os.path.basename(path):
+        events: Iterable[ReplayEvent] = load_request_log(path)
+    else:
+        events = load_spans_csv(path)
+    if limit:
+        events = itertools.islice(events, limit)
+    return sorted(events, key=lambda event: event.time_ns)
+
+
+def assemble_traces(events: list[ReplayEvent]) -> list[ReplayEvent]:
+    """One TracesData per trace, from spans that may be spread over several requests"""
+    buffer = TraceBuffer(linger=0, max_spans=sys.maxsize)
+    for event in events:
+        for resource_spans in event.message.resource_spans:
+            for scope_spans in resource_spans.scope_spans:
+                for span in scope_spans.spans:
+                    buffer.add_span(resource_spans, scope_spans, span, now=0)
+    traces = []
+    for buffered in buffer.pop_all():
+        traces_data = buffered.to_traces_data()
+        traces.append(
+            ReplayEvent(_end_time(traces_data.resource_spans), len(buffered.spans), traces_data)
+        )
+    traces.sort(key=lambda event: event.time_ns)
+    return traces
+
+
+class Pacer:
+    """Waits until each event is due, ``speed`` times faster than it was recorded
+
+    With a speed of 0 or less events are never delayed. Events that are already
+    late when their turn comes are counted, with how far behind schedule they were.
+    """
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self._origin: Optional[tuple[float, int]] = None
+        self.late = 0
+        self.max_lag = 0.0
+
+    async def wait(self, time_ns: int) -> None:
+        if self.speed <= 0:
+            return
+        now = time.perf_counter()
+        if self._origin is None:
+            self._origin = (now, time_ns)
+        due = self._origin[0] + (time_ns - self._origin[1]) / 1e9 / self.speed
+        if due > now:
+            await asyncio.sleep(due - now)
+        elif now - due > 0.001:
+            self.late += 1
+            self.max_lag = max(self.max_lag, now - due)
+
+
+def _summary(target: str, events: list[ReplayEvent], elapsed: float, pacer: Pacer) -> dict:
+    spans = sum(event.spans for event in events)
+    return {
+        "target": target,
+        "events": len(events),
+        "spans": spans,
+        "elapsed_s": elapsed,
+        "events_per_s": len(events) / elapsed if elapsed else 0.0,
+        "spans_per_s": spans / elapsed if elapsed else 0.0,
+        "speed": pacer.speed,
+        "late_events": pacer.late,
+        "max_lag_s": pacer.max_lag,
+    }
+
+
+def load_sampler_config(argv: list[str]):
+    """Sampler configuration from its command line flags, defaults for the rest"""
+    spec = importlib.util.spec_from_file_location(
+        "sampler_main", os.path.join(SCALE_DIR, "sampler", "src", "main.py")
+    )
+    sampler_main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sampler_main)
+    return sampler_main.get_config(argv)
+
+
+def train_sampler(trace_sampler, events: list[ReplayEvent]) -> int:
+    """Trains the sampler offline on recorded requests, the same way train() does on Tempo spans"""
+    rows = list(
+        extract_spans(
+            resource_spans for event in events for resource_spans in event.message.resource_spans
+        )
+    )
+    spans = pd.DataFrame(rows, columns=["TraceID", "SpanID", "ParentID", "ServiceName", "OperationName", "StartTimeUnixNano", "Duration"])
+    root_spans = spans[spans.ParentID == "root"]
+    spans = spans[spans.TraceID.isin(root_spans.TraceID)]
+    return trace_sampler.learn_many(spans.ServiceName, spans.OperationName, spans.Duration)
+
+
+async def replay_sampler(
+    events: list[ReplayEvent],
+    speed: float,
+    train_fraction: float = 0.2,
+    sampler_args: Optional[list[str]] = None,
+) -> dict:
+    """Trains a TraceSampler on the first part of the events and exports the rest to it"""
+    from trace_handler import TraceSampler
+
+    # trained offline below, so nothing is skipped while the replay warms up unless asked to
+    trace_sampler = TraceSampler(load_sampler_config(["--skip_span_count=0"] + (sampler_args or [])))
+    train_count = int(len(events) * train_fraction)
+    learned = train_sampler(trace_sampler, events[:train_count])
+    events = events[train_count:]
+    trace_sampler.start_scoring_pool()
+
+    sampled = trace_sampler.subscribe_traces_data("replay")
+    sampled_ids = trace_sampler.subscribe_trace_ids("replay")
+    pacer = Pacer(speed)
+    try:
+        start = time.perf_counter()
+        for event in events:
+            await pacer.wait(event.time_ns)
+            await trace_sampler.Export(event.message, None)
+        # publish the traces still lingering
+        await trace_sampler.flush_trace_buffer()
+        elapsed = time.perf_counter() - start
+    finally:
+        await trace_sampler.close()
+
+    summary = _summary("sampler", events, elapsed, pacer)
+    summary.update(
+        {
+            "trained_spans": learned,
+            "sampled_messages": sampled.published,
+            "sampled_trace_ids": sampled_ids.published,
+        }
+    )
+    return summary
+
+
+async def replay_modeler(
+    events: list[ReplayEvent], speed: float, config_path: str = DEFAULT_CONFIG
+) -> dict:
+    """Parses, tracks and analyzes every recorded trace as the modeler does after fetching it"""
+    from config.config_manager import ConfigManager
+    from models import Trace
+    from trace_processor import TraceProcessor
+
+    traces = assemble_traces(events)
+    processor = TraceProcessor("", ConfigManager(config_path), MagicMock())
+    pacer = Pacer(speed)
+    dropped = 0
+    try:
+        start = time.perf_counter()
+        for event in traces:
+            await pacer.wait(event.time_ns)
+            try:
+                trace = Trace.from_proto(trace_data=event.message)
+            except ValueError:
+                # no root span, the modeler drops the trace
+                dropped += 1
+                continue
+            processor.analyze_trace(trace)
+        elapsed = time.perf_counter() - start
+    finally:
+        await processor.close()
+
+    summary = _summary("modeler", traces, elapsed, pacer)
+    summary["dropped_traces"] = dropped
+    return summary
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="Recorded span CSV or request log")
+    parser.add_argument("--target", choices=("sampler", "modeler"), default="sampler")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="Replay speed relative to the recording, 1 for real time, 0 for as fast as possible",
+    )
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N requests of the dataset, 0 for all")
+    parser.add_argument(
+        "--train_fraction",
+        type=float,
+        default=0.2,
+        help="Fraction of the requests the sampler is trained on before the replay",
+    )
+    parser.add_argument(
+        "--sampler_arg",
+        action="append",
+        default=[],
+        dest="sampler_args",
+        help="Sampler command line flag, e.g. --sampler_arg=--batch_scoring, may be repeated",
+    )
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Directory of the modeler configuration specs")
+    parser.add_argument("--output", default="", help="Write the summary as JSON to this file")
+    return parser.parse_args()
+
+
+async def main():
+    args = get_args()
+    load_start = time.perf_counter()
+    events = load_dataset(args.dataset, args.limit)
+    logger.info(
+        "Loaded %d requests from %s in %.1fs",
+        len(events),
+        args.dataset,
+        time.perf_counter() - load_start,
+    )
+
+    if args.target == "sampler":
+        summary = await replay_sampler(events, args.speed, args.train_fraction, args.sampler_args)
+    else:
+        summary = await replay_modeler(events, args.speed, args.config)
+    summary["dataset"] = os.path.basename(args.dataset)
+
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    asyncio.run(main())
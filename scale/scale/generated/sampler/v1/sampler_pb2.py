@@ -15,19 +15,21 @@ _sym_db = _symbol_database.Default()
 from opentelemetry.proto.trace.v1 import trace_pb2 as opentelemetry_dot_proto_dot_trace_dot_v1_dot_trace__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x18sampler/v1/sampler.proto\x12\rscale.sampler\x1a(opentelemetry/proto/trace/v1/trace.proto\"\x15\n\x13SampleTracesRequest\"\x19\n\x17SampleTracesDataRequest\"(\n\x14SampleTracesResponse\x12\x10\n\x08trace_id\x18\x01 \x01(\t2\xd5\x01\n\x0cTraceSampler\x12[\n\x0cSampleTraces\x12\".scale.sampler.SampleTracesRequest\x1a#.scale.sampler.SampleTracesResponse\"\x00\x30\x01\x12h\n\x10SampleTracesData\x12&.scale.sampler.SampleTracesDataRequest\x1a(.opentelemetry.proto.trace.v1.TracesData\"\x00\x30\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x18sampler/v1/sampler.proto\x12\rscale.sampler\x1a(opentelemetry/proto/trace/v1/trace.proto\"k\n\x13SampleTracesRequest\x12\x13\n\x0bshard_index\x18\x01 \x01(\r\x12\x13\n\x0bshard_count\x18\x02 \x01(\r\x12*\n\tshard_key\x18\x03 \x01(\x0e\x32\x17.scale.sampler.ShardKey\"o\n\x17SampleTracesDataRequest\x12\x13\n\x0bshard_index\x18\x01 \x01(\r\x12\x13\n\x0bshard_count\x18\x02 \x01(\r\x12*\n\tshard_key\x18\x03 \x01(\x0e\x32\x17.scale.sampler.ShardKey\"(\n\x14SampleTracesResponse\x12\x10\n\x08trace_id\x18\x01 \x01(\t*>\n\x08ShardKey\x12\x16\n\x12SHARD_KEY_TRACE_ID\x10\x00\x12\x1a\n\x16SHARD_KEY_ROOT_SERVICE\x10\x01\x32\xd5\x01\n\x0cTraceSampler\x12[\n\x0cSampleTraces\x12\".scale.sampler.SampleTracesRequest\x1a#.scale.sampler.SampleTracesResponse\"\x00\x30\x01\x12h\n\x10SampleTracesData\x12&.scale.sampler.SampleTracesDataRequest\x1a(.opentelemetry.proto.trace.v1.TracesData\"\x00\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'sampler.v1.sampler_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
+  _globals['_SHARDKEY']._serialized_start=349
+  _globals['_SHARDKEY']._serialized_end=411
   _globals['_SAMPLETRACESREQUEST']._serialized_start=85
-  _globals['_SAMPLETRACESREQUEST']._serialized_end=106
-  _globals['_SAMPLETRACESDATAREQUEST']._serialized_start=108
-  _globals['_SAMPLETRACESDATAREQUEST']._serialized_end=133
-  _globals['_SAMPLETRACESRESPONSE']._serialized_start=135
-  _globals['_SAMPLETRACESRESPONSE']._serialized_end=175
-  _globals['_TRACESAMPLER']._serialized_start=178
-  _globals['_TRACESAMPLER']._serialized_end=391
+  _globals['_SAMPLETRACESREQUEST']._serialized_end=192
+  _globals['_SAMPLETRACESDATAREQUEST']._serialized_start=194
+  _globals['_SAMPLETRACESDATAREQUEST']._serialized_end=305
+  _globals['_SAMPLETRACESRESPONSE']._serialized_start=307
+  _globals['_SAMPLETRACESRESPONSE']._serialized_end=347
+  _globals['_TRACESAMPLER']._serialized_start=414
+  _globals['_TRACESAMPLER']._serialized_end=627
 # @@protoc_insertion_point(module_scope)
@@ -1,17 +1,37 @@
 from opentelemetry.proto.trace.v1 import trace_pb2 as _trace_pb2
+from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from typing import ClassVar as _ClassVar, Optional as _Optional
+from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
-class SampleTracesRequest(_message.Message):
+class ShardKey(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
     __slots__ = ()
-    def __init__(self) -> None: ...
+    SHARD_KEY_TRACE_ID: _ClassVar[ShardKey]
+    SHARD_KEY_ROOT_SERVICE: _ClassVar[ShardKey]
+SHARD_KEY_TRACE_ID: ShardKey
+SHARD_KEY_ROOT_SERVICE: ShardKey
+
+class SampleTracesRequest(_message.Message):
+    __slots__ = ("shard_index", "shard_count", "shard_key")
+    SHARD_INDEX_FIELD_NUMBER: _ClassVar[int]
+    SHARD_COUNT_FIELD_NUMBER: _ClassVar[int]
+    SHARD_KEY_FIELD_NUMBER: _ClassVar[int]
+    shard_index: int
+    shard_count: int
+    shard_key: ShardKey
+    def __init__(self, shard_index: _Optional[int] = ..., shard_count: _Optional[int] = ..., shard_key: _Optional[_Union[ShardKey, str]] = ...) -> None: ...
 
 class SampleTracesDataRequest(_message.Message):
-    __slots__ = ()
-    def __init__(self) -> None: ...
+    __slots__ = ("shard_index", "shard_count", "shard_key")
+    SHARD_INDEX_FIELD_NUMBER: _ClassVar[int]
+    SHARD_COUNT_FIELD_NUMBER: _ClassVar[int]
+    SHARD_KEY_FIELD_NUMBER: _ClassVar[int]
+    shard_index: int
+    shard_count: int
+    shard_key: ShardKey
+    def __init__(self, shard_index: _Optional[int] = ..., shard_count: _Optional[int] = ..., shard_key: _Optional[_Union[ShardKey, str]] = ...) -> None: ...
 
 class SampleTracesResponse(_message.Message):
     __slots__ = ("trace_id",)
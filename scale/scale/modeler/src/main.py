@@ -15,6 +15,19 @@ async def main():
     client_url = os.getenv("TRACE_BACKEND_URL", "http://tempo:3200")
     config_path = os.getenv("CONFIG_SPEC_PATH", "/app/config/specs")
     target_namespace = os.getenv("TARGET_NAMESPACE", "default")
+    trace_linger = float(os.getenv("TRACE_LINGER_SECONDS", "5"))
+    max_buffered_spans = int(os.getenv("TRACE_BUFFER_MAX_SPANS", "100000"))
+    tempo_connections = int(os.getenv("TEMPO_CONNECTIONS", "20"))
+    tempo_timeout = float(os.getenv("TEMPO_TIMEOUT_SECONDS", "30"))
+    fetch_workers = int(os.getenv("TRACE_FETCH_WORKERS", "20"))
+    max_in_flight = int(os.getenv("TRACE_MAX_IN_FLIGHT", "200"))
+    analysis_mode = os.getenv("MODELER_ANALYSIS_MODE", "batch")
+    decision_interval = float(os.getenv("MODELER_DECISION_INTERVAL", "0"))
+    cache_entries = int(os.getenv("TRACE_CACHE_ENTRIES", "1000"))
+    cache_bytes = int(os.getenv("TRACE_CACHE_BYTES", str(64 * 1024 * 1024)))
+    cache_ttl = float(os.getenv("TRACE_CACHE_TTL_SECONDS", "300"))
+    cache_negative_ttl = float(os.getenv("TRACE_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+    cache_partial_ttl = float(os.getenv("TRACE_CACHE_PARTIAL_TTL_SECONDS", "5"))
 
     orchestrator = KubernetesClient(namespace=target_namespace, in_cluster=True)
     config = ConfigManager(config_path)
@@ -28,12 +41,30 @@ async def main():
     observer_thread.start()
     
     try: 
-        processor = TraceProcessor(client_url=client_url, config=config, orchestrator=orchestrator)
+        processor = TraceProcessor(
+            client_url=client_url, 
+            config=config, 
+            orchestrator=orchestrator, 
+            trace_linger=trace_linger, 
+            max_buffered_spans=max_buffered_spans,
+            tempo_connections=tempo_connections,
+            tempo_timeout=tempo_timeout,
+            fetch_workers=fetch_workers,
+            max_in_flight=max_in_flight,
+            analysis_mode=analysis_mode,
+            decision_interval=decision_interval,
+            cache_entries=cache_entries,
+            cache_bytes=cache_bytes,
+            cache_ttl=cache_ttl,
+            cache_negative_ttl=cache_negative_ttl,
+            cache_partial_ttl=cache_partial_ttl,
+        )
         async with TraceConsumer(processor) as consumer:
             await consumer.consume()
     finally:
         observer.stop()
         observer.join()
+        await processor.close()
         processor.stop_metrics_reporting()        
 
 
@@ -1,56 +1,126 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import pandas as pd
 import numpy as np
+import bisect
 from tabulate import tabulate
 from collections import deque, defaultdict
-from datetime import datetime
+import time
 
 import logging
 from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+from opentelemetry.proto.trace.v1 import trace_pb2
 from google.protobuf.json_format import MessageToDict
 
 
-class Node:
+def ewma(
+        values, 
+        span: int,
+) -> np.ndarray:
     """
-    A class used to represent a Node in a tree structure.
-
-    Attributes
-    ----------
-    id : any, optional
-        The identifier for the node (default is None)
-    children : list
-        A list to store the children nodes of the current node
-
-    Methods
-    -------
-    add_child(child)
-        Adds a child node to the current node's children list.
-    get_children()
-        Returns the list of children nodes.
+    Exponentially weighted moving average of values.
+
+    Numerically equivalent to pd.Series(values).ewm(span=span, adjust=False).mean(),
+    without building pandas objects, which dominate the cost for small windows:
+        ewma[0] = values[0]
+        ewma[t] = (1 - alpha) * ewma[t - 1] + alpha * values[t], where alpha = 2 / (span + 1)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty_like(values)
+    if len(values) == 0:
+        return result
+
+    alpha = 2 / (span + 1)
+    decay = 1 - alpha
+    # recurse over python floats, indexing numpy scalars one by one is several times slower
+    current = None
+    for i, value in enumerate(values.tolist()):
+        current = value if current is None else decay * current + alpha * value
+        result[i] = current
+    return result
+
+
+def hybrid_detection(
+        latencies, 
+        p75: float,
+        span_threshold: int=None, 
+        cusum_threshold: float=None, 
+        ewma_multiplier: float=1.5,
+) -> Tuple[int, float, float, float, int, float, bool, bool]:
+    """
+    Hybrid detection method using EWMA for immediate responsiveness and CUSUM for sustained shifts.
+    Determines if a service should scale up or down based on its latency window.
+
+    Args:
+        latencies: latency window of the service, oldest first
+        p75 (float): p75 latency of the service, the value compared with the bounds
+        span_threshold (int, optional): EWMA span. Defaults to a third of the window.
+        cusum_threshold (float, optional): Defaults to 1.5 times the std of the last span samples.
+        ewma_multiplier (float, optional): width of the bounds in stds. Defaults to 1.5.
+
+    Returns:
+        Tuple[int, float, float, float, int, float, bool, bool]: A tuple containing:
+            - int: Action indicator (0 = no action, 1 = scale up, -1 = scale down)
+            - float: Upper bound (in milliseconds)
+            - float: Lower bound (in milliseconds)
+            - float: Value triggering the action (either latency or CUSUM)
+            - int: Span size
+            - float: cusum threshold -x to x
+            - bool: Triggered by EMA (True if due to EMA bounds, False otherwise)
+            - bool: Triggered by CUSUM (True if due to CUSUM threshold, False otherwise)
     """
-    def __init__(self, id=None):
-        self.id = id 
-        self.children = []
+    # Set default span to one-third of queue length if not specified
+    if span_threshold is None:
+        span_threshold = max(1, len(latencies) // 3)  # Set span to one-third of current queue length, minimum 1
+
+    if cusum_threshold is None:
+        cusum_threshold = 1.5 * np.std(latencies[-span_threshold:])
+        
+    if len(latencies) < span_threshold:
+        logging.warning("Not enough data to perform hybrid detection.")
+        return 0, float('inf'), float('-inf'), float('nan'), span_threshold, cusum_threshold, False, False  # No action, with placeholder bounds
+
+    # Full EWMA series and p75 of EWMA values
+    ema_series = ewma(latencies, span_threshold)
+    ema_p75 = np.percentile(ema_series, 75)
+
+    # Bounds using p75 of EWMA as the center point
+    upper_bound = ema_p75 + ewma_multiplier * np.std(latencies[-span_threshold:])
+    lower_bound = max(1, ema_p75 - ewma_multiplier * np.std(latencies[-span_threshold:]))  # Constrain lower_bound to non-negative values
 
-    def add_child(self, child):
-        self.children.append(child)
+    value = p75  # Using p75 latency
 
-    def get_children(self):
-        return self.children
+    # CUSUM for sustained trend detection
+    cusum = np.cumsum(np.array(latencies) - ema_p75)
 
-        logging.debug(f"Node created: {self.id}")
 
-class Span(Node):
+    if value > upper_bound:# or cusum[-1] > cusum_threshold:
+        return 1, upper_bound, lower_bound, value if value > upper_bound else cusum[-1], span_threshold, cusum_threshold, value > upper_bound, cusum[-1] > cusum_threshold  # Scale up
+    elif value < lower_bound:# or cusum[-1] < -cusum_threshold:
+        return -1, upper_bound, lower_bound, value if value < lower_bound else cusum[-1], span_threshold, cusum_threshold,  value < lower_bound, cusum[-1] < -cusum_threshold  # Scale down
+    return 0, upper_bound, lower_bound, value, span_threshold, cusum_threshold, False, False  # No action
+
+
+def hex_id(value) -> str:
     """
-    Span class represents a span node with various attributes.
+    Hex form of a trace or span id, as Tempo uses it. 
+    Ids read from protobuf are bytes, ids given as strings are returned unchanged.
+    """
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+class Span:
+    """
+    Span class represents a span with various attributes.
 
     For reference, the Span data structure is as follows:
-    trace_id: str
-    span_id: str
-    parent_span_id: str or None
+    trace_id: bytes or str
+    span_id: bytes or str
+    parent_span_id: bytes, str or None
     name: str
-    kind: str
+    kind: int or str
     start_time_unix_nano: int
     end_time_unix_nano: int
     attributes: List[Dict]
@@ -60,6 +130,12 @@ class Span(Node):
     scope_name: str
     scope_version: str
 
+    The fields the modeler reads (ids, parent, name, kind, service, start/end and duration)
+    are kept in __slots__. Resource attributes and scope fields are read from a dictionary
+    shared by the spans of a scope, any other field from a per-span dictionary only created
+    when needed. Spans built with from_proto keep a reference to their protobuf span, decoding
+    attributes, events, links and status from it only on first access.
+
     attributes is a list of dictionaries that, when converted to a dataframe, can be flattened into separate columns.
     This is the basic structure of the dataframe created with the to_df method.
     trace_id | span_id | parent_span_id | name| kind | start_time_unix_nano | end_time_unix_nano | attributes | status | flags | service_name | scope_name  | scope_version |
@@ -77,6 +153,8 @@ class Span(Node):
             Returns a human-readable string representation of the Span instance, including all attributes.
         from_dict(cls, data):
             Class method to create a Span instance from a dictionary.
+        from_proto(cls, span, resource_attributes, scope_name, scope_version):
+            Class method to create a Span instance directly from a protobuf span.
         to_dict(self):
             Converts the Span instance to a dictionary.
         extract_from_dict(self, data: Dict={}, keys: List=[]):
@@ -84,33 +162,104 @@ class Span(Node):
         to_df(self, flatten=False):
             Convert the Span instance to a Pandas DataFrame.
     """
-    def __init__(self, **data):
-        # Initialize all data from the dictionary
-        super().__init__()
+    FIELDS = (
+        'trace_id', 'span_id', 'parent_span_id', 'name', 'kind', 'service_name',
+        'start_time_unix_nano', 'end_time_unix_nano', 'duration_ms',
+    )
+    __slots__ = FIELDS + ('_context', '_extra', '_proto')
 
-        self.__dict__.update(data)
-        if 'parent_span_id' not in data:
-            self.parent_span_id = None
-        
+    # Fields from_proto leaves in the protobuf span until they are accessed
+    LAZY_FIELDS = ('attributes', 'events', 'links', 'status')
+
+    def __init__(self, **data):
         # Get span_id, defaulting to None if not provided
         if not data.get('span_id', None):
             raise ValueError("span_id is required")
-        
-        self.duration_ms = (int(self.end_time_unix_nano) - int(self.start_time_unix_nano)) / 1e6
-        
+
+        self.trace_id = data.pop('trace_id', None)
+        self.span_id = data.pop('span_id')
+        self.parent_span_id = data.pop('parent_span_id', None)
+        self.name = data.pop('name', None)
+        self.kind = data.pop('kind', None)
+        self.service_name = data.pop('service_name', None)
+        self.start_time_unix_nano = int(data.pop('start_time_unix_nano'))
+        self.end_time_unix_nano = int(data.pop('end_time_unix_nano'))
+        self.duration_ms = (self.end_time_unix_nano - self.start_time_unix_nano) / 1e6
+        data.pop('duration_ms', None)
+        self._context = None
+        self._extra = data or None
+        self._proto = None
+
+    def __getattr__(self, name):
+        # Only called for names without a slot: the span extras, the shared resource
+        # and scope fields, then the lazily decoded fields
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        if self._context is not None and name in self._context:
+            return self._context[name]
+        if name in self.LAZY_FIELDS:
+            value = self._decode(name)
+            self.__setattr__(name, value)
+            if self._proto is not None and all(field in self._extra for field in self.LAZY_FIELDS):
+                # everything is decoded, release the protobuf span
+                self._proto = None
+            return value
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
     def __setattr__(self, name, value):
-        # Allow setting all attributes
-        super().__setattr__(name, value)
+        # Allow setting all attributes, the ones without a slot go to the span extras
+        if name in Span.__slots__:
+            object.__setattr__(self, name, value)
+        elif self._extra is None:
+            self._extra = {name: value}
+        else:
+            self._extra[name] = value
+
+    @property
+    def trace_id_hex(self) -> str:
+        return hex_id(self.trace_id)
+
+    @property
+    def span_id_hex(self) -> str:
+        return hex_id(self.span_id)
+
+    @property
+    def parent_span_id_hex(self) -> str:
+        return hex_id(self.parent_span_id)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _decode(self, field):
+        # Spans built from a dictionary already hold every non-empty field
+        if self._proto is None:
+            return {} if field == 'status' else []
+        value = getattr(self._proto, field)
+        if field == 'status':
+            return MessageToDict(value, preserving_proto_field_name=True)
+        return [MessageToDict(item, preserving_proto_field_name=True) for item in value]
+
+    def _fields(self):
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        if self._context is not None:
+            fields.update(self._context)
+        if self._extra is not None:
+            fields.update(self._extra)
+        return fields
 
     def __repr__(self):
-        # Include all attributes from __dict__ in repr
-        attrs = ', '.join(f"{k}={repr(v)}" for k, v in self.__dict__.items())
+        # Include all fields decoded so far in repr
+        attrs = ', '.join(f"{k}={repr(v)}" for k, v in self._fields().items())
         return f"Span({attrs})"
 
     def __str__(self):
-        # Include all attributes from __dict__ in str
-        attrs = ', '.join(f"{k}={v}" for k, v in self.__dict__.items())
+        # Include all fields decoded so far in str
+        attrs = ', '.join(f"{k}={v}" for k, v in self._fields().items())
         return f"Span: {attrs}"
 
     @classmethod
@@ -126,6 +275,44 @@ class Span(Node):
         """
         return cls(**data)
 
+    @classmethod
+    def from_proto(cls, span: trace_pb2.Span, context: Dict = None):
+        """
+        Create an instance of the class directly from a protobuf span, without MessageToDict.
+
+        IDs are kept as raw bytes and timestamps as integer nanoseconds. Attributes, events, 
+        links and status are only decoded from the protobuf span, into the same dictionaries 
+        MessageToDict gives, when they are first accessed. Until all of them are, the span 
+        keeps a reference to the message, and with it to the TracesData it came from.
+
+        Args:
+            span (trace_pb2.Span): The protobuf span.
+            context (Dict, optional): Resource attributes with snake_case keys (e.g., service_name),
+                scope_name and scope_version. Shared, not copied, by the spans of the same scope.
+                Defaults to no context.
+
+        Returns:
+            An instance of the class holding the span fields.
+        """
+        if context is None:
+            context = {}
+        instance = cls.__new__(cls)
+        setattr_ = object.__setattr__
+        setattr_(instance, 'trace_id', span.trace_id)
+        setattr_(instance, 'span_id', span.span_id)
+        setattr_(instance, 'parent_span_id', span.parent_span_id or None)
+        setattr_(instance, 'name', span.name)
+        setattr_(instance, 'kind', span.kind)
+        setattr_(instance, 'service_name', context.get('service_name'))
+        start, end = span.start_time_unix_nano, span.end_time_unix_nano
+        setattr_(instance, 'start_time_unix_nano', start)
+        setattr_(instance, 'end_time_unix_nano', end)
+        setattr_(instance, 'duration_ms', (end - start) / 1e6)
+        setattr_(instance, '_context', context)
+        setattr_(instance, '_extra', {'flags': span.flags} if span.flags else None)
+        setattr_(instance, '_proto', span)
+        return instance
+
     def to_dict(self):
         """
         Converts the object's attributes to a dictionary.
@@ -133,7 +320,10 @@ class Span(Node):
         Returns:
             dict: A dictionary containing the object's attributes.
         """
-        return self.__dict__.copy()
+        for field in self.LAZY_FIELDS:
+            getattr(self, field)
+        # like MessageToDict, leave out fields that are empty
+        return {k: v for k, v in self._fields().items() if v or k not in self.LAZY_FIELDS}
 
     def extract_from_dict(self, data: Dict={}, keys: List=[]):
         """
@@ -162,8 +352,29 @@ class Span(Node):
         Returns:
             DataFrame: A DataFrame containing the Span instance data.
         """
+        df = pd.DataFrame([self.to_dict()])
+
+        if flatten:
+            df = Span.flatten_attributes(df)
+
+        return df
+
+    @staticmethod
+    def flatten_attributes(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Replaces the attributes column of a span DataFrame with one column per attribute key.
+
+        Args:
+            df (DataFrame): Span rows, as built by to_df.
+
+        Returns:
+            DataFrame: The rows with their attributes flattened into separate columns.
+        """
         def extract_attributes(attributes_list):
             attributes_dict = {}
+            # spans without attributes have none (NaN) when rows are built in bulk
+            if not isinstance(attributes_list, list):
+                return attributes_dict
             for attribute in attributes_list:
                 key = attribute['key']
                 # Handle different value types (string, int, etc. - probably more types in real data then we have here)
@@ -171,16 +382,8 @@ class Span(Node):
                 attributes_dict[key] = value
             return attributes_dict
 
-        df = pd.DataFrame([self.__dict__])
-
-        # drop 'id' and 'children' columns
-        df = df.drop(['id', 'children'], axis=1)
-
-        if flatten:
-            attributes_df = df['attributes'].apply(extract_attributes).apply(pd.Series)
-            df = pd.concat([df.drop('attributes', axis=1), attributes_df], axis=1)
-
-        return df
+        attributes_df = pd.DataFrame(df['attributes'].map(extract_attributes).tolist(), index=df.index)
+        return pd.concat([df.drop('attributes', axis=1), attributes_df], axis=1)
 
 
 class Trace:
@@ -200,6 +403,8 @@ class Trace:
         Initializes the Trace object with a trace_id and a list of spans.
     _build(spans: List[Span]) -> Span:
         Constructs the span tree and identifies the root span.
+    get_children(span_id):
+        Returns the IDs of the child spans of a span.
     to_df(flatten=False):
         Converts the spans to a pandas DataFrame.
     show_tree(root: Span = None, level=0):
@@ -211,6 +416,8 @@ class Trace:
     __str__():
         Returns a human-readable string representation of the Trace object.
     """
+    __slots__ = ('span_dict', '_children', '_root_span', 'trace_id', 'duration_ms')
+
     def __init__(self, trace_id=None, spans: List[Span] = []):
         """
         Initializes the model with a trace ID and a list of spans.
@@ -225,12 +432,21 @@ class Trace:
             root_span (Span): The root span built from the list of spans.
         """
         self.span_dict = {span.span_id: span for span in spans}
+        # child span IDs by parent span ID, only for spans that have children
+        self._children: Dict[str, List[str]] = {}
         self.root_span: str = self._build()
         self.trace_id = trace_id if trace_id else self.root_span.trace_id 
         duration_ms = sum(span.duration_ms for span in self.span_dict.values())
         self.__setattr__('duration_ms', duration_ms)
 
 
+    @property
+    def trace_id_hex(self) -> str:
+        """
+        Trace id in hex, as Tempo uses it, for logs and for keys shared with Tempo
+        """
+        return hex_id(self.trace_id)
+
     @property
     def root_span(self):
         return self.span_dict.get(self._root_span)
@@ -271,12 +487,12 @@ class Trace:
                 if root is None:
                     root = span_id
                 else: 
-                    logging.warning(f"Multiple root spans found: {span_id} and {root}")
+                    logging.warning(f"Multiple root spans found: {hex_id(span_id)} and {hex_id(root)}")
             else:  
                 if span.parent_span_id in self.span_dict:
-                    self.span_dict[span.parent_span_id].add_child(span_id)
+                    self._children.setdefault(span.parent_span_id, []).append(span_id)
                 else:
-                    logging.error(f"Parent span with ID {span.parent_span_id} not found for span {span_id}")
+                    logging.error(f"Parent span with ID {span.parent_span_id_hex} not found for span {hex_id(span_id)}")
 
         if root is None:
             # maybe we can use something like in memeory cache to store incomplete traces
@@ -286,6 +502,18 @@ class Trace:
 
         return root
 
+    def get_children(self, span_id: str) -> List[str]:
+        """
+        Returns the IDs of the child spans of the given span.
+
+        Args:
+            span_id (str): The ID of the parent span.
+
+        Returns:
+            List[str]: The IDs of its child spans, empty for a leaf span.
+        """
+        return self._children.get(span_id, [])
+
     def get_span(self, span_id: str) -> Span:
         """
         Returns the span object for the given span ID.
@@ -306,9 +534,13 @@ class Trace:
             flatten (bool, optional): If True, flattens the DataFrame. Defaults to False.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the concatenated spans.
+            pd.DataFrame: A DataFrame with one row per span.
         """
-        return pd.concat([span.to_df(flatten) for span in self.span_dict.values()], ignore_index=True)
+        # one frame for all the spans, rather than concatenating a single row frame per span
+        df = pd.DataFrame([span.to_dict() for span in self.span_dict.values()])
+        if flatten:
+            df = Span.flatten_attributes(df)
+        return df
 
     @staticmethod
     def parse_spans(trace: TracesData) -> list[Span]:
@@ -335,23 +567,14 @@ class Trace:
 
                 for scope_span in resource_span.scope_spans:
                     scope = scope_span.scope
-                    scope_name = scope.name
-                    scope_version = scope.version
+                    # Resource-level attributes (e.g., service.name), scope name and version,
+                    # shared by the spans of the scope
+                    context = dict(resource_attributes, scope_name=scope.name, scope_version=scope.version)
 
                     for span in scope_span.spans:
+                        # Read the span fields directly, attributes are decoded on access
+                        spans.append(Span.from_proto(span, context))
 
-                        # Convert span protobuf message to a dictionary
-                        span_dict = MessageToDict(span, preserving_proto_field_name=True)
-                        
-                        # Add resource-level attributes to the span data (e.g., service.name)
-                        span_dict.update(resource_attributes)
-                        
-                        # Add scope name and version
-                        span_dict['scope_name'] = scope_name
-                        span_dict['scope_version'] = scope_version
-
-                        spans.append(Span.from_dict(span_dict))         
-                    
             return spans
 
     @classmethod
@@ -379,15 +602,15 @@ class Trace:
         """
         try: 
             if root is None:
-                root = self.span_dict[self.root_span]  # Start from the root of the tree if not provided
+                root = self.root_span  # Start from the root of the tree if not provided
 
             if root is None:  # make sure we have a root span
                 logging.error("Root span is None, cannot print tree")
                 return
 
-            logging.info(f"{'    ' * level}Span: [{root.span_id}]")
+            logging.info(f"{'    ' * level}Span: [{root.span_id_hex}]")
 
-            for child in root.get_children() or []:
+            for child in self.get_children(root.span_id):
                 self.show_tree(self.span_dict[child], level + 1)
         except Exception as e:
             logging.error(f"{e}")
@@ -410,7 +633,599 @@ class Trace:
         return f"Trace({self.trace_id}, {self.span_dict})"
 
     def __str__(self):
-        return f"Trace: {self.trace_id}, {self.span_dict}"
+        return f"Trace: {self.trace_id_hex}, {self.span_dict}"
+
+
+class TraceBatch:
+    """
+    Many traces held as columnar NumPy arrays, one row per span, for bulk analysis.
+
+    Columns:
+    trace_index: int, row of the span's trace in trace_ids
+    span_ids: the span IDs
+    parent_index: int, row of the parent span in the batch, -1 for a root span or a missing parent
+    service_id: int, index of the span's service in services
+    operation_id: int, index of the span's name in operations
+    start: int, start time in unix nanoseconds
+    duration: float, duration in milliseconds
+
+    Aggregations run over whole columns with bincount and sorting, instead of looping
+    over spans in Python. Spans keep the order of the traces and of their span_dict.
+    """
+    __slots__ = (
+        'trace_ids', 'trace_index', 'span_ids', 'parent_index', 
+        'service_id', 'operation_id', 'start', 'duration', 'services', 'operations',
+    )
+
+    def __init__(
+            self, 
+            trace_ids: List, 
+            trace_index: np.ndarray, 
+            span_ids: np.ndarray, 
+            parent_index: np.ndarray, 
+            service_id: np.ndarray, 
+            operation_id: np.ndarray, 
+            start: np.ndarray, 
+            duration: np.ndarray, 
+            services: List[str], 
+            operations: List[str],
+    ):
+        self.trace_ids = trace_ids
+        self.trace_index = trace_index
+        self.span_ids = span_ids
+        self.parent_index = parent_index
+        self.service_id = service_id
+        self.operation_id = operation_id
+        self.start = start
+        self.duration = duration
+        self.services = services
+        self.operations = operations
+
+    def __len__(self) -> int:
+        return len(self.trace_index)
+
+    @property
+    def num_traces(self) -> int:
+        return len(self.trace_ids)
+
+    @classmethod
+    def from_traces(
+            cls, 
+            traces: List[Trace],
+    ) -> "TraceBatch":
+        """
+        Builds the columns of a list of traces in a single pass over their spans
+        """
+        services, operations = {}, {}
+        trace_index, span_ids, parent_index = [], [], []
+        service_id, operation_id, start, duration = [], [], [], []
+
+        for i, trace in enumerate(traces):
+            offset = len(span_ids)
+            rows = {span_id: offset + j for j, span_id in enumerate(trace.span_dict)}
+            for span_id, span in trace.span_dict.items():
+                trace_index.append(i)
+                span_ids.append(span_id)
+                parent_index.append(rows.get(span.parent_span_id, -1))
+                service_id.append(services.setdefault(span.service_name, len(services)))
+                operation_id.append(operations.setdefault(span.name, len(operations)))
+                start.append(span.start_time_unix_nano)
+                duration.append(span.duration_ms)
+
+        span_id_column = np.empty(len(span_ids), dtype=object)
+        span_id_column[:] = span_ids
+        return cls(
+            trace_ids=[trace.trace_id for trace in traces],
+            trace_index=np.array(trace_index, dtype=np.int64),
+            span_ids=span_id_column,
+            parent_index=np.array(parent_index, dtype=np.int64),
+            service_id=np.array(service_id, dtype=np.int64),
+            operation_id=np.array(operation_id, dtype=np.int64),
+            start=np.array(start, dtype=np.int64),
+            duration=np.array(duration, dtype=np.float64),
+            services=list(services),
+            operations=list(operations),
+        )
+
+    def trace_durations(self) -> np.ndarray:
+        """
+        Sum of the span durations of each trace, the same as Trace.duration_ms
+        """
+        return np.bincount(self.trace_index, weights=self.duration, minlength=self.num_traces)
+
+    def trace_service_durations(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sum of the span durations of each service in each trace
+
+        Returns:
+            (trace_index, service_id, duration) of every (trace, service) pair with spans,
+            ordered by trace
+        """
+        keys = self.trace_index * len(self.services) + self.service_id
+        pairs, inverse = np.unique(keys, return_inverse=True)
+        durations = np.bincount(inverse, weights=self.duration, minlength=len(pairs))
+        return pairs // len(self.services), pairs % len(self.services), durations
+
+    def _group_codes(
+            self, 
+            by: str,
+    ) -> Tuple[np.ndarray, pd.Index]:
+        if by == 'service':
+            return self.service_id, pd.Index(self.services, name='service_name')
+        if by == 'operation':
+            keys = self.service_id * len(self.operations) + self.operation_id
+            pairs, codes = np.unique(keys, return_inverse=True)
+            index = pd.MultiIndex.from_arrays(
+                [
+                    np.asarray(self.services, dtype=object)[pairs // len(self.operations)],
+                    np.asarray(self.operations, dtype=object)[pairs % len(self.operations)],
+                ],
+                names=['service_name', 'name'],
+            )
+            return codes, index
+        raise ValueError(f"Unknown grouping {by}, expected 'service' or 'operation'")
+
+    def aggregate(
+            self, 
+            by: str = 'service', 
+            percentiles: Tuple[float] = (75,),
+    ) -> pd.DataFrame:
+        """
+        Span duration statistics per service, or per service and operation
+
+        Args:
+            by (str): 'service' or 'operation'
+            percentiles (Tuple[float]): percentiles to compute, with np.percentile's default (linear) method
+
+        Returns:
+            DataFrame indexed by service (and operation) with count, total, mean, max and pXX columns
+        """
+        codes, index = self._group_codes(by)
+        n_groups = len(index)
+        counts = np.bincount(codes, minlength=n_groups)
+        totals = np.bincount(codes, weights=self.duration, minlength=n_groups)
+        df = pd.DataFrame({'count': counts, 'total': totals, 'mean': totals / np.maximum(counts, 1)}, index=index)
+
+        # sort durations within each group, groups one after the other
+        order = np.lexsort((self.duration, codes))
+        sorted_durations = self.duration[order]
+        group_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        df['max'] = sorted_durations[group_starts + counts - 1]
+        for q in percentiles:
+            position = (counts - 1) * q / 100
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, counts - 1)
+            low_values = sorted_durations[group_starts + lower]
+            high_values = sorted_durations[group_starts + upper]
+            df[f'p{q:g}'] = low_values + (high_values - low_values) * (position - lower)
+        return df
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        One row per span, with services and operations as categoricals
+        """
+        parent_span_ids = np.empty(len(self), dtype=object)
+        has_parent = self.parent_index >= 0
+        parent_span_ids[has_parent] = self.span_ids[self.parent_index[has_parent]]
+        trace_ids = np.empty(self.num_traces, dtype=object)
+        trace_ids[:] = self.trace_ids
+        return pd.DataFrame({
+            'trace_id': trace_ids[self.trace_index],
+            'span_id': self.span_ids,
+            'parent_span_id': parent_span_ids,
+            'service_name': pd.Categorical.from_codes(self.service_id, categories=self.services),
+            'name': pd.Categorical.from_codes(self.operation_id, categories=self.operations),
+            'start_time_unix_nano': self.start,
+            'duration_ms': self.duration,
+            'trace_index': self.trace_index,
+            'parent_index': self.parent_index,
+        })
+
+    def to_arrow(self):
+        """
+        The columns as a pyarrow Table, services and operations dictionary encoded.
+        Requires the optional pyarrow package.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("TraceBatch.to_arrow requires pyarrow, install it with pip install pyarrow") from e
+
+        trace_ids = np.empty(self.num_traces, dtype=object)
+        trace_ids[:] = self.trace_ids
+        return pa.table({
+            'trace_id': pa.array(trace_ids[self.trace_index]),
+            'span_id': pa.array(self.span_ids),
+            'service_name': pa.DictionaryArray.from_arrays(self.service_id.astype(np.int32), self.services),
+            'name': pa.DictionaryArray.from_arrays(self.operation_id.astype(np.int32), self.operations),
+            'start_time_unix_nano': pa.array(self.start),
+            'duration_ms': pa.array(self.duration),
+            'trace_index': pa.array(self.trace_index),
+            'parent_index': pa.array(self.parent_index),
+        })
+
+
+class LatencyWindow:
+    """
+    A fixed size ring buffer of latency samples backed by NumPy arrays.
+
+    Latencies (ms) and timestamps (unix nanoseconds) are stored in separate columns.
+    Each sample is written twice, at slot i and i + capacity, so the most recent samples
+    are always one contiguous slice in chronological order. The latencies and timestamps
+    methods return read-only views of that slice, without copying any data.
+    """
+    __slots__ = ('_capacity', '_latencies', '_timestamps', '_next', '_size')
+
+    def __init__(
+            self, 
+            capacity: int
+    ):
+        self._capacity = capacity
+        self._latencies = np.zeros(2 * capacity, dtype=np.float64)
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(
+            self, 
+            latency: float, 
+            timestamp: int,
+    ) -> None:
+        """
+        Add a sample, replacing the oldest one when the window is full
+        """
+        i = self._next
+        j = i + self._capacity
+        self._latencies[i] = self._latencies[j] = latency
+        self._timestamps[i] = self._timestamps[j] = timestamp
+        self._next = i + 1 if i + 1 < self._capacity else 0
+        if self._size < self._capacity:
+            self._size += 1
+
+    def extend(
+            self, 
+            latencies: np.ndarray, 
+            timestamps: np.ndarray,
+    ) -> None:
+        """
+        Add samples in order, the same as appending them one by one
+        """
+        latencies = np.asarray(latencies, dtype=np.float64)[-self._capacity:]
+        timestamps = np.asarray(timestamps, dtype=np.int64)[-self._capacity:]
+        n = len(latencies)
+        slots = (self._next + np.arange(n)) % self._capacity
+        for column, values in ((self._latencies, latencies), (self._timestamps, timestamps)):
+            column[slots] = values
+            column[slots + self._capacity] = values
+        self._next = int((self._next + n) % self._capacity)
+        self._size = min(self._size + n, self._capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def latency(
+            self, 
+            index: int,
+    ) -> float:
+        """
+        A single latency of the window, counted from the oldest one, without building a view
+        """
+        return float(self._latencies[self._next + self._capacity - self._size + index])
+
+    def _view(self, column: np.ndarray) -> np.ndarray:
+        end = self._next + self._capacity
+        view = column[end - self._size:end]
+        view.flags.writeable = False
+        return view
+
+    def latencies(self) -> np.ndarray:
+        """
+        Latencies in the window, oldest first
+        """
+        return self._view(self._latencies)
+
+    def timestamps(self) -> np.ndarray:
+        """
+        Timestamps in the window, oldest first
+        """
+        return self._view(self._timestamps)
+
+
+class StreamingQuantile:
+    """
+    P² estimate of a quantile of a stream (Jain and Chlamtac, 1985), in constant memory 
+    and constant time per sample.
+
+    Five markers follow the minimum, the quantile, the maximum and two quantiles half 
+    way between them, and are moved by piecewise-parabolic interpolation as samples arrive.
+    Up to five samples the quantile is exact, interpolated like np.percentile.
+    """
+    __slots__ = ('_q', '_heights', '_positions', '_desired', '_increments', 'count')
+
+    def __init__(
+            self, 
+            q: float,
+    ):
+        """
+        Args:
+            q (float): quantile to estimate, between 0 and 1
+        """
+        self._q = q
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget every sample
+        """
+        q = self._q
+        self._heights = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0.0, 2 * q, 4 * q, 2 + 2 * q, 4.0]
+        self._increments = (0.0, q / 2, q, (1 + q) / 2, 1.0)
+        self.count = 0
+
+    def add(
+            self, 
+            value: float,
+    ) -> None:
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            bisect.insort(heights, value)
+            return
+
+        # cell of the new sample, extending the extreme markers
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+        positions = self._positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+
+        # move the middle markers that are a position or more away from where they should be
+        for i in (1, 2, 3):
+            offset = desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(
+            self, 
+            i: int, 
+            step: int,
+    ) -> float:
+        heights, positions = self._heights, self._positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+        )
+
+    def value(self) -> float:
+        """
+        The estimated quantile, None before the first sample
+        """
+        heights = self._heights
+        if not heights:
+            return None
+        if self.count > 5:
+            return heights[2]
+        position = (len(heights) - 1) * self._q
+        lower = int(position)
+        upper = min(lower + 1, len(heights) - 1)
+        return heights[lower] + (heights[upper] - heights[lower]) * (position - lower)
+
+
+class IncrementalLatencyStats:
+    """
+    Streaming statistics behind the hybrid EWMA/CUSUM detection of a service, updated 
+    in O(1) per sample instead of being recomputed from the latency window on every analysis.
+
+    Samples are added through append and extend, which also add them to the service's 
+    LatencyWindow. For the samples of the window it keeps:
+    - the window sum, subtracting evicted samples, for the CUSUM (exact)
+    - the mean and variance of the last span samples, with Welford additions and removals (exact)
+    - a recursive EWMA of the latencies, with the alpha of the current span
+    - P² estimates of the p75 latency and of the p75 of the EWMA values
+
+    hybrid_detection instead restarts the EWMA at the oldest sample of the window and 
+    takes exact percentiles, so the last two differ from the batch mode:
+    - the EWMA runs on across evictions, k samples into the window its values differ 
+      from the restarted one by (1 - alpha)^k times the gap to the older history
+    - each p75 is estimated by two P² estimators, restarted every window samples and half 
+      a window apart, and read from the one that has seen more samples, which covers the 
+      last half to whole window
+    Decisions can therefore differ from the batch mode for a few samples around latency 
+    shifts, modeler/tests/test_incremental_stats.py bounds how often.
+    """
+    # recompute the exact sums from the window every so often, to shed floating point drift
+    RESYNC_INTERVAL = 10000
+
+    def __init__(
+            self, 
+            window: LatencyWindow,
+    ):
+        self._window = window
+        self._window_sum = 0.0
+        self._recent_count = 0
+        self._recent_mean = 0.0
+        self._recent_m2 = 0.0
+        self.ema = None
+        # two estimators per quantile, restarted every window samples half a window apart
+        self._latency_p75 = (StreamingQuantile(0.75), StreamingQuantile(0.75))
+        self._ema_p75 = (StreamingQuantile(0.75), StreamingQuantile(0.75))
+        self._updates = 0
+
+    def __len__(self) -> int:
+        return len(self._window)
+
+    @property
+    def span(self) -> int:
+        """
+        EWMA span and number of recent samples, a third of the window like hybrid_detection
+        """
+        return max(1, len(self._window) // 3)
+
+    def _welford_add(
+            self, 
+            value: float,
+    ) -> None:
+        self._recent_count += 1
+        delta = value - self._recent_mean
+        self._recent_mean += delta / self._recent_count
+        self._recent_m2 += delta * (value - self._recent_mean)
+
+    def _welford_remove(
+            self, 
+            value: float,
+    ) -> None:
+        self._recent_count -= 1
+        if self._recent_count == 0:
+            self._recent_mean = self._recent_m2 = 0.0
+            return
+        delta = value - self._recent_mean
+        self._recent_mean -= delta / self._recent_count
+        self._recent_m2 -= delta * (value - self._recent_mean)
+
+    def _add_quantile(
+            self, 
+            estimators: Tuple[StreamingQuantile, StreamingQuantile], 
+            value: float,
+    ) -> None:
+        capacity = self._window.capacity
+        for i, estimator in enumerate(estimators):
+            # the second estimator starts half a window after the first one
+            if i and self._updates <= capacity // 2:
+                continue
+            if estimator.count >= capacity:
+                estimator.reset()
+            estimator.add(value)
+
+    @staticmethod
+    def _quantile(
+            estimators: Tuple[StreamingQuantile, StreamingQuantile],
+    ) -> float:
+        return max(estimators, key=lambda estimator: estimator.count).value()
+
+    def _resync(self) -> None:
+        latencies = self._window.latencies()
+        recent = latencies[-self.span:]
+        self._window_sum = float(np.sum(latencies))
+        self._recent_count = len(recent)
+        self._recent_mean = float(np.mean(recent))
+        self._recent_m2 = float(np.sum((recent - self._recent_mean) ** 2))
+
+    def append(
+            self, 
+            latency: float, 
+            timestamp: int,
+    ) -> None:
+        """
+        Add a sample to the window and the statistics, evicting the oldest one when the window is full
+        """
+        window = self._window
+        size = len(window)
+        if size:
+            span = self.span
+            # the oldest recent sample leaves them, unless they grow with the window
+            if max(1, min(size + 1, window.capacity) // 3) == span:
+                self._welford_remove(window.latency(size - span))
+            if size == window.capacity:
+                self._window_sum -= window.latency(0)
+        window.append(latency, timestamp)
+
+        self._window_sum += latency
+        self._welford_add(latency)
+        alpha = 2 / (self.span + 1)
+        self.ema = latency if self.ema is None else self.ema + alpha * (latency - self.ema)
+        self._updates += 1
+        self._add_quantile(self._latency_p75, latency)
+        self._add_quantile(self._ema_p75, self.ema)
+        if self._updates % self.RESYNC_INTERVAL == 0:
+            self._resync()
+
+    def extend(
+            self, 
+            latencies: np.ndarray, 
+            timestamps: np.ndarray,
+    ) -> None:
+        """
+        Add samples in order, the same as appending them one by one
+        """
+        for latency, timestamp in zip(np.asarray(latencies, dtype=np.float64).tolist(), np.asarray(timestamps).tolist()):
+            self.append(latency, timestamp)
+
+    @property
+    def recent_std(self) -> float:
+        """
+        Population standard deviation of the last span samples
+        """
+        if not self._recent_count:
+            return 0.0
+        return float(np.sqrt(max(self._recent_m2, 0.0) / self._recent_count))
+
+    @property
+    def p75(self) -> float:
+        return self._quantile(self._latency_p75)
+
+    @property
+    def ema_p75(self) -> float:
+        return self._quantile(self._ema_p75)
+
+    def cusum(
+            self, 
+            target: float,
+    ) -> float:
+        """
+        Cumulative sum of the deviations of the window from target
+        """
+        return self._window_sum - len(self._window) * target
+
+    def detect(
+            self, 
+            ewma_multiplier: float = 1.5, 
+            cusum_threshold: float = None,
+    ) -> Tuple[int, float, float, float, int, float, bool, bool]:
+        """
+        Hybrid EWMA/CUSUM detection from the streaming statistics, 
+        with the same decision rules and result as hybrid_detection
+        """
+        span = self.span
+        recent_std = self.recent_std
+        if cusum_threshold is None:
+            cusum_threshold = 1.5 * recent_std
+        if not len(self._window):
+            logging.warning("Not enough data to perform hybrid detection.")
+            return 0, float('inf'), float('-inf'), float('nan'), span, cusum_threshold, False, False
+
+        ema_p75 = self.ema_p75
+        upper_bound = ema_p75 + ewma_multiplier * recent_std
+        lower_bound = max(1, ema_p75 - ewma_multiplier * recent_std)
+        value = self.p75
+        cusum = self.cusum(ema_p75)
+
+        if value > upper_bound:
+            return 1, upper_bound, lower_bound, value, span, cusum_threshold, True, cusum > cusum_threshold
+        elif value < lower_bound:
+            return -1, upper_bound, lower_bound, value, span, cusum_threshold, True, cusum < -cusum_threshold
+        return 0, upper_bound, lower_bound, value, span, cusum_threshold, False, False
 
 
 class LatencyTracker:
@@ -419,48 +1234,69 @@ class LatencyTracker:
 
     There are two main parts to the data:
     The service_data dictionary contains is a dictionary of service names, 
-    each with a dictionary of operations and a queue of its most recent calculated latencies.
+    each with a dictionary of operations and a window of its most recent calculated latencies.
 
     The operations dictionary is similar to the service_data dictionary, 
-    but it contains a queue of latencies_data for each operation. 
+    but it contains a window of latency data for each operation. 
     
-    The latency_data is a dictionary containing the latency and start time of the operation.
+    The latency data is kept in a LatencyWindow, a columnar ring buffer holding 
+    the latency and start time of the most recent queue_length samples.
+
+    With incremental_stats enabled, each service also keeps IncrementalLatencyStats,
+    updated in O(1) as samples are added to its window, for the incremental analysis mode.
     """
     def __init__(
             self, 
-            queue_length=25
+            queue_length=25,
+            incremental_stats: bool=False,
     ):  
         """
         Initialize the latency tracker
         """
-        self.service_data = defaultdict(lambda : {
-            'latency_data': deque(maxlen=queue_length),
+        self.incremental_stats = incremental_stats
+        # services with samples that have not been analyzed yet, see DecisionScheduler
+        self._dirty_services = set()
+        self.service_data = defaultdict(lambda : self._new_service_info(queue_length))
+
+    def _new_service_info(
+            self, 
+            queue_length: int,
+    ) -> Dict:
+        latency_data = LatencyWindow(queue_length)
+        return {
+            'stats': IncrementalLatencyStats(latency_data) if self.incremental_stats else None,
+            'latency_data': latency_data,
             'total_duration': 0.0,
             'count': 0,
             'operations': defaultdict(lambda: {
-                'latency_data': deque(maxlen=queue_length),
+                'latency_data': LatencyWindow(queue_length),
                 'total_duration': 0.0,
                 'count': 0,
             })
-        })
+        }
 
     def add_service_latency(
             self, 
             service_name, 
             latency,
+            timestamp: float=None,
     ):
         """
         Add a latency to the tracker
+        The timestamp (unix seconds) defaults to the current time
         """
-        # add current timestamp to the latency data
-        latency_data = {
-            'latency': latency,
-            'start_time': datetime.now().timestamp(),
-        }
+        if timestamp is None:
+            timestamp = time.time()
 
-        self.service_data[service_name]['latency_data'].append(latency_data)
-        self.service_data[service_name]['total_duration'] += latency
-        self.service_data[service_name]['count'] += 1
+        service_info = self.service_data[service_name]
+        # the window stores unix nanoseconds, like the start times of operation samples
+        if self.incremental_stats:
+            service_info['stats'].append(latency, int(timestamp * 1e9))
+        else:
+            service_info['latency_data'].append(latency, int(timestamp * 1e9))
+        service_info['total_duration'] += latency
+        service_info['count'] += 1
+        self._dirty_services.add(service_name)
 
     def add_operation_latency(
             self, 
@@ -472,16 +1308,11 @@ class LatencyTracker:
         """
         Add a latency to the tracker
         """
-        latency_data = {
-            'latency': latency,
-            'start_time': start_time,
-        }
-
         service_info = self.service_data[service_name]
         operation_info = service_info['operations'][operation_name]
 
         # Add the new latency data
-        operation_info['latency_data'].append(latency_data)
+        operation_info['latency_data'].append(latency, int(start_time))
 
         # Update the running totals
         operation_info['total_duration'] += latency
@@ -502,17 +1333,92 @@ class LatencyTracker:
             self.add_operation_latency(span.service_name, span.name, span.start_time_unix_nano, span.duration_ms)
             service_durations[span.service_name] += span.duration_ms
 
+        # all service samples of a trace share the time it was tracked at
+        tracked_at = time.time()
         for service_name, duration in service_durations.items():
-            self.add_service_latency(service_name, duration)
+            self.add_service_latency(service_name, duration, tracked_at)
+
+    def track_batch(
+            self, 
+            batch: TraceBatch,
+    ) -> None:
+        """
+        Track the latencies of many traces at once
+        Gives the same windows and statistics as calling track on each trace in order
+        (up to rounding of the running totals),
+        except that all service samples share the time the batch was tracked at
+        """
+        if not len(batch):
+            return
+
+        # operation samples: rows of each (service, operation) in batch order
+        keys = batch.service_id * len(batch.operations) + batch.operation_id
+        order = np.argsort(keys, kind='stable')
+        pairs, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        totals = np.add.reduceat(batch.duration[order], starts)
+        for pair, first, count, total in zip(pairs.tolist(), starts.tolist(), counts.tolist(), totals.tolist()):
+            rows = order[first:first + count]
+            service_name = batch.services[pair // len(batch.operations)]
+            operation_info = self.service_data[service_name]['operations'][batch.operations[pair % len(batch.operations)]]
+            operation_info['latency_data'].extend(batch.duration[rows], batch.start[rows])
+            operation_info['total_duration'] += total
+            operation_info['count'] += count
+
+        # service samples: one per service and trace, in trace order
+        _, service_ids, durations = batch.trace_service_durations()
+        tracked_at = int(time.time() * 1e9)
+        order = np.argsort(service_ids, kind='stable')
+        service_ids, durations = service_ids[order], durations[order]
+        service_ids_, starts, counts = np.unique(service_ids, return_index=True, return_counts=True)
+        for service_id, first, count in zip(service_ids_.tolist(), starts.tolist(), counts.tolist()):
+            service_name = batch.services[service_id]
+            samples = durations[first:first + count]
+            service_info = self.service_data[service_name]
+            timestamps = np.full(count, tracked_at, dtype=np.int64)
+            if self.incremental_stats:
+                service_info['stats'].extend(samples, timestamps)
+            else:
+                service_info['latency_data'].extend(samples, timestamps)
+            service_info['total_duration'] += samples.sum()
+            service_info['count'] += count
+            self._dirty_services.add(service_name)
+
+    def get_window(
+            self, 
+            service_name: str, 
+            operation_name: str=None
+    ) -> LatencyWindow:
+        """
+        Get the latency window of a service or operation
+        """
+        if operation_name:
+            return self.service_data[service_name]['operations'][operation_name]['latency_data']
+        return self.service_data[service_name]['latency_data']
+
+    def pop_dirty_services(self) -> set:
+        """
+        Get the services that received latencies since the last call, and reset the dirty set
+        """
+        dirty, self._dirty_services = self._dirty_services, set()
+        return dirty
+
+    def get_stats(
+            self, 
+            service_name: str,
+    ) -> IncrementalLatencyStats:
+        """
+        Get the incremental statistics of a service, None unless incremental_stats is enabled
+        """
+        return self.service_data[service_name]['stats']
 
     def get_service_latencies(
             self, 
             service_name,
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
         Get the most recent latencies for a service
         """
-        return list(self.service_data[service_name]['latency_data'])
+        return self.get_window(service_name).latencies()
 
     def get_latency_data(
             self, 
@@ -521,23 +1427,41 @@ class LatencyTracker:
     ) -> List[Dict]:
         """
         Get the latency queue data for a specific operation of a service, or for the service itself
+        The start_time of a service sample is the time it was tracked (unix seconds), 
+        that of an operation sample the start of its span (unix nanoseconds)
         """
-        if operation_name:
-            return list(self.service_data[service_name]['operations'][operation_name]['latency_data'])
-        return list(self.service_data[service_name]['latency_data'])
+        window = self.get_window(service_name, operation_name)
+        timestamps = self.get_timestamps(service_name, operation_name)
+        return [
+            {'latency': latency, 'start_time': start_time} 
+            for latency, start_time in zip(window.latencies().tolist(), timestamps.tolist())
+        ]
 
     def get_latencies(
             self, 
             service_name: str,
             operation_name: str=None,
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
         Method to get the latencies for a service or operation
+        Returns a read-only view of the latency window, oldest first
         """
-        latency_data = self.get_latency_data(service_name, operation_name)
-        # latency data is a list of {latency, start_time}
-        # here we want just the lsit of latencies
-        return [attr['latency'] for attr in latency_data]
+        return self.get_window(service_name, operation_name).latencies()
+
+    def get_timestamps(
+            self, 
+            service_name: str,
+            operation_name: str=None,
+    ) -> np.ndarray:
+        """
+        Method to get the timestamps for a service or operation, oldest first
+        Same units as the start_time of get_latency_data: the time service samples were 
+        tracked (unix seconds), the start of the span of operation samples (unix nanoseconds)
+        """
+        timestamps = self.get_window(service_name, operation_name).timestamps()
+        if operation_name:
+            return timestamps
+        return timestamps / 1e9
 
     def get_service_names(self) -> List[str]:
         """
@@ -587,9 +1511,7 @@ class LatencyTracker:
         """
         Get the length of the latency queue for a service or operation 
         """
-        if operation:
-            return len(self.service_data[service_name]['operations'][operation]['latency_data'])
-        return len(self.service_data[service_name]['latency_data'])
+        return len(self.get_window(service_name, operation))
 
 class LatencyAnalyzer:
     """
@@ -613,9 +1535,9 @@ class LatencyAnalyzer:
         Calculate the average latency for a service
         """
         latencies = self.latency_tracker.get_latencies(service_name=service_name, operation_name=operation_name)
-        if not latencies:
+        if len(latencies) == 0:
             return None
-        return np.mean([latency for latency in latencies])
+        return np.mean(latencies)
 
     def p75_latency(
             self,
@@ -633,7 +1555,7 @@ class LatencyAnalyzer:
             float: The p75 latency for the specified service or operation.
         """
         latencies = self.latency_tracker.get_latencies(service_name=service_name, operation_name=operation_name)
-        if not latencies:
+        if len(latencies) == 0:
             return None
         return np.percentile(latencies, 75)
 
@@ -647,7 +1569,7 @@ class LatencyAnalyzer:
         Calculate the trend of latencies for a service or operation
         """
         latencies = self.latency_tracker.get_latencies(service_name=service_name, operation_name=operation_name)
-        if not latencies:
+        if len(latencies) == 0:
             return 0.0
         return self._calculate_trend(latencies)
 
@@ -660,7 +1582,7 @@ class LatencyAnalyzer:
         Calculate the trend of latencies for a service or operation
         """
         latencies = self.latency_tracker.get_latencies(service_name=service_name, operation_name=operation_name)
-        if not latencies:
+        if len(latencies) == 0:
             return 0.0
         return self._calculate_trend_cusum(latencies)
     
@@ -673,7 +1595,7 @@ class LatencyAnalyzer:
         Calculate the trend of latencies for a service or operation
         """
         latencies = self.latency_tracker.get_latencies(service_name=service_name, operation_name=operation_name)
-        if not latencies:
+        if len(latencies) == 0:
             return 0.0
         return self._calculate_trend_ema(latencies)    
 
@@ -764,7 +1686,7 @@ class LatencyAnalyzer:
             return None
 
         x = np.arange(len(latencies))  # for time points (1, 2, 3, ...)
-        y = np.array(latencies)
+        y = np.asarray(latencies)
 
         coeffs = np.polyfit(x, y, 1) 
         trend = coeffs[0]  # get the slope
@@ -780,7 +1702,7 @@ class LatencyAnalyzer:
         Calculate the cumulative sum of deviations from a target mean or previous trend.
         """
         mean_latency = np.mean(latencies)
-        cusum = np.cumsum(np.array(latencies) - mean_latency)
+        cusum = np.cumsum(np.asarray(latencies) - mean_latency)
         
         if abs(cusum[-1]) > threshold:
             return cusum[-1] / len(latencies)  # Average shift
@@ -796,6 +1718,6 @@ class LatencyAnalyzer:
         if len(latencies) < span:
             return 0
         
-        ema = pd.Series(latencies).ewm(span=span, adjust=False).mean()
-        trend = ema.iloc[-1] - ema.iloc[-span]  # difference over the span
+        ema = ewma(latencies, span)
+        trend = ema[-1] - ema[-span]  # difference over the span
         return trend
\ No newline at end of file
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable
+
+from models import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class DecisionScheduler:
+    """
+    Debounces scaling analysis.
+
+    Instead of analyzing every service of every trace as it arrives, services are 
+    marked dirty by the LatencyTracker when they receive new samples, and each dirty 
+    service is analyzed at most once per tick. Analysis cost then grows with the 
+    number of active services rather than with the trace rate.
+    """
+    def __init__(
+            self, 
+            tracker: LatencyTracker, 
+            analyze: Callable[[Iterable[str]], None], 
+            interval: float,
+    ):
+        self._tracker = tracker
+        self._analyze = analyze
+        self._interval = interval
+        self.ticks = 0
+        self.services_analyzed = 0
+
+    def tick(self) -> int:
+        """
+        Analyze the services that changed since the last tick
+
+        Returns:
+            int: number of services analyzed
+        """
+        services = self._tracker.pop_dirty_services()
+        self.ticks += 1
+        if services:
+            self._analyze(services)
+            self.services_analyzed += len(services)
+        return len(services)
+
+    async def run(self):
+        """
+        Runs a tick every interval seconds, measured from the start of the previous tick
+        """
+        logger.info(f"Starting decision scheduler with a {self._interval}s tick")
+        while True:
+            started = time.monotonic()
+            try:
+                count = self.tick()
+                logger.debug(f"Decision tick analyzed {count} services in {time.monotonic() - started:.4f}s")
+            except Exception as e:
+                logger.exception(f"Error during decision tick: {e}")
+            await asyncio.sleep(max(0.0, self._interval - (time.monotonic() - started)))
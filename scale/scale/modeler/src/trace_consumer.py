@@ -3,6 +3,7 @@ import grpc
 import asyncio
 import os
 import logging
+from typing import Optional
 try:
     from generated.sampler.v1 import sampler_pb2, sampler_pb2_grpc
 except:
@@ -12,13 +13,56 @@ from trace_processor import TraceProcessor
 logger = logging.getLogger(__name__)
 
 class TraceConsumer:
+    """
+    Consumes sampled traces from the sampler.
+
+    Two ingest modes are supported, selected with the TRACE_INGEST_MODE environment variable:
+    - id: subscribe to SampleTraces and fetch each sampled trace from Tempo by its id
+    - data: subscribe to SampleTracesData and assemble traces from the streamed spans,
+            only falling back to Tempo for traces that are incomplete.
+            Requires the sampler to run with --trace_linger > 0: without it the sampler
+            streams only the anomalous spans, nearly every trace is incomplete and
+            data mode costs a Tempo fetch per trace, like id mode.
+
+    Several modeler replicas can split the sampled traces between them by setting
+    TRACE_SHARD_COUNT to the number of replicas and TRACE_SHARD_INDEX to a distinct
+    index in [0, TRACE_SHARD_COUNT) on each. TRACE_SHARD_KEY selects how traces are
+    routed: trace_id (default) spreads traces evenly, root_service sends every trace
+    with the same root service to the same replica. A trace still spans many services,
+    so replicas share the downstream services either way. root_service needs the root
+    span of each trace, the sampler only accepts it when it runs with --trace_linger > 0.
+    """
+    INGEST_MODES = ("id", "data")
+    SHARD_KEYS = {
+        "trace_id": sampler_pb2.SHARD_KEY_TRACE_ID,
+        "root_service": sampler_pb2.SHARD_KEY_ROOT_SERVICE,
+    }
+
     def __init__(self, processor: TraceProcessor):
         channel_address = os.getenv("TRACE_SAMPLER_CHANNEL", "sampler:4317")
+        self._ingest_mode = os.getenv("TRACE_INGEST_MODE", "id")
+        if self._ingest_mode not in self.INGEST_MODES:
+            raise ValueError(f"Unknown ingest mode: {self._ingest_mode}, expected one of {self.INGEST_MODES}")
+        self._shard_index = int(os.getenv("TRACE_SHARD_INDEX", "0"))
+        self._shard_count = int(os.getenv("TRACE_SHARD_COUNT", "1"))
+        shard_key = os.getenv("TRACE_SHARD_KEY", "trace_id")
+        if shard_key not in self.SHARD_KEYS:
+            raise ValueError(f"Unknown shard key: {shard_key}, expected one of {tuple(self.SHARD_KEYS)}")
+        if self._shard_count > 1 and not 0 <= self._shard_index < self._shard_count:
+            raise ValueError(f"TRACE_SHARD_INDEX must be in [0, {self._shard_count}), got {self._shard_index}")
+        self._shard_key = self.SHARD_KEYS[shard_key]
         self._channel = grpc.aio.insecure_channel(channel_address)
         self._stub = sampler_pb2_grpc.TraceSamplerStub(self._channel)
-        self._request = sampler_pb2.SampleTracesRequest()
         self._processor = processor
         self._connected = False
+        # keeps a reference so the task is not garbage collected
+        self._processor_task: Optional[asyncio.Task] = None
+
+    def _stream(self):
+        shard = dict(shard_index=self._shard_index, shard_count=self._shard_count, shard_key=self._shard_key)
+        if self._ingest_mode == "data":
+            return self._stub.SampleTracesData(sampler_pb2.SampleTracesDataRequest(**shard)), self._processor.process_data
+        return self._stub.SampleTraces(sampler_pb2.SampleTracesRequest(**shard)), self._processor.process
 
     @retry(
         wait=wait_fixed(5),
@@ -27,15 +71,16 @@ class TraceConsumer:
     async def consume(self):
         while True:
             try:
-                async for response in self._stub.SampleTraces(self._request):
+                stream, process = self._stream()
+                async for response in stream:
                     if not self._connected:
-                        logger.info(f"Connected established to channel: {os.getenv('TRACE_SAMPLER_CHANNEL', 'sampler:4317')}")
+                        logger.info(f"Connected established to channel: {os.getenv('TRACE_SAMPLER_CHANNEL', 'sampler:4317')} ({self._ingest_mode} mode, shard {self._shard_index} of {self._shard_count})")
                         self._connected = True
                          
                         # start the processor task when the connection is established
-                        asyncio.create_task(self._processor.start())
+                        self._processor_task = asyncio.create_task(self._processor.start())
 
-                    await self._processor.process(response)
+                    await process(response)
             except grpc.aio.AioRpcError as e:
                 if e.code() == grpc.StatusCode.UNAVAILABLE:
                     logger.warning(f"Server unavailable, retrying: {e.details()}")
@@ -45,6 +90,9 @@ class TraceConsumer:
                     break  # Break the loop on unexpected errors
 
     async def close(self):
+        if self._processor_task is not None:
+            self._processor_task.cancel()
+            await asyncio.gather(self._processor_task, return_exceptions=True)
         await self._channel.close()
 
     async def __aenter__(self):
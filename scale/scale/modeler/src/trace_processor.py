@@ -1,19 +1,20 @@
 import os
-import aiohttp
 import asyncio
-from typing import Tuple, List
+from typing import Awaitable, Optional, Tuple, List
 from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
 from google.protobuf.json_format import MessageToDict
 import logging
-import pandas as pd
 import numpy as np
 from datetime import datetime
 from collections import defaultdict
 
-from models import Trace, LatencyTracker, LatencyAnalyzer
+from models import Trace, LatencyTracker, LatencyAnalyzer, ewma, hybrid_detection
 from backends.tempo_client import TempoClient
+from backends.trace_cache import TraceCache
+from common.trace_buffer import BufferedTrace, TraceBuffer
 from config.config_interface import ConfigInterface
 from metrics import Metrics, MetricsReporter
+from scheduler import DecisionScheduler
 try:
     from orchestration_client import OrchestrationClient
 except:
@@ -23,13 +24,71 @@ logger = logging.getLogger(__name__)
 
 
 class TraceProcessor:
-    def __init__(self, client_url: str, config: ConfigInterface, orchestrator: OrchestrationClient):
-        self._tempo_client = TempoClient(client_url)
+    # batch: recompute the detection statistics from the latency window on every analysis
+    # incremental: keep streaming statistics per service, updated in O(1) per sample, 
+    #              see IncrementalLatencyStats for how its decisions can differ from the batch mode
+    ANALYSIS_MODES = ("batch", "incremental")
+
+    def __init__(
+            self, 
+            client_url: str, 
+            config: ConfigInterface, 
+            orchestrator: OrchestrationClient,
+            trace_linger: float = 5.0,
+            max_buffered_spans: int = 100000,
+            tempo_connections: int = 20,
+            tempo_timeout: float = 30,
+            fetch_workers: int = 20,
+            max_in_flight: int = 200,
+            analysis_mode: str = "batch",
+            decision_interval: float = 0,
+            cache_entries: int = 1000,
+            cache_bytes: int = 64 * 1024 * 1024,
+            cache_ttl: float = 300,
+            cache_negative_ttl: float = 5,
+            cache_partial_ttl: float = 5,
+    ):
+        # traces fetched more than once (several sampled spans, reconnects) are served from the cache
+        cache = None
+        if cache_entries > 0:
+            cache = TraceCache(
+                max_entries=cache_entries, 
+                max_bytes=cache_bytes, 
+                ttl=cache_ttl, 
+                negative_ttl=cache_negative_ttl,
+                partial_ttl=cache_partial_ttl,
+            )
+        self._tempo_client = TempoClient(client_url, limit_per_host=tempo_connections, timeout=tempo_timeout, cache=cache)
         self._config = config
         self._orchestrator = orchestrator
-        self._tracker = LatencyTracker()
+        if analysis_mode not in self.ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode: {analysis_mode}, expected one of {self.ANALYSIS_MODES}")
+        self._analysis_mode = analysis_mode
+        self._tracker = LatencyTracker(incremental_stats=analysis_mode == "incremental")
         self._analyzer = LatencyAnalyzer(self._tracker)
+        # with a decision interval, services are analyzed once per tick instead of once per trace
+        self._scheduler = None
+        if decision_interval > 0:
+            self._scheduler = DecisionScheduler(
+                self._tracker, 
+                analyze=lambda services: self._analyze_services_hybrid_ewma_cusum(services=services),
+                interval=decision_interval,
+            )
         self._queue = asyncio.Queue()  
+        self._trace_linger = trace_linger
+        self._trace_buffer = TraceBuffer(linger=trace_linger, max_spans=max_buffered_spans)
+        # data mode: traces assembled from streamed spans vs fetched from Tempo because they were incomplete
+        self._assembled_trace_count = 0
+        self._fallback_trace_count = 0
+        # traces Tempo did not return, e.g. not ingested yet
+        self._missing_trace_count = 0
+        # Fetch pipeline: traces are fetched by up to fetch_workers concurrent requests,
+        # with at most max_in_flight traces submitted but not yet committed
+        self._fetch_slots = asyncio.Semaphore(fetch_workers)
+        self._in_flight = asyncio.Semaphore(max(max_in_flight, fetch_workers))
+        self._pending = asyncio.Queue()
+        # keep references so the tasks are not garbage collected, and close() can stop them
+        self._background_tasks: List[asyncio.Task] = []
         if logger.isEnabledFor(logging.DEBUG):
             self._metrics = Metrics()
             self._metrics_reporter = MetricsReporter(self._metrics, report_interval=60)
@@ -41,49 +100,180 @@ class TraceProcessor:
     async def process(self, trace_data: TracesData):
         """
         Processes traces received from from the TraceConsumer
-        Parses the TracesData object into a Trace object and 
-        submits it to the processing queue for further analysis.
+        Schedules a Tempo lookup for the trace id on the fetch pipeline.
+        Waits while the number of traces in flight is at its limit, 
+        which applies backpressure to the gRPC stream.
         """
         logger.info(f"Processing trace {trace_data.trace_id}")
-        try: 
-            trace_response = await self._query_trace_id(trace_id=trace_data.trace_id)
-            trace = Trace.from_proto(trace_data=trace_response)
+        await self._submit(trace_data.trace_id, self._fetch_trace(trace_data.trace_id))
+
+
+    async def process_data(self, traces_data: TracesData):
+        """
+        Processes span data pushed by the sampler's SampleTracesData stream.
+        The spans are buffered by trace id until the linger time passes,
+        so that spans of the same trace arriving in separate exports are assembled 
+        into a single trace before being analyzed.
+        """
+        self._trace_buffer.add_traces_data(traces_data)
+        await self._flush_trace_buffer()
+
+
+    async def _flush_trace_buffer(self):
+        """
+        Submits traces that are ready to leave the trace buffer.
+        Complete traces are built from the buffered spans directly, 
+        incomplete traces are fetched from Tempo instead.
+        The sampler only streams whole traces when it runs with --trace_linger > 0, 
+        otherwise nearly every trace falls back to Tempo, which is counted and logged.
+        """
+        for buffered in self._trace_buffer.pop_ready():
+            trace_id = buffered.hex_id
+            if buffered.is_complete():
+                self._assembled_trace_count += 1
+                logger.debug(f"Processing assembled trace {trace_id}")
+                await self._submit(trace_id, self._assembled_trace(buffered))
+            else:
+                self._fallback_trace_count += 1
+                self._log_fallback(trace_id)
+                await self._submit(trace_id, self._fetch_trace(trace_id))
+
+
+    def _log_fallback(self, trace_id: str):
+        """
+        Logs a trace fetched from Tempo in data mode, 
+        with a warning on the first one and then every 1000
+        """
+        if self._fallback_trace_count % 1000 == 1:
+            logger.warning(
+                f"Trace {trace_id} is incomplete, falling back to Tempo "
+                f"({self._fallback_trace_count} fetched, {self._assembled_trace_count} assembled so far). "
+                "Data mode needs the sampler to run with --trace_linger > 0 to stream whole traces"
+            )
+        else:
+            logger.debug(f"Trace {trace_id} is incomplete, falling back to Tempo")
+
+
+    def ingest_stats(self) -> dict:
+        """
+        Returns how many traces were assembled from streamed spans, 
+        how many were fetched from Tempo because they were incomplete
+        and how many Tempo did not return
+        """
+        return {
+            "assembled": self._assembled_trace_count,
+            "fallback": self._fallback_trace_count,
+            "missing": self._missing_trace_count,
+        }
+
+
+    async def _drain_trace_buffer(self):
+        """
+        Periodically flushes the trace buffer so traces are not held 
+        past their linger time when the stream goes quiet.
+        """
+        while True:
+            await asyncio.sleep(max(self._trace_linger / 2, 0.1))
+            await self._flush_trace_buffer()
+
+
+    async def _submit(self, trace_id: str, trace_data: Awaitable[TracesData]):
+        """
+        Adds a trace to the fetch pipeline. 
+        The trace data is resolved concurrently with other traces in flight,
+        while traces are committed in the order they were submitted.
+        """
+        await self._in_flight.acquire()
+        self._pending.put_nowait((trace_id, asyncio.ensure_future(trace_data)))
+
+
+    async def _fetch_trace(self, trace_id: str) -> Optional[TracesData]:
+        """
+        Queries Tempo for a trace, limited to fetch_workers concurrent requests
+        """
+        async with self._fetch_slots:
+            return await self._query_trace_id(trace_id=trace_id)
+
 
-            self._tracker.track(trace)
-            if logger.isEnabledFor(logging.DEBUG):
-                # Record the trace latency for metrics
-                trace_duration_ms = trace.duration_ms
-                self._metrics.record_trace_latency(trace_duration_ms)
+    async def _assembled_trace(self, buffered: BufferedTrace) -> TracesData:
+        return buffered.to_traces_data()
 
-                # Record individual span latencies for metrics
-                for span in trace.span_dict.values():
-                    self._metrics.record_span_duration(span.service_name, span.name, span.duration_ms)                            
-            logger.debug(f"_tracker: {self._tracker.service_data.keys()}")
 
+    async def _commit_traces(self):
+        """
+        Waits on the traces in the fetch pipeline in submission order,
+        parses them and hands them over for tracking and analysis.
+        """
+        while True:
+            trace_id, pending_trace = await self._pending.get()
+            try:
+                trace_data = await pending_trace
+                if trace_data is None:
+                    self._missing_trace_count += 1
+                    logger.debug(f"Trace not found in Tempo, skipping: {trace_id}")
+                    continue
+                await self._ingest(Trace.from_proto(trace_data=trace_data))
+            except Exception as e:
+                logger.exception(f"Error processing trace: {trace_id}, {e}")
+            finally:
+                self._in_flight.release()
+                self._pending.task_done()
+
+
+    async def _ingest(self, trace: Trace):
+        """
+        Tracks the latencies of a parsed trace and queues it for analysis
+        """
+        self._tracker.track(trace)
+        if logger.isEnabledFor(logging.DEBUG):
+            # Record the trace latency for metrics
+            trace_duration_ms = trace.duration_ms
+            self._metrics.record_trace_latency(trace_duration_ms)
+
+            # Record individual span latencies for metrics
+            for span in trace.span_dict.values():
+                self._metrics.record_span_duration(span.service_name, span.name, span.duration_ms)                            
+        logger.debug(f"_tracker: {self._tracker.service_data.keys()}")
+
+        if self._scheduler is None:
             # Add the trace to the queue
             await self._queue.put(trace)
-            logger.debug(f"Trace queued for processing: {trace.trace_id}")
-
-        except Exception as e:
-            logger.exception(f"Error processing trace: {trace_data.trace_id}, {e}")
+            logger.debug(f"Trace queued for processing: {trace.trace_id_hex}")
 
 
     async def start(self):
         """
         Starts a background task to consume traces from the queue.
+        When a decision interval is configured, runs the decision scheduler instead.
         """
         logger.info("Starting trace processor worker")
+        self._background_tasks = [
+            asyncio.create_task(self._drain_trace_buffer()),
+            asyncio.create_task(self._commit_traces()),
+        ]
+        if self._scheduler is not None:
+            await self._scheduler.run()
+            return
         while True:
             trace = await self._queue.get()  
             try:
                 self._process_trace(trace)  
-                logger.debug(f"Trace processed: {trace.trace_id}")
+                logger.debug(f"Trace processed: {trace.trace_id_hex}")
             except Exception as e:
-                logger.exception(f"Error processing trace from queue: {trace.trace_id}, {e}")
+                logger.exception(f"Error processing trace from queue: {trace.trace_id_hex}, {e}")
             finally:
                 self._queue.task_done()
 
 
+    def analyze_trace(self, trace: Trace):
+        """
+        Tracks the latencies of a parsed trace and analyzes its services right away, 
+        without going through the fetch pipeline and the queue
+        """
+        self._tracker.track(trace)
+        self._process_trace(trace)
+
+
     def _process_trace(self, trace: Trace):
         """
         Extract the service names and passes on for analysis
@@ -96,13 +286,12 @@ class TraceProcessor:
     async def _query_trace_id(
             self, 
             trace_id: str
-    ) -> TracesData:
+    ) -> Optional[TracesData]:
         """
-        Query Tempo for a trace by its ID
+        Query Tempo for a trace by its ID using the client's pooled session, 
+        None if Tempo does not have it
         """
-        tcp_connection = aiohttp.TCPConnector(limit=20)
-        async with aiohttp.ClientSession(connector=tcp_connection) as session:
-            return  await self._tempo_client.find_trace_by_id(session=session, trace_id=trace_id)
+        return await self._tempo_client.find_trace_by_id(trace_id=trace_id)
 
 
     def _report_service_latencies(self, service_name: str):
@@ -158,50 +347,16 @@ class TraceProcessor:
     def _hybrid_detection(self, service_name, latencies, span_threshold=None,   cusum_threshold=None, ewma_multiplier=1.5) -> Tuple[int, float, float, float, int, float, bool, bool]:
         """
         Hybrid detection method using EWMA for immediate responsiveness and CUSUM for sustained shifts.
-        Determines if a service should scale up or down based on recent latency data.
-        
-        Returns:
-            Tuple[int, float, float, float, int, bool, bool]: A tuple containing:
-                - int: Action indicator (0 = no action, 1 = scale up, -1 = scale down)
-                - float: Upper bound (in milliseconds)
-                - float: Lower bound (in milliseconds)
-                - float: Value triggering the action (either latency or CUSUM)
-                - int: Span size
-                - float: cusum threshold -x to x
-                - bool: Triggered by EMA (True if due to EMA bounds, False otherwise)
-                - bool: Triggered by CUSUM (True if due to CUSUM threshold, False otherwise)
-        """
-        
-        # Set default span to one-third of queue length if not specified
-        if span_threshold is None:
-            span_threshold = max(1, len(latencies) // 3)  # Set span to one-third of current queue length, minimum 1
-
-        if cusum_threshold is None:
-            cusum_threshold = 1.5 * np.std(latencies[-span_threshold:])
-            
-        if len(latencies) < span_threshold:
-            logging.warning("Not enough data to perform hybrid detection.")
-            return 0, float('inf'), float('-inf'), float('nan'), span_threshold, cusum_threshold, False, False  # No action, with placeholder bounds
-
-        # Full EWMA series and p75 of EWMA values
-        ema_series = pd.Series(latencies).ewm(span=span_threshold, adjust=False).mean()
-        ema_p75 = np.percentile(ema_series, 75)
-
-        # Bounds using p75 of EWMA as the center point
-        upper_bound = ema_p75 + ewma_multiplier * np.std(latencies[-span_threshold:])
-        lower_bound = max(1, ema_p75 - ewma_multiplier * np.std(latencies[-span_threshold:]))  # Constrain lower_bound to non-negative values
-
-        value = self._analyzer.p75_latency(service_name)  # Using p75 latency
-
-        # CUSUM for sustained trend detection
-        cusum = np.cumsum(np.array(latencies) - ema_p75)
-
-
-        if value > upper_bound:# or cusum[-1] > cusum_threshold:
-            return 1, upper_bound, lower_bound, value if value > upper_bound else cusum[-1], span_threshold, cusum_threshold, value > upper_bound, cusum[-1] > cusum_threshold  # Scale up
-        elif value < lower_bound:# or cusum[-1] < -cusum_threshold:
-            return -1, upper_bound, lower_bound, value if value < lower_bound else cusum[-1], span_threshold, cusum_threshold,  value < lower_bound, cusum[-1] < -cusum_threshold  # Scale down
-        return 0, upper_bound, lower_bound, value, span_threshold, cusum_threshold, False, False  # No action
+        Determines if a service should scale up or down based on recent latency data, see hybrid_detection.
+        The value compared with the bounds is the p75 latency of the service.
+        """
+        return hybrid_detection(
+            latencies, 
+            self._analyzer.p75_latency(service_name), 
+            span_threshold=span_threshold, 
+            cusum_threshold=cusum_threshold, 
+            ewma_multiplier=ewma_multiplier,
+        )
 
 
     def _analyze_services_hybrid_ewma_cusum(self, services: List[str]):
@@ -214,12 +369,16 @@ class TraceProcessor:
             latencies = self._tracker.get_latencies(service_name)
 
             # Check if there is enough data to proceed
-            if not latencies:
+            if len(latencies) == 0:
                 logging.warning(f"No latency data available for service: {service_name}")
                 continue
 
             # Get the detection result from the hybrid detection function
-            action, upper_bound, lower_bound, value, span_threshold, cume_threshold, is_ema, is_cusum = self._hybrid_detection(service_name, latencies)
+            if self._analysis_mode == "incremental":
+                detection = self._tracker.get_stats(service_name).detect()
+            else:
+                detection = self._hybrid_detection(service_name, latencies)
+            action, upper_bound, lower_bound, value, span_threshold, cume_threshold, is_ema, is_cusum = detection
 
             # Log and take action based on the detected need for scaling
             if action == 1:  # Scale up
@@ -232,6 +391,20 @@ class TraceProcessor:
             else:  # No action
                 logging.debug(f"No action service: {service_name} | Lower Bound: {lower_bound} | Upper Bound {upper_bound} | span_threshold {span_threshold} | Due to ema: {is_ema} , {value} | Due to cusum: {is_cusum} , {value}, threshold {cume_threshold}")
 
+    async def close(self):
+        """
+        Stops the background tasks and releases the pooled Tempo connections.
+        """
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+        if self._assembled_trace_count or self._fallback_trace_count:
+            logger.info(f"Trace ingest: {self.ingest_stats()}")
+        if self._tempo_client.cache is not None:
+            logger.info(f"Trace cache: {self._tempo_client.cache.stats()}")
+        await self._tempo_client.close()
+
     def stop_metrics_reporting(self):
         """
         Stops the metrics reporting thread.
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models import LatencyAnalyzer, LatencyTracker, ewma
+
+SPANS = (1, 2, 3, 5, 8, 10, 25, 50)
+LENGTHS = (1, 2, 8, 10, 25, 100, 1000)
+RTOL = 1e-12
+ATOL = 1e-9
+
+
+def pandas_ewma(values, span):
+    return pd.Series(values).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def pandas_trend_ema(latencies, span=10):
+    """LatencyAnalyzer._calculate_trend_ema as implemented on top of pandas"""
+    if len(latencies) < span:
+        return 0
+    ema = pd.Series(latencies).ewm(span=span, adjust=False).mean()
+    return ema.iloc[-1] - ema.iloc[-span]
+
+
+def samples(length, seed=42):
+    """Latency-like inputs: smooth, heavy tailed, shifted and constant series"""
+    rng = np.random.default_rng(seed + length)
+    return [
+        rng.gamma(4.0, 5.0, length),
+        rng.lognormal(3.0, 1.0, length),
+        np.concatenate([rng.normal(20, 2, length // 2), rng.normal(80, 10, length - length // 2)]),
+        np.full(length, 12.5),
+    ]
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+@pytest.mark.parametrize("span", SPANS)
+def test_ewma_matches_pandas(length, span):
+    for values in samples(length):
+        np.testing.assert_allclose(ewma(values, span), pandas_ewma(values, span), rtol=RTOL, atol=ATOL)
+
+
+def test_ewma_of_empty_values():
+    assert len(ewma([], 10)) == 0
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_trend_ema_matches_pandas(length):
+    analyzer = LatencyAnalyzer(LatencyTracker())
+    for values in samples(length):
+        assert analyzer._calculate_trend_ema(values) == pytest.approx(
+            pandas_trend_ema(values), rel=RTOL, abs=ATOL
+        )
+
+
+def test_tracker_windows_match_pandas():
+    """The analyzer reads read-only views of the tracker's windows, make sure those work too"""
+    tracker = LatencyTracker(queue_length=25)
+    analyzer = LatencyAnalyzer(tracker)
+    for latency in samples(1000)[0].tolist():
+        tracker.add_service_latency("service", latency)
+        latencies = tracker.get_latencies("service")
+        assert analyzer.trend_ema("service") == pytest.approx(
+            pandas_trend_ema(np.array(latencies)), rel=RTOL, abs=ATOL
+        )
+        np.testing.assert_allclose(ewma(latencies, 8), pandas_ewma(latencies, 8), rtol=RTOL, atol=ATOL)
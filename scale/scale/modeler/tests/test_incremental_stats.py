@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+import models
+from models import LatencyTracker, LatencyWindow, Span, StreamingQuantile, Trace, TraceBatch, hybrid_detection
+
+
+def latency_stream(seed=7, length=3000):
+    """Latencies with level shifts up and down, so the detection takes every action"""
+    rng = np.random.default_rng(seed)
+    levels = rng.choice([5.0, 20.0, 80.0, 300.0], size=length // 50)
+    return np.concatenate([rng.gamma(4.0, level / 4.0, 50) for level in levels])
+
+
+def shift_stream(seed):
+    """A steady latency that jumps four times higher and comes back"""
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.gamma(4.0, 5.0, 300), rng.gamma(4.0, 20.0, 150), rng.gamma(4.0, 5.0, 150)])
+
+
+def decisions(stream):
+    """Actions of the incremental and the batch detection after every sample"""
+    incremental = LatencyTracker(incremental_stats=True)
+    batch = LatencyTracker()
+    incremental_actions, batch_actions = [], []
+    for latency in stream.tolist():
+        incremental.add_service_latency("service", latency)
+        batch.add_service_latency("service", latency)
+        latencies = batch.get_latencies("service")
+        batch_actions.append(hybrid_detection(latencies, np.percentile(latencies, 75))[0])
+        incremental_actions.append(incremental.get_stats("service").detect()[0])
+    return np.array(incremental_actions), np.array(batch_actions)
+
+
+def test_streaming_quantile():
+    quantile = StreamingQuantile(0.75)
+    assert quantile.value() is None
+    values = np.random.default_rng(0).normal(20.0, 3.0, 10000)
+    for count, value in enumerate(values.tolist(), 1):
+        quantile.add(value)
+        if count <= 5:
+            # exact until the markers are placed
+            assert quantile.value() == pytest.approx(np.percentile(values[:count], 75))
+    assert quantile.value() == pytest.approx(np.percentile(values, 75), rel=0.01)
+
+    quantile.reset()
+    quantile.add(1.0)
+    assert quantile.count == 1 and quantile.value() == 1.0
+
+
+@pytest.mark.parametrize("queue_length", [1, 2, 25])
+def test_window_sum_and_recent_std_are_exact(queue_length):
+    tracker = LatencyTracker(queue_length=queue_length, incremental_stats=True)
+    for latency in latency_stream(length=1000).tolist():
+        tracker.add_service_latency("service", latency)
+        stats = tracker.get_stats("service")
+        latencies = tracker.get_latencies("service")
+        assert stats.cusum(0.0) == pytest.approx(latencies.sum())
+        assert stats.recent_std == pytest.approx(np.std(latencies[-stats.span:]), abs=1e-9)
+        assert stats.p75 is not None and stats.ema_p75 is not None
+
+
+def test_updates_do_not_recompute_the_window(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("recomputed from the whole window")
+
+    tracker = LatencyTracker(queue_length=25, incremental_stats=True)
+    # updates and decisions touch single samples only, never the window or the batch detection
+    monkeypatch.setattr(models, "hybrid_detection", fail)
+    monkeypatch.setattr(models, "ewma", fail)
+    monkeypatch.setattr(LatencyWindow, "latencies", fail)
+    monkeypatch.setattr(models.np, "percentile", fail)
+    monkeypatch.setattr(models.np, "std", fail)
+    for latency in latency_stream(length=500).tolist():
+        tracker.add_service_latency("service", latency)
+        tracker.get_stats("service").detect()
+
+    span = Span(
+        trace_id="trace", span_id="root", name="GET", service_name="service",
+        start_time_unix_nano=0, end_time_unix_nano=5_000_000_000,
+    )
+    tracker.track_batch(TraceBatch.from_traces([Trace(spans=[span])] * 10))
+    assert len(tracker.get_stats("service")) == 25
+
+
+def test_track_batch_updates_incremental_stats():
+    appended = LatencyTracker(queue_length=25, incremental_stats=True)
+    batched = LatencyTracker(queue_length=25, incremental_stats=True)
+    latencies = latency_stream(length=100)
+    for latency in latencies.tolist():
+        appended.add_service_latency("service", latency)
+    spans = [
+        Span(
+            trace_id=f"trace{i}", span_id=f"root{i}", name="GET", service_name="service",
+            start_time_unix_nano=0, end_time_unix_nano=int(latency * 1e6),
+        )
+        for i, latency in enumerate(latencies.tolist())
+    ]
+    batched.track_batch(TraceBatch.from_traces([Trace(spans=[span]) for span in spans]))
+    np.testing.assert_allclose(
+        batched.get_stats("service").detect()[:4], appended.get_stats("service").detect()[:4]
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_decisions_agree_with_batch_on_a_latency_shift(seed):
+    incremental, batch = decisions(shift_stream(seed))
+    assert (incremental == batch).mean() >= 0.95
+    # both scale down within a few samples of the latency dropping back at sample 450
+    drop = [450 + int(np.argmax(actions[450:] == -1)) for actions in (incremental, batch)]
+    assert all(450 <= first < 470 for first in drop)
+
+
+def test_decisions_agree_with_batch_on_level_shifts():
+    incremental, batch = decisions(latency_stream())
+    assert set(incremental) == set(batch) == {-1, 0, 1}
+    # the EWMA running on across evictions lags the restarted one after steep jumps
+    assert (incremental == batch).mean() >= 0.9
@@ -0,0 +1,56 @@
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+from opentelemetry.proto.resource.v1.resource_pb2 import Resource
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, Span as ProtoSpan, TracesData
+
+from models import Span, Trace
+
+TRACE_ID = bytes.fromhex("0af7651916cd43dd8448eb211c80319c")
+ROOT_ID = bytes.fromhex("b7ad6b7169203331")
+CHILD_ID = bytes.fromhex("00f067aa0ba902b7")
+
+
+def traces_data():
+    spans = [
+        ProtoSpan(
+            trace_id=TRACE_ID, span_id=ROOT_ID, name="GET /", 
+            start_time_unix_nano=0, end_time_unix_nano=3_000_000,
+            attributes=[KeyValue(key="http.method", value=AnyValue(string_value="GET"))],
+        ),
+        ProtoSpan(
+            trace_id=TRACE_ID, span_id=CHILD_ID, parent_span_id=ROOT_ID, name="SELECT", 
+            start_time_unix_nano=1_000_000, end_time_unix_nano=2_000_000,
+        ),
+    ]
+    return TracesData(resource_spans=[
+        ResourceSpans(
+            resource=Resource(attributes=[KeyValue(key="service.name", value=AnyValue(string_value="frontend"))]),
+            scope_spans=[ScopeSpans(spans=spans)],
+        )
+    ])
+
+
+def test_ids_from_proto_have_hex_forms():
+    trace = Trace.from_proto(trace_data=traces_data())
+    assert trace.trace_id == TRACE_ID
+    assert trace.trace_id_hex == TRACE_ID.hex()
+    assert TRACE_ID.hex() in str(trace)
+    child = trace.get_span(CHILD_ID)
+    assert child.span_id_hex == CHILD_ID.hex()
+    assert child.parent_span_id_hex == ROOT_ID.hex()
+    assert trace.root_span.parent_span_id_hex is None
+
+
+def test_string_ids_are_kept():
+    span = Span(trace_id="abc", span_id="def", start_time_unix_nano=0, end_time_unix_nano=1)
+    assert span.trace_id_hex == "abc"
+    assert span.span_id_hex == "def"
+
+
+def test_lazy_fields_are_decoded_from_the_message():
+    trace = Trace.from_proto(trace_data=traces_data())
+    root = trace.root_span
+    assert root.service_name == "frontend"
+    assert root.attributes == [{"key": "http.method", "value": {"string_value": "GET"}}]
+    assert root.to_dict()["attributes"] == root.attributes
+    # every lazy field is decoded by to_dict, the message is released
+    assert root._proto is None
@@ -0,0 +1,42 @@
+import asyncio
+
+from models import LatencyTracker
+from scheduler import DecisionScheduler
+
+
+def test_dirty_services_analyzed_once_per_tick():
+    tracker = LatencyTracker()
+    analyzed = []
+    scheduler = DecisionScheduler(tracker, lambda services: analyzed.append(sorted(services)), 1.0)
+    for latency in [10.0, 12.0, 11.0]:
+        tracker.add_service_latency("cart", latency)
+    tracker.add_service_latency("frontend", 5.0)
+    assert scheduler.tick() == 2
+    assert scheduler.tick() == 0
+    tracker.add_service_latency("cart", 13.0)
+    assert scheduler.tick() == 1
+    assert analyzed == [["cart", "frontend"], ["cart"]]
+    assert (scheduler.ticks, scheduler.services_analyzed) == (3, 3)
+
+
+def test_run_keeps_ticking_after_errors():
+    tracker = LatencyTracker()
+    calls = []
+
+    def analyze(services):
+        calls.append(services)
+        raise RuntimeError("analysis failed")
+
+    async def run():
+        scheduler = DecisionScheduler(tracker, analyze, 0.01)
+        task = asyncio.ensure_future(scheduler.run())
+        tracker.add_service_latency("cart", 10.0)
+        await asyncio.sleep(0.05)
+        tracker.add_service_latency("cart", 11.0)
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return scheduler.ticks
+
+    ticks = asyncio.run(run())
+    assert len(calls) == 2
+    assert ticks > 2
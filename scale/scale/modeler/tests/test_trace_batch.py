@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from models import Span, Trace, TraceBatch
+
+
+def make_span(trace_id, span_id, parent_span_id, service_name, name, duration_ms):
+    return Span(
+        trace_id=trace_id, span_id=span_id, parent_span_id=parent_span_id,
+        service_name=service_name, name=name,
+        start_time_unix_nano=0, end_time_unix_nano=int(duration_ms * 1_000_000),
+    )
+
+
+def make_traces():
+    return [
+        Trace(spans=[
+            make_span("t1", "a", None, "frontend", "GET /", 10.0),
+            make_span("t1", "b", "a", "cart", "GetCart", 4.0),
+            make_span("t1", "c", "b", "cart", "Redis", 1.0),
+        ]),
+        Trace(spans=[
+            make_span("t2", "d", None, "frontend", "GET /", 20.0),
+            make_span("t2", "e", "missing", "ad", "GetAds", 3.0),
+        ]),
+    ]
+
+
+def test_columns():
+    batch = TraceBatch.from_traces(make_traces())
+    assert (len(batch), batch.num_traces) == (5, 2)
+    assert batch.trace_ids == ["t1", "t2"]
+    assert batch.trace_index.tolist() == [0, 0, 0, 1, 1]
+    assert batch.parent_index.tolist() == [-1, 0, 1, -1, -1]
+    assert batch.services == ["frontend", "cart", "ad"]
+    assert batch.service_id.tolist() == [0, 1, 1, 0, 2]
+
+
+def test_durations_match_traces():
+    traces = make_traces()
+    batch = TraceBatch.from_traces(traces)
+    np.testing.assert_allclose(batch.trace_durations(), [trace.duration_ms for trace in traces])
+    trace_index, service_id, durations = batch.trace_service_durations()
+    assert trace_index.tolist() == [0, 0, 1, 1]
+    assert [batch.services[i] for i in service_id] == ["frontend", "cart", "frontend", "ad"]
+    np.testing.assert_allclose(durations, [10.0, 5.0, 20.0, 3.0])
+
+
+def test_aggregate_matches_groupby():
+    batch = TraceBatch.from_traces(make_traces())
+    df = batch.to_df()
+    for by in ["service", "operation"]:
+        aggregated = batch.aggregate(by=by, percentiles=(50, 75))
+        keys = ["service_name"] if by == "service" else ["service_name", "name"]
+        expected = df.groupby(keys, observed=True)["duration_ms"]
+        for key, durations in expected:
+            row = aggregated.loc[key]
+            assert row["count"] == len(durations)
+            assert row["total"] == pytest.approx(durations.sum())
+            assert row["max"] == durations.max()
+            assert row["p75"] == pytest.approx(np.percentile(durations, 75))
+            assert row["p50"] == pytest.approx(np.percentile(durations, 50))
+    with pytest.raises(ValueError):
+        batch.aggregate(by="trace")
+
+
+def test_to_df_resolves_parents():
+    df = TraceBatch.from_traces(make_traces()).to_df()
+    assert df["parent_span_id"].tolist() == [None, "a", "b", None, None]
+    assert df["trace_id"].tolist() == ["t1", "t1", "t1", "t2", "t2"]
+    assert df["name"].tolist() == ["GET /", "GetCart", "Redis", "GET /", "GetAds"]
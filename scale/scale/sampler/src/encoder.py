@@ -0,0 +1,94 @@
+import sys
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureEncoder:
+    """Assigns integer encodings to services and operations, in order of first appearance
+
+    The one-hot feature keys of every encoding ("s0", "o3", ...) are formatted and
+    interned once when the encoding is assigned. Feature dicts built from them reuse
+    the same key objects, whose hashes are cached, instead of formatting and hashing
+    new strings for every span.
+    """
+
+    def __init__(
+        self,
+        services: Optional[dict[str, int]] = None,
+        operations: Optional[dict[str, int]] = None,
+    ):
+        self.services: dict[str, int] = {}
+        self.operations: dict[str, int] = {}
+        self.service_keys: list[str] = []
+        self.operation_keys: list[str] = []
+        services = services or {}
+        operations = operations or {}
+        for service in sorted(services, key=services.get):
+            self.encode_service(service)
+        for operation in sorted(operations, key=operations.get):
+            self.encode_operation(operation)
+
+    def encode_service(self, service: str) -> int:
+        encoding = self.services.get(service)
+        if encoding is None:
+            self.services[service] = encoding = len(self.services)
+            self.service_keys.append(sys.intern(f"s{encoding}"))
+        return encoding
+
+    def encode_operation(self, operation: str) -> int:
+        encoding = self.operations.get(operation)
+        if encoding is None:
+            self.operations[operation] = encoding = len(self.operations)
+            self.operation_keys.append(sys.intern(f"o{encoding}"))
+        return encoding
+
+    def encode(self, service: str, operation: str) -> tuple[int, int]:
+        """Looks up (or assigns) the integer encodings of a service and operation
+
+        Args:
+            service (str): span service
+            operation (str): sanitized span name
+
+        Returns:
+            tuple[int, int]: service and operation encodings
+        """
+        return self.encode_service(service), self.encode_operation(operation)
+
+    def encode_many(
+        self, services: Sequence[str], operations: Sequence[str]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Column-wise encode, giving the same encodings as calling encode on each pair in order
+
+        Args:
+            services (Sequence[str]): service of each span
+            operations (Sequence[str]): sanitized operation of each span
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: service and operation encoding of each span
+        """
+        service_codes, service_names = pd.factorize(np.asarray(services, dtype=object))
+        operation_codes, operation_names = pd.factorize(np.asarray(operations, dtype=object))
+        service_encodings = np.array(
+            [self.encode_service(service) for service in service_names], dtype=np.intp
+        )
+        operation_encodings = np.array(
+            [self.encode_operation(operation) for operation in operation_names], dtype=np.intp
+        )
+        return service_encodings[service_codes], operation_encodings[operation_codes]
+
+    def features(self, service_encoding: int, operation_encoding: int, duration: float) -> dict:
+        """Feature dict of a span for dict based models"""
+        return {
+            self.service_keys[service_encoding]: 1,
+            self.operation_keys[operation_encoding]: 1,
+            "dur": duration,
+        }
+
+    def __getstate__(self) -> dict:
+        return {"services": self.services, "operations": self.operations}
+
+    def __setstate__(self, state: dict) -> None:
+        # re-intern the feature keys, unpickled strings are new objects
+        self.__init__(state["services"], state["operations"])
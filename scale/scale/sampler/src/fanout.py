@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class Subscription(Generic[T]):
+    """Bounded queue of items waiting to be delivered to one subscriber
+
+    Iterate over it to receive items. When the queue is full, ``policy`` decides
+    what publishing does: drop the oldest queued item, drop the new item, or
+    wait until the subscriber catches up.
+    """
+
+    def __init__(self, name: str, maxsize: int, policy: str, shard: Any = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}, expected one of {OVERFLOW_POLICIES}")
+        self.name = name
+        self.policy = policy
+        # which part of the published items the subscriber asked for, see FanOut.publish
+        self.shard = shard
+        self._queue: asyncio.Queue[T] = asyncio.Queue(maxsize)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def lag(self) -> int:
+        """Number of items published but not delivered yet"""
+        return self._queue.qsize()
+
+    async def put(self, item: T) -> None:
+        self.published += 1
+        if self.policy == BLOCK:
+            await self._queue.put(item)
+            return
+        if self._queue.full():
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return
+            self._queue.get_nowait()
+        self._queue.put_nowait(item)
+
+    def close(self) -> None:
+        """Discards the queued items, releasing a publisher blocked on this subscriber"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> T:
+        item = await self._queue.get()
+        self.delivered += 1
+        return item
+
+
+class FanOut(Generic[T]):
+    """Publishes items to every subscriber through its own bounded queue
+
+    Unlike a subject that awaits each observer in turn, a slow subscriber only
+    fills its own queue, so publishing never waits on it unless its policy is
+    ``block``.
+    """
+
+    def __init__(self, maxsize: int = 1000, policy: str = BLOCK):
+        self._maxsize = maxsize
+        self._policy = policy
+        self._subscriptions: list[Subscription[T]] = []
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    @property
+    def subscriptions(self) -> list[Subscription[T]]:
+        return list(self._subscriptions)
+
+    def subscribe(self, name: str, shard: Any = None) -> Subscription[T]:
+        subscription = Subscription(name, self._maxsize, self._policy, shard)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription[T]) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        subscription.close()
+
+    async def publish(
+        self, item: T, route: Optional[Callable[[Subscription[T]], Optional[T]]] = None
+    ) -> None:
+        """Queues an item for every subscriber
+
+        Args:
+            item (T): item to publish
+            route (Callable, optional): gives the part of the item meant for a subscriber,
+                or None to skip it. Defaults to sending the whole item to everyone.
+        """
+        # copy, subscribers may leave while a blocking put is waiting
+        for subscription in list(self._subscriptions):
+            routed = item if route is None else route(subscription)
+            if routed is not None:
+                await subscription.put(routed)
@@ -0,0 +1,201 @@
+import random
+from typing import Optional
+
+import numpy as np
+
+
+class VectorizedHalfSpaceTrees:
+    """Half-Space Trees backed by NumPy node tables, with batch scoring
+
+    Drop-in replacement for river's ``anomaly.HalfSpaceTrees`` (0.21) that stores every
+    tree as flat arrays in heap order (children of node i are 2i+1 and 2i+2) instead of
+    linked node objects. Trees are built with the same random draws as river, so for the
+    same parameters and seed both models hold identical trees and give identical scores.
+
+    On top of ``learn_one``/``score_one`` it offers ``score_many``, which walks all trees
+    for a whole batch of samples at once. Samples are given as a float matrix with one
+    column per entry of ``feature_names`` and NaN for features missing from the sample.
+    """
+
+    PADDING = 0.15
+
+    def __init__(
+        self,
+        n_trees: int = 10,
+        height: int = 8,
+        window_size: int = 250,
+        limits: Optional[dict] = None,
+        seed: Optional[int] = None,
+    ):
+        self.n_trees = n_trees
+        self.height = height
+        self.window_size = window_size
+        self.limits = dict(limits or {})
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.n_branches = 2**height - 1
+        self.n_nodes = 2 ** (height + 1) - 1
+        self.feature_names: list[str] = []
+        self._feature_index: dict[str, int] = {}
+        self._features = np.zeros((n_trees, self.n_branches), dtype=np.intp)
+        self._thresholds = np.zeros((n_trees, self.n_branches), dtype=np.float64)
+        self._l_mass = np.zeros((n_trees, self.n_nodes), dtype=np.int64)
+        self._r_mass = np.zeros((n_trees, self.n_nodes), dtype=np.int64)
+        self._tree_index = np.arange(n_trees)
+        self.counter = 0
+        self._first_window = True
+        self._built = False
+
+    @property
+    def size_limit(self) -> float:
+        """Threshold under which the node search stops during scoring (magic constant from the paper)"""
+        return 0.1 * self.window_size
+
+    @property
+    def _max_score(self) -> float:
+        return self.n_trees * self.window_size * (2 ** (self.height + 1) - 1)
+
+    def _build(self, x: dict) -> None:
+        # Like river, the split features are the features of the first observation
+        self.feature_names = sorted(x)
+        self._feature_index = {name: i for i, name in enumerate(self.feature_names)}
+        for tree in range(self.n_trees):
+            limits = {
+                name: self.limits.get(name, (0.0, 1.0)) for name in self.feature_names
+            }
+            self._build_node(tree, 0, 0, limits)
+        self._built = True
+
+    def _build_node(self, tree: int, node: int, depth: int, limits: dict) -> None:
+        if depth == self.height:
+            return
+
+        # Same draws, in the same order, as river's make_padded_tree
+        on = self.rng.choices(
+            population=list(limits.keys()),
+            weights=[limits[i][1] - limits[i][0] for i in limits],
+        )[0]
+        a, b = limits[on]
+        at = self.rng.uniform(a + self.PADDING * (b - a), b - self.PADDING * (b - a))
+        self._features[tree, node] = self._feature_index[on]
+        self._thresholds[tree, node] = at
+
+        limits[on] = (a, at)
+        self._build_node(tree, 2 * node + 1, depth + 1, limits)
+        limits[on] = (at, b)
+        self._build_node(tree, 2 * node + 2, depth + 1, limits)
+        limits[on] = (a, b)
+
+    def to_vector(self, x: dict) -> np.ndarray:
+        """Converts a feature dict to a row of the feature matrix"""
+        return np.array(
+            [x.get(name, np.nan) for name in self.feature_names], dtype=np.float64
+        )
+
+    def _next_nodes(self, nodes: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Children of nodes on the path of values, rows are trees"""
+        tree_index = self._tree_index[:, None] if nodes.ndim == 2 else self._tree_index
+        thresholds = self._thresholds[tree_index, nodes]
+        left = 2 * nodes + 1
+        # Missing features go down the child that has been the most visited
+        go_right = np.where(
+            np.isnan(values),
+            self._l_mass[tree_index, left] < self._l_mass[tree_index, left + 1],
+            values >= thresholds,
+        )
+        return left + go_right
+
+    def learn_one(self, x: dict) -> None:
+        if not self._built:
+            self._build(x)
+        self.learn_vector(self.to_vector(x))
+
+    def learn_vector(self, vector: np.ndarray) -> None:
+        """Learns a single row of the feature matrix"""
+        nodes = np.zeros(self.n_trees, dtype=np.intp)
+        for _ in range(self.height):
+            self._l_mass[self._tree_index, nodes] += 1
+            nodes = self._next_nodes(nodes, vector[self._features[self._tree_index, nodes]])
+        self._l_mass[self._tree_index, nodes] += 1
+
+        # Pivot the masses if necessary
+        self.counter += 1
+        if self.counter == self.window_size:
+            self._r_mass, self._l_mass = self._l_mass, np.zeros_like(self._l_mass)
+            self._first_window = False
+            self.counter = 0
+
+    def learn_many(self, matrix: np.ndarray) -> None:
+        """Learns the rows of a feature matrix in order
+
+        Masses are updated one row at a time since the path of a sample with missing
+        features depends on the masses left by the samples before it. Per-row NumPy
+        calls dominate at these tree sizes, so the walk runs on list copies of the node
+        tables that are written back afterwards. The model must have been built by a
+        first learn_one call so that the columns are known.
+        """
+        features = self._features.tolist()
+        thresholds = self._thresholds.tolist()
+        l_mass = self._l_mass.tolist()
+        trees = range(self.n_trees)
+        for vector in matrix.tolist():
+            for tree in trees:
+                tree_l_mass = l_mass[tree]
+                tree_features = features[tree]
+                tree_thresholds = thresholds[tree]
+                node = 0
+                for _ in range(self.height):
+                    tree_l_mass[node] += 1
+                    value = vector[tree_features[node]]
+                    left = 2 * node + 1
+                    if value != value:
+                        node = left + (tree_l_mass[left] < tree_l_mass[left + 1])
+                    else:
+                        node = left + (value >= tree_thresholds[node])
+                tree_l_mass[node] += 1
+
+            self.counter += 1
+            if self.counter == self.window_size:
+                self._r_mass = np.array(l_mass, dtype=np.int64)
+                l_mass = [[0] * self.n_nodes for _ in trees]
+                self._first_window = False
+                self.counter = 0
+        self._l_mass = np.array(l_mass, dtype=np.int64)
+
+    def score_one(self, x: dict) -> float:
+        if self._first_window:
+            return 0
+        return float(self.score_many(self.to_vector(x)[None, :])[0])
+
+    def score_many(self, matrix: np.ndarray) -> np.ndarray:
+        """Scores a batch of samples, equivalent to calling score_one on each row
+
+        Args:
+            matrix (np.ndarray): samples, shape (n_samples, len(feature_names)), NaN for missing features
+
+        Returns:
+            np.ndarray: anomaly scores in [0, 1], high scores are anomalies
+        """
+        n_samples = len(matrix)
+        if self._first_window or n_samples == 0:
+            return np.zeros(n_samples)
+
+        sample_index = np.arange(n_samples)[None, :]
+        tree_index = self._tree_index[:, None]
+        nodes = np.zeros((self.n_trees, n_samples), dtype=np.intp)
+        active = np.ones((self.n_trees, n_samples), dtype=bool)
+        score = np.zeros((self.n_trees, n_samples), dtype=np.float64)
+        size_limit = self.size_limit
+        for depth in range(self.height + 1):
+            r_mass = self._r_mass[tree_index, nodes]
+            score += np.where(active, r_mass * float(2**depth), 0.0)
+            # like river, stop walking once a node's reference mass is too small
+            active &= r_mass >= size_limit
+            if depth == self.height or not active.any():
+                break
+            values = matrix[sample_index, self._features[tree_index, nodes]]
+            nodes = self._next_nodes(nodes, values)
+
+        # Normalize between 0 and 1 and flip, so high score -> anomaly
+        return 1 - score.sum(axis=0) / self._max_score
@@ -10,10 +10,11 @@ try:
 except:
     from generated.sampler.v1 import sampler_pb2_grpc
 
+from fanout import BLOCK, OVERFLOW_POLICIES
 from trace_handler import TraceSampler
 
 
-def get_config():
+def get_config(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--max_train_duration",
@@ -51,12 +52,36 @@ def get_config():
         default=2000,
         help="Number of traces to use for training",
     )
+    parser.add_argument(
+        "--train_batch_traces",
+        type=int,
+        default=500,
+        help="Number of training traces fetched from Tempo and learned at a time",
+    )
+    parser.add_argument(
+        "--min_train_size",
+        type=int,
+        default=0,
+        help="Fewest traces to start training with when Tempo has fewer than train_size, 0 to require train_size",
+    )
+    parser.add_argument(
+        "--search_windows",
+        type=int,
+        default=4,
+        help="Number of time windows the training trace search is split into and run concurrently",
+    )
     parser.add_argument(
         "--tempo_url",
         type=str,
         default="http://tempo:3200",
         help="URL of Tempo REST endpoint",
     )
+    parser.add_argument(
+        "--tempo_connections",
+        type=int,
+        default=2,
+        help="Maximum number of pooled connections to Tempo",
+    )
     parser.add_argument(
         "--listen_address",
         type=str,
@@ -75,7 +100,96 @@ def get_config():
         default=20000,
         help="Skip the first n spans so that the otel collector doesn't flood the sampler",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--batch_scoring",
+        action="store_true",
+        help="Score all spans of an export at once with the vectorized Half-Space Trees model",
+    )
+    parser.add_argument(
+        "--score_workers",
+        type=int,
+        default=0,
+        help="Number of worker processes to score spans in, spans are partitioned by service (0 scores on the event loop, implies --batch_scoring)",
+    )
+    parser.add_argument(
+        "--sanitize_pattern",
+        dest="sanitize_patterns",
+        action="append",
+        help="Regex whose first group is kept when sanitizing operation names, may be repeated (replaces the defaults)",
+    )
+    parser.add_argument(
+        "--sanitize_patterns_file",
+        type=str,
+        default="",
+        help="File with one sanitize regex per line, takes precedence over --sanitize_pattern",
+    )
+    parser.add_argument(
+        "--sanitize_cache_size",
+        type=int,
+        default=4096,
+        help="Number of sanitized operation names to memoize",
+    )
+    parser.add_argument(
+        "--combine_sanitize_patterns",
+        action="store_true",
+        help="Apply the sanitize patterns as a single alternation in one pass instead of one after the other",
+    )
+    parser.add_argument(
+        "--trace_linger",
+        type=float,
+        default=0,
+        help="Seconds to hold spans by trace id before publishing every span of each sampled trace once (0 publishes sampled spans right away)",
+    )
+    parser.add_argument(
+        "--trace_buffer_max_spans",
+        type=int,
+        default=100000,
+        help="Maximum number of spans held for trace assembly, the oldest traces are released early past it",
+    )
+    parser.add_argument(
+        "--dedupe_ttl",
+        type=float,
+        default=0,
+        help="Seconds during which a published trace id is not published again by SampleTraces (0 disables, e.g. 60)",
+    )
+    parser.add_argument(
+        "--dedupe_max_entries",
+        type=int,
+        default=100000,
+        help="Maximum number of trace ids held exactly for deduplication",
+    )
+    parser.add_argument(
+        "--dedupe_bloom_capacity",
+        type=int,
+        default=0,
+        help="Initial capacity of a bloom filter backing up the exact trace id set at high rates (0 disables)",
+    )
+    parser.add_argument(
+        "--subscriber_queue_size",
+        type=int,
+        default=1000,
+        help="Maximum number of messages queued for each SampleTraces/SampleTracesData subscriber",
+    )
+    parser.add_argument(
+        "--subscriber_overflow_policy",
+        type=str,
+        default=BLOCK,
+        choices=OVERFLOW_POLICIES,
+        help="What to do when a subscriber's queue is full: drop its oldest message, drop the new message, or block publishing",
+    )
+    parser.add_argument(
+        "--checkpoint_path",
+        type=str,
+        default="",
+        help="File to save the model to and restore it from at startup, training from Tempo only when it does not exist",
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=int,
+        default=300,
+        help="Interval in seconds between model checkpoints",
+    )
+    args = parser.parse_args(argv)
     return args
 
 
@@ -93,10 +207,34 @@ if __name__ == "__main__":
         trace_service_pb2_grpc.add_TraceServiceServicer_to_server(trace_sampler, server)
         sampler_pb2_grpc.add_TraceSamplerServicer_to_server(trace_sampler, server)
         await server.start()
+        # keep references so the tasks are not garbage collected
+        background_tasks = [asyncio.create_task(trace_sampler.report_subscriptions())]
+        if config.trace_linger > 0:
+            background_tasks.append(
+                asyncio.create_task(trace_sampler.drain_trace_buffer())
+            )
+        if config.checkpoint_path:
+            background_tasks.append(
+                asyncio.create_task(
+                    trace_sampler.run_checkpoints(
+                        config.checkpoint_path, config.checkpoint_interval
+                    )
+                )
+            )
         await server.wait_for_termination()
 
-    loop.run_until_complete(trace_sampler.train())
+    if not (
+        config.checkpoint_path and trace_sampler.load_checkpoint(config.checkpoint_path)
+    ):
+        loop.run_until_complete(trace_sampler.train())
+        if config.checkpoint_path:
+            # do not lose the trained model if the sampler dies before the first periodic checkpoint
+            loop.run_until_complete(trace_sampler.save_checkpoint(config.checkpoint_path))
+    trace_sampler.start_scoring_pool()
     try:
         loop.run_until_complete(serve())
     finally:
+        if config.checkpoint_path:
+            loop.run_until_complete(trace_sampler.save_checkpoint(config.checkpoint_path))
+        loop.run_until_complete(trace_sampler.close())
         loop.close()
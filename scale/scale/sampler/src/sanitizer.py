@@ -0,0 +1,128 @@
+import logging
+import re
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Backreferences (\1, (?P=name)) and conditionals ((?(1)...)) refer to groups by
+# number or name, which change once the patterns are combined into one alternation
+GROUP_REFERENCE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=|\(\?\(")
+
+# Each pattern keeps its first group and drops the rest of the match
+DEFAULT_PATTERNS = [
+    "(GET .*)\\?.*",
+    "(GET /api/products)/[A-Z0-9]+",
+]
+
+
+def load_patterns(path: str) -> list[str]:
+    """Reads sanitize patterns from a file, one regex per line
+
+    Blank lines and lines starting with # are ignored.
+
+    Args:
+        path (str): pattern file
+
+    Returns:
+        list[str]: patterns in file order
+    """
+    with open(path) as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class OperationSanitizer:
+    """Removes text unique to a particular request from operation names
+
+    Span names repeat heavily, so results are memoized in a bounded LRU cache
+    keyed by the raw name, with hit and miss counters.
+
+    By default the patterns are applied one after the other, each to the output
+    of the previous one. With ``combine`` they are compiled into a single
+    alternation and applied in one pass instead. At each position the first
+    pattern that matches wins, so the output only differs when the output of one
+    pattern would be rewritten again by a later one. Patterns with named groups or
+    group references cannot be combined, as their groups are renumbered.
+    """
+
+    def __init__(
+        self,
+        patterns: Optional[Sequence[str]] = None,
+        cache_size: int = 4096,
+        combine: bool = False,
+    ):
+        self.patterns = [
+            re.compile(pattern)
+            for pattern in (DEFAULT_PATTERNS if patterns is None else patterns)
+        ]
+        for pattern in self.patterns:
+            if pattern.groups < 1:
+                raise ValueError(
+                    f"Sanitize pattern {pattern.pattern!r} has no group to keep"
+                )
+        self.combine = combine
+        self._combined = None
+        self._group_offsets: list[int] = []
+        if combine:
+            for pattern in self.patterns:
+                if pattern.groupindex or GROUP_REFERENCE.search(pattern.pattern):
+                    raise ValueError(
+                        f"Sanitize pattern {pattern.pattern!r} has named groups or group "
+                        "references and cannot be combined, apply the patterns one by one instead"
+                    )
+        if combine and self.patterns:
+            offset = 1
+            alternatives = []
+            for pattern in self.patterns:
+                alternatives.append(f"({pattern.pattern})")
+                self._group_offsets.append(offset)
+                offset += pattern.groups + 1
+            self._combined = re.compile("|".join(alternatives))
+
+        self._cache_size = cache_size
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def sanitize(self, operation: str) -> str:
+        """Sanitizes an operation name, using the cache when possible
+
+        Args:
+            operation (str): span operation name
+
+        Returns:
+            str: sanitized operation
+        """
+        sanitized = self._cache.get(operation)
+        if sanitized is not None:
+            self.hits += 1
+            self._cache.move_to_end(operation)
+            return sanitized
+
+        self.misses += 1
+        sanitized = self._sanitize(operation)
+        if self._cache_size > 0:
+            self._cache[operation] = sanitized
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return sanitized
+
+    def _sanitize(self, operation: str) -> str:
+        if self._combined is not None:
+            return self._combined.sub(self._keep_group, operation)
+        for pattern in self.patterns:
+            operation = pattern.sub("\\1", operation)
+        return operation
+
+    def _keep_group(self, match: re.Match) -> str:
+        # The wrapping group of the alternative that matched is the one that is set
+        for offset in self._group_offsets:
+            if match.start(offset) != -1:
+                return match.group(offset + 1) or ""
+        return match.group(0)
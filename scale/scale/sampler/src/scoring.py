@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from half_space_trees import VectorizedHalfSpaceTrees
+
+logger = logging.getLogger(__name__)
+
+
+def feature_matrix(
+    feature_names: list[str],
+    service_encodings: np.ndarray,
+    operation_encodings: np.ndarray,
+    durations: np.ndarray,
+) -> np.ndarray:
+    """Builds the feature matrix consumed by VectorizedHalfSpaceTrees.score_many
+
+    Equivalent to stacking the featurize dicts of each span, with NaN for
+    the one-hot features a span does not have.
+
+    Args:
+        feature_names (list[str]): features of the model, e.g. ["dur", "o0", "s0"]
+        service_encodings (np.ndarray): service encoding of each span
+        operation_encodings (np.ndarray): operation encoding of each span
+        durations (np.ndarray): duration of each span in ms
+
+    Returns:
+        np.ndarray: matrix of shape (n_spans, n_features)
+    """
+    columns = []
+    for name in feature_names:
+        if name == "dur":
+            columns.append(durations)
+        else:
+            encodings = service_encodings if name[0] == "s" else operation_encodings
+            columns.append(np.where(encodings == int(name[1:]), 1.0, np.nan))
+    return np.column_stack(columns) if columns else np.empty((len(durations), 0))
+
+
+class SpanScorer:
+    """Applies the sampler's learn/score rules to batches of encoded spans
+
+    Spans of operations seen fewer than ``min_train_count`` times are learned
+    (when shorter than ``max_train_duration``) and given a score of 1, all other
+    spans are scored by the model.
+    """
+
+    def __init__(
+        self,
+        model: VectorizedHalfSpaceTrees,
+        min_train_count: int,
+        max_train_duration: float,
+        seen_spans: Optional[dict[int, int]] = None,
+    ):
+        self.model = model
+        self.min_train_count = min_train_count
+        self.max_train_duration = max_train_duration
+        self.seen_spans = {} if seen_spans is None else seen_spans
+
+    def score(
+        self,
+        service_encodings: np.ndarray,
+        operation_encodings: np.ndarray,
+        durations: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Scores a batch of spans, learning from the ones whose operation is still warming up
+
+        Spans that are learned are applied to the model in order, and the spans queued
+        for scoring before them are scored first, so every span is scored against the
+        same model state as score_one would have seen.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: score of each span, and which spans were scored by the model
+        """
+        scores = np.zeros(len(durations))
+        scored = np.zeros(len(durations), dtype=bool)
+        pending = []
+
+        def score_pending():
+            if pending:
+                index = np.array(pending)
+                matrix = feature_matrix(
+                    self.model.feature_names,
+                    service_encodings[index],
+                    operation_encodings[index],
+                    durations[index],
+                )
+                scores[index] = self.model.score_many(matrix)
+                scored[index] = True
+                pending.clear()
+
+        for i, (service_encoding, operation_encoding, duration) in enumerate(
+            zip(service_encodings.tolist(), operation_encodings.tolist(), durations.tolist())
+        ):
+            seen_count = self.seen_spans.get(operation_encoding, 0)
+            if seen_count < self.min_train_count:
+                if duration < self.max_train_duration:
+                    score_pending()
+                    if self.model.feature_names:
+                        self.model.learn_vector(
+                            feature_matrix(
+                                self.model.feature_names,
+                                service_encodings[i : i + 1],
+                                operation_encodings[i : i + 1],
+                                durations[i : i + 1],
+                            )[0]
+                        )
+                    else:
+                        # the first sample decides which features the trees split on
+                        self.model.learn_one(
+                            {f"s{service_encoding}": 1, f"o{operation_encoding}": 1, "dur": duration}
+                        )
+                    self.seen_spans[operation_encoding] = seen_count + 1
+                scores[i] = 1
+            else:
+                pending.append(i)
+        score_pending()
+        return scores, scored
+
+
+# Scorer owned by a pool worker process, see ScoringPool
+_worker_scorer: Optional[SpanScorer] = None
+
+
+def _init_worker(scorer: SpanScorer) -> None:
+    global _worker_scorer
+    _worker_scorer = scorer
+
+
+def _score_shard(
+    service_encodings: np.ndarray, operation_encodings: np.ndarray, durations: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    return _worker_scorer.score(service_encodings, operation_encodings, durations)
+
+
+def _get_scorer() -> SpanScorer:
+    return _worker_scorer
+
+
+class ScoringPool:
+    """Shards span scoring across worker processes, partitioned by service
+
+    Each worker is a single process executor that owns its own SpanScorer,
+    starting from a replica of the scorer it was given. Spans are routed by
+    service encoding, so a worker keeps learning and scoring the same services
+    and the replicas never need to be merged back together.
+    """
+
+    def __init__(self, scorers: list[SpanScorer]):
+        # spawn rather than fork, forking a process that runs grpc.aio is not safe
+        context = multiprocessing.get_context("spawn")
+        self._executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(scorer,),
+            )
+            for scorer in scorers
+        ]
+
+    def __len__(self) -> int:
+        return len(self._executors)
+
+    async def score(
+        self,
+        service_encodings: np.ndarray,
+        operation_encodings: np.ndarray,
+        durations: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Scores a batch of spans across the workers and merges the results
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: score of each span, and which spans were scored by a model
+        """
+        loop = asyncio.get_running_loop()
+        shards = service_encodings % len(self._executors)
+        indexes = []
+        futures = []
+        for shard, executor in enumerate(self._executors):
+            index = np.flatnonzero(shards == shard)
+            if len(index):
+                indexes.append(index)
+                futures.append(
+                    loop.run_in_executor(
+                        executor,
+                        _score_shard,
+                        service_encodings[index],
+                        operation_encodings[index],
+                        durations[index],
+                    )
+                )
+
+        scores = np.zeros(len(durations))
+        scored = np.zeros(len(durations), dtype=bool)
+        for index, (shard_scores, shard_scored) in zip(
+            indexes, await asyncio.gather(*futures)
+        ):
+            scores[index] = shard_scores
+            scored[index] = shard_scored
+        return scores, scored
+
+    async def scorers(self) -> list[SpanScorer]:
+        """Copies of the scorers currently owned by the workers"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(
+            *(loop.run_in_executor(executor, _get_scorer) for executor in self._executors)
+        )
+
+    def shutdown(self) -> None:
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,122 @@
+import zlib
+from typing import NamedTuple, Optional, Union
+
+from common.trace_util import extract_service
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, TracesData
+
+try:
+    from sampler.v1 import sampler_pb2
+except:
+    from generated.sampler.v1 import sampler_pb2
+
+
+class Shard(NamedTuple):
+    """Part of the sampled traces a subscriber asked for"""
+
+    index: int
+    count: int
+    key: int
+
+    @classmethod
+    def from_request(
+        cls,
+        request: Union[sampler_pb2.SampleTracesRequest, sampler_pb2.SampleTracesDataRequest],
+    ) -> Optional["Shard"]:
+        """Reads the shard of a subscription request
+
+        Returns:
+            Optional[Shard]: the requested shard, None when the subscriber wants every trace
+        """
+        if request.shard_count <= 1:
+            return None
+        if request.shard_index >= request.shard_count:
+            raise ValueError(
+                f"Shard index {request.shard_index} out of range for {request.shard_count} shards"
+            )
+        return cls(request.shard_index, request.shard_count, request.shard_key)
+
+
+class ShardRouter:
+    """Splits a published message between sharded subscribers
+
+    Traces are routed by a stable hash (CRC32) of their trace id, or of the service
+    of their root span, so every sampler replica and restart routes them the same way.
+    Routing by root service needs the root span in the message: traces without it are
+    routed by their trace id instead and counted in ``root_fallbacks``.
+    Hashes and per-shard messages are computed at most once per message, however many
+    subscribers share a shard.
+    """
+
+    def __init__(self, traces_data: TracesData):
+        self._traces_data = traces_data
+        self._hashes: dict[int, dict[bytes, int]] = {}
+        self._messages: dict[Shard, Optional[TracesData]] = {}
+        self.root_fallbacks = 0
+
+    def _trace_hashes(self, shard_key: int) -> dict[bytes, int]:
+        hashes = self._hashes.get(shard_key)
+        if hashes is not None:
+            return hashes
+
+        keys: dict[bytes, bytes] = {}
+        rooted = set()
+        for resource_spans in self._traces_data.resource_spans:
+            service = None
+            for scope_spans in resource_spans.scope_spans:
+                for span in scope_spans.spans:
+                    trace_id = span.trace_id
+                    keys.setdefault(trace_id, trace_id)
+                    if shard_key == sampler_pb2.SHARD_KEY_ROOT_SERVICE and not span.parent_span_id:
+                        if service is None:
+                            service = extract_service(resource_spans).encode()
+                        keys[trace_id] = service
+                        rooted.add(trace_id)
+        if shard_key == sampler_pb2.SHARD_KEY_ROOT_SERVICE:
+            self.root_fallbacks = len(keys) - len(rooted)
+        self._hashes[shard_key] = hashes = {
+            trace_id: zlib.crc32(key) for trace_id, key in keys.items()
+        }
+        return hashes
+
+    def owns(self, shard: Optional[Shard], trace_id: bytes) -> bool:
+        if shard is None:
+            return True
+        return self._trace_hashes(shard.key)[trace_id] % shard.count == shard.index
+
+    def traces_data(self, shard: Optional[Shard]) -> Optional[TracesData]:
+        """Spans of the message that belong to a shard
+
+        Returns:
+            Optional[TracesData]: the spans of the traces owned by the shard, None if there are none
+        """
+        if shard is None:
+            return self._traces_data
+        if shard in self._messages:
+            return self._messages[shard]
+
+        resource_spans_list = []
+        for resource_spans in self._traces_data.resource_spans:
+            scope_spans_list = []
+            for scope_spans in resource_spans.scope_spans:
+                spans_list = [
+                    span for span in scope_spans.spans if self.owns(shard, span.trace_id)
+                ]
+                if spans_list:
+                    scope_spans_list.append(
+                        ScopeSpans(
+                            scope=scope_spans.scope,
+                            schema_url=scope_spans.schema_url,
+                            spans=spans_list,
+                        )
+                    )
+            if scope_spans_list:
+                resource_spans_list.append(
+                    ResourceSpans(
+                        resource=resource_spans.resource,
+                        schema_url=resource_spans.schema_url,
+                        scope_spans=scope_spans_list,
+                    )
+                )
+        message = TracesData(resource_spans=resource_spans_list) if resource_spans_list else None
+        self._messages[shard] = message
+        return message
@@ -0,0 +1,148 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class BloomFilter:
+    """Fixed size bloom filter over byte strings"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.count = 0
+        self.n_bits = max(
+            8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        )
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.n_bits + 7) // 8)
+
+    def _indexes(self, key: bytes):
+        # enhanced double hashing over two 64 bit halves of a single digest, the growing
+        # step keeps the indexes apart when it shares a factor with a small n_bits
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        index = int.from_bytes(digest[:8], "little") % self.n_bits
+        step = int.from_bytes(digest[8:], "little") % self.n_bits
+        for i in range(self.n_hashes):
+            yield index
+            index = (index + step) % self.n_bits
+            step = (step + i + 1) % self.n_bits
+
+    def add(self, key: bytes) -> None:
+        for index in self._indexes(key):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key))
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by chaining filters as they fill up
+
+    Each new filter has ``growth`` times the capacity of the previous one and a
+    tighter error rate, keeping the overall false positive rate under ``error_rate``.
+    """
+
+    TIGHTENING = 0.5
+
+    def __init__(self, initial_capacity: int, error_rate: float = 0.001, growth: int = 2):
+        self._error_rate = error_rate
+        self._growth = growth
+        self._filters = [BloomFilter(initial_capacity, error_rate * (1 - self.TIGHTENING))]
+
+    def add(self, key: bytes) -> None:
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(
+                current.capacity * self._growth,
+                self._error_rate
+                * (1 - self.TIGHTENING)
+                * self.TIGHTENING ** len(self._filters),
+            )
+            self._filters.append(current)
+        current.add(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        return any(key in bloom for bloom in self._filters)
+
+
+class RecentTraceFilter:
+    """Remembers recently published trace ids to suppress duplicates
+
+    Ids are held in an exact set for ``ttl`` seconds, bounded to ``max_entries``
+    with the oldest ids evicted first. With ``bloom_capacity`` set, every id also
+    goes into a scalable bloom filter, so ids evicted from the exact set early
+    are still caught at high rates for a fraction of the memory. Bloom filters
+    cannot forget single ids, so two generations are kept and rotated every ttl,
+    an id stays in the filter for between one and two ttl. Bloom false positives
+    suppress an id that was never published at a rate of about ``bloom_error_rate``.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 100000,
+        bloom_capacity: int = 0,
+        bloom_error_rate: float = 0.001,
+    ):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._recent: OrderedDict[bytes, float] = OrderedDict()
+        self._bloom_capacity = bloom_capacity
+        self._bloom_error_rate = bloom_error_rate
+        self._bloom: Optional[ScalableBloomFilter] = None
+        self._previous_bloom: Optional[ScalableBloomFilter] = None
+        self._bloom_started: Optional[float] = None
+        if bloom_capacity > 0:
+            self._bloom = ScalableBloomFilter(bloom_capacity, bloom_error_rate)
+        self.checked = 0
+        self.suppressed = 0
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def _expire(self, now: float) -> None:
+        deadline = now - self._ttl
+        while self._recent:
+            published = next(iter(self._recent.values()))
+            if published > deadline and len(self._recent) < self._max_entries:
+                break
+            self._recent.popitem(last=False)
+        if self._bloom_started is None:
+            self._bloom_started = now
+        elif self._bloom is not None and now - self._bloom_started >= self._ttl:
+            self._previous_bloom = self._bloom
+            self._bloom = ScalableBloomFilter(self._bloom_capacity, self._bloom_error_rate)
+            self._bloom_started = now
+
+    def _is_recent(self, trace_id: bytes) -> bool:
+        if trace_id in self._recent:
+            return True
+        if self._bloom is None:
+            return False
+        return trace_id in self._bloom or (
+            self._previous_bloom is not None and trace_id in self._previous_bloom
+        )
+
+    def check(self, trace_id: bytes, now: Optional[float] = None) -> bool:
+        """Records a trace id as published
+
+        Args:
+            trace_id (bytes): trace id
+            now (float, optional): current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            bool: True if the id is new, False if it was published within the ttl
+        """
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        self.checked += 1
+        if self._is_recent(trace_id):
+            self.suppressed += 1
+            return False
+        self._recent[trace_id] = now
+        if self._bloom is not None:
+            self._bloom.add(trace_id)
+        return True
@@ -1,16 +1,23 @@
 import asyncio
+import itertools
 import logging
-import re
-from typing import AsyncGenerator
+import os
+import pickle
+import tempfile
+import time
+from typing import AsyncGenerator, Optional, Sequence, Union
 
-import aioreactive as rx
+import grpc
 from backends.tempo_client import TempoClient, TraceLimitException
+from common.trace_buffer import TraceBuffer
 from common.trace_util import extract_service
 from opentelemetry.proto.collector.trace.v1 import (
     trace_service_pb2,
     trace_service_pb2_grpc,
 )
 from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans, ScopeSpans, TracesData
+import numpy as np
+import pandas as pd
 from river import anomaly
 
 try:
@@ -20,6 +27,14 @@ except:
 
 from tenacity import retry, wait_exponential
 
+from encoder import FeatureEncoder
+from fanout import FanOut, Subscription
+from half_space_trees import VectorizedHalfSpaceTrees
+from sanitizer import OperationSanitizer, load_patterns
+from trace_filter import RecentTraceFilter
+from scoring import ScoringPool, SpanScorer, feature_matrix
+from sharding import Shard, ShardRouter
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,30 +42,196 @@ class TraceSampler(
     trace_service_pb2_grpc.TraceServiceServicer, sampler_pb2_grpc.TraceSampler
 ):
 
-    SANITIZE_PATTERNS = [
-        re.compile("(GET .*)\\?.*"),
-        re.compile("(GET /api/products)/[A-Z0-9]+"),
-    ]
+    CHECKPOINT_VERSION = 2
 
     def __init__(self, config):
-        self._tempo_client = TempoClient(config.tempo_url)
+        self._tempo_client = TempoClient(
+            config.tempo_url, limit_per_host=config.tempo_connections
+        )
         self._start_delta = config.start_delta
         self._train_size = config.train_size
+        self._train_batch_traces = config.train_batch_traces
+        self._min_train_size = config.min_train_size or config.train_size
+        self._search_windows = config.search_windows
         self._min_train_count = config.min_train_count
         self._max_train_duration = config.max_train_duration
         self._max_duration = config.max_duration
         self._min_score = config.min_score
         self._category_feature_length = config.category_feature_length
-        self._stream: rx.AsyncSubject[TracesData] = rx.AsyncSubject()
+        if config.sanitize_patterns_file:
+            patterns = load_patterns(config.sanitize_patterns_file)
+        else:
+            patterns = config.sanitize_patterns
+        self._sanitizer = OperationSanitizer(
+            patterns,
+            cache_size=config.sanitize_cache_size,
+            combine=config.combine_sanitize_patterns,
+        )
+        # every subscriber gets its own bounded queue, so a slow modeler never holds up Export
+        self._stream: FanOut[TracesData] = FanOut(
+            config.subscriber_queue_size, config.subscriber_overflow_policy
+        )
+        # ids of the published traces, deduplicated once for every SampleTraces subscriber
+        self._trace_id_stream: FanOut[list[str]] = FanOut(
+            config.subscriber_queue_size, config.subscriber_overflow_policy
+        )
+        self._trace_filter: Optional[RecentTraceFilter] = None
+        if config.dedupe_ttl > 0:
+            self._trace_filter = RecentTraceFilter(
+                ttl=config.dedupe_ttl,
+                max_entries=config.dedupe_max_entries,
+                bloom_capacity=config.dedupe_bloom_capacity,
+            )
         self._total_span_count = 0
         self._sampled_span_count = 0
         self._skip_span_count = config.skip_span_count
-        self._hst = anomaly.HalfSpaceTrees(
-            seed=42, limits={"dur": (0, self._max_duration)}
+        self._score_workers = config.score_workers
+        self._batch_scoring = config.batch_scoring or self._score_workers > 0
+        if self._batch_scoring:
+            self._hst = VectorizedHalfSpaceTrees(
+                seed=42, limits={"dur": (0, self._max_duration)}
+            )
+        else:
+            self._hst = anomaly.HalfSpaceTrees(
+                seed=42, limits={"dur": (0, self._max_duration)}
+            )
+        # warm-up counts, keyed by operation encoding
+        self._seen_spans: dict[int, int] = {}
+        self.encoder = FeatureEncoder()
+        self._scorer = SpanScorer(
+            self._hst, self._min_train_count, self._max_train_duration, self._seen_spans
+        )
+        self._scoring_pool: Optional[ScoringPool] = None
+        # scorers of the pool workers, restored from a checkpoint
+        self._shard_scorers: Optional[list[SpanScorer]] = None
+        # spans are held until their trace is complete when a linger time is set
+        self._trace_linger = config.trace_linger
+        self._trace_buffer: Optional[TraceBuffer] = None
+        if self._trace_linger > 0:
+            self._trace_buffer = TraceBuffer(
+                linger=self._trace_linger, max_spans=config.trace_buffer_max_spans
+            )
+        self._published_trace_count = 0
+        # traces a root service shard could not route by their root span
+        self._root_fallback_count = 0
+
+    def start_scoring_pool(self) -> None:
+        """Hands scoring over to worker processes, each starting from a copy of the trained model
+
+        Call after train(), from then on the model held by this object is no longer updated.
+        """
+        if self._score_workers > 0 and self._scoring_pool is None:
+            scorers = self._shard_scorers
+            if scorers is None or len(scorers) != self._score_workers:
+                scorers = [self._scorer] * self._score_workers
+            self._scoring_pool = ScoringPool(scorers)
+            self._shard_scorers = None
+            logger.info("Scoring spans with %d worker processes", self._score_workers)
+
+    async def save_checkpoint(self, path: str) -> None:
+        """Snapshots the model, warm-up counts and encodings to a file
+
+        The file is written next to its destination and moved into place, so a
+        crash mid-write never leaves a truncated checkpoint behind.
+
+        Args:
+            path (str): checkpoint file
+        """
+        if self._scoring_pool is None:
+            shard_scorers = None
+        else:
+            shard_scorers = await self._scoring_pool.scorers()
+        checkpoint = {
+            "version": self.CHECKPOINT_VERSION,
+            "model": self._hst,
+            "seen_spans": self._seen_spans,
+            "shard_scorers": shard_scorers,
+            "encoder": self.encoder,
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, path)
+        logger.info(
+            "Saved checkpoint to %s (%d services, %d operations)",
+            path,
+            len(self.encoder.services),
+            len(self.encoder.operations),
+        )
+
+    def load_checkpoint(self, path: str) -> bool:
+        """Restores the state saved by save_checkpoint
+
+        Args:
+            path (str): checkpoint file
+
+        Returns:
+            bool: True if the checkpoint was restored, False if it is missing or unusable
+        """
+        if not os.path.exists(path):
+            logger.info("No checkpoint found at %s", path)
+            return False
+        try:
+            with open(path, "rb") as file:
+                checkpoint = pickle.load(file)
+        except Exception:
+            logger.exception("Could not read checkpoint %s:", path)
+            return False
+        if checkpoint.get("version") != self.CHECKPOINT_VERSION:
+            logger.warning("Ignoring checkpoint %s with unknown version", path)
+            return False
+        if type(checkpoint["model"]) is not type(self._hst):
+            logger.warning(
+                "Ignoring checkpoint %s, it holds a %s model",
+                path,
+                type(checkpoint["model"]).__name__,
+            )
+            return False
+        shard_scorers = checkpoint["shard_scorers"]
+        if shard_scorers and len(shard_scorers) != self._score_workers:
+            # the workers learn their own services only, their models cannot be resharded
+            # and the main model stopped learning when the workers started
+            logger.warning(
+                "Ignoring checkpoint %s, it was saved by %d scoring workers and %d are configured",
+                path,
+                len(shard_scorers),
+                self._score_workers,
+            )
+            return False
+
+        self._hst = checkpoint["model"]
+        self._seen_spans = checkpoint["seen_spans"]
+        self.encoder = checkpoint["encoder"]
+        self._scorer = SpanScorer(
+            self._hst, self._min_train_count, self._max_train_duration, self._seen_spans
+        )
+        self._shard_scorers = shard_scorers
+        logger.info(
+            "Restored checkpoint from %s (%d services, %d operations)",
+            path,
+            len(self.encoder.services),
+            len(self.encoder.operations),
         )
-        self._seen_spans = {}
-        self.service_encodings = {}
-        self.operation_encodings = {}
+        return True
+
+    async def run_checkpoints(self, path: str, interval: float) -> None:
+        """Saves a checkpoint every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save_checkpoint(path)
+            except Exception:
+                logger.exception("Error saving checkpoint:")
+
+    async def close(self) -> None:
+        """Release the pooled Tempo connections and stop the scoring workers"""
+        self.log_sanitizer_stats()
+        self.log_trace_filter_stats()
+        await self._tempo_client.close()
+        if self._scoring_pool is not None:
+            self._scoring_pool.shutdown()
+            self._scoring_pool = None
 
     @staticmethod
     def find_service_name(resource_spans: ResourceSpans):
@@ -59,8 +240,7 @@ class TraceSampler(
                 return attribute.value
         return "unknown_service"
 
-    @classmethod
-    def sanitize_operation(cls, operation: str) -> str:
+    def sanitize_operation(self, operation: str) -> str:
         """Sanitizes operation names by removing text unique to a particular request
 
         Args:
@@ -68,29 +248,21 @@ class TraceSampler(
 
         Returns:
             str: sanitized operation
-        """        
-        for pattern in cls.SANITIZE_PATTERNS:
-            operation = pattern.sub("\\1", operation)
-        return operation
+        """
+        return self._sanitizer.sanitize(operation)
 
-    def featurize(self, service: str, operation: str) -> dict[str, str]:
-        """Performs binary encoding to featurize the span operation name
+    def featurize(self, service: str, operation: str, duration: float) -> dict[str, float]:
+        """Performs one-hot encoding of the span service and operation name
 
         Args:
             service (str): span service
-            operation (str): span name
+            operation (str): sanitized span name
+            duration (float): span duration in ms
 
         Returns:
-            dict[str, int]: one-hot encoding of service and operation
-        """        
-        service_encoding = self.service_encodings.get(service)
-        if service_encoding is None:
-            self.service_encodings[service] = service_encoding = len(self.service_encodings)
-        operation_encoding = self.operation_encodings.get(operation)
-        if operation_encoding is None:
-            self.operation_encodings[operation] = operation_encoding = len(self.operation_encodings)
-        features = {f"s{service_encoding}": 1, f"o{operation_encoding}": 1}
-        return features
+            dict[str, float]: one-hot encoding of service and operation, plus the duration
+        """
+        return self.encoder.features(*self.encoder.encode(service, operation), duration)
 
     async def train(self) -> None:
         """Train model using traces pulled from Tempo"""
@@ -98,11 +270,14 @@ class TraceSampler(
         logger.info("Starting training")
 
         @retry(wait=wait_exponential(multiplier=1, min=5, max=60))
-        async def tempo_span_df():
+        async def tempo_trace_ids():
             try:
-                logger.info("Pulling spans from Tempo")
-                return await self._tempo_client.build_span_df(
-                    self._start_delta, self._train_size
+                logger.info("Searching Tempo for training traces")
+                return await self._tempo_client.search_trace_ids(
+                    self._start_delta,
+                    self._train_size,
+                    min_count=self._min_train_size,
+                    windows=self._search_windows,
                 )
             except TraceLimitException as e:
                 logger.warning("Trace limit not reached: %s", e)
@@ -111,18 +286,99 @@ class TraceSampler(
                 logger.exception("Error retrieving training data:")
                 raise
 
-        spans = await tempo_span_df()
-        root_spans = spans[spans.ParentID == "root"]
-        spans = spans[spans.TraceID.isin(root_spans.TraceID)]
-        for index, span in spans.iterrows():
-            service = span["ServiceName"]
-            operation = self.sanitize_operation(span["OperationName"])
-            record = self.featurize(service, operation)
-            duration = span["Duration"]
-            record["dur"] = duration
-            self._hst.learn_one(record)
+        trace_ids = await tempo_trace_ids()
+        # learn the spans batch by batch as the traces arrive, instead of holding them all
+        count = 0
+        elapsed = 0.0
+        errors = self._tempo_client.trace_errors
+        async for spans in self._tempo_client.stream_span_batches(
+            trace_ids, batch_traces=self._train_batch_traces
+        ):
+            # batches hold whole traces, so root spans are found within the batch
+            root_spans = spans[spans.ParentID == "root"]
+            spans = spans[spans.TraceID.isin(root_spans.TraceID)]
+            start = time.perf_counter()
+            count += self.learn_many(spans.ServiceName, spans.OperationName, spans.Duration)
+            elapsed += time.perf_counter() - start
+
+        logger.info(
+            "Training complete, learned %d spans in %.2fs (%.0f spans/s), %d traces could not be retrieved",
+            count,
+            elapsed,
+            count / elapsed if elapsed else 0,
+            self._tempo_client.trace_errors - errors,
+        )
+        self.log_sanitizer_stats()
+
+    def log_sanitizer_stats(self) -> None:
+        logger.info(
+            "Operation sanitizer cache: %d hits, %d misses (%.1f%% hit rate)",
+            self._sanitizer.hits,
+            self._sanitizer.misses,
+            100 * self._sanitizer.hit_rate,
+        )
+
+    def learn_many(
+        self,
+        services: Sequence[str],
+        operations: Sequence[str],
+        durations: Sequence[float],
+        batch_size: int = 10000,
+    ) -> int:
+        """Trains the model on columns of spans, in order
+
+        Operation names are sanitized and encoded once per distinct value instead of
+        once per span, giving the same encodings as featurizing the spans one by one.
+        The spans are then fed to the model in batches of feature matrix rows.
 
-        logger.info("Training complete")
+        Args:
+            services (Sequence[str]): service of each span
+            operations (Sequence[str]): raw operation name of each span
+            durations (Sequence[float]): duration of each span in ms
+            batch_size (int, optional): spans per feature matrix. Defaults to 10000.
+
+        Returns:
+            int: number of spans learned
+        """
+        durations = np.asarray(durations, dtype=np.float64)
+        if len(durations) == 0:
+            return 0
+        operation_codes, operation_names = pd.factorize(np.asarray(operations, dtype=object))
+        sanitized = np.array(
+            [self.sanitize_operation(operation) for operation in operation_names], dtype=object
+        )
+        service_encodings, operation_encodings = self.encoder.encode_many(
+            services, sanitized[operation_codes]
+        )
+
+        if not isinstance(self._hst, VectorizedHalfSpaceTrees):
+            features = self.encoder.features
+            for service_encoding, operation_encoding, duration in zip(
+                service_encodings.tolist(), operation_encodings.tolist(), durations.tolist()
+            ):
+                self._hst.learn_one(features(service_encoding, operation_encoding, duration))
+            return len(durations)
+
+        start = 0
+        if not self._hst.feature_names:
+            # the first sample decides which features the trees split on
+            self._hst.learn_one(
+                self.encoder.features(
+                    int(service_encodings[0]), int(operation_encodings[0]), durations[0]
+                )
+            )
+            start = 1
+        for batch in range(start, len(durations), batch_size):
+            end = batch + batch_size
+            self._hst.learn_many(
+                feature_matrix(
+                    self._hst.feature_names,
+                    service_encodings[batch:end],
+                    operation_encodings[batch:end],
+                    durations[batch:end],
+                )
+            )
+        return len(durations)
 
     async def Export(
         self, request: trace_service_pb2.ExportTraceServiceRequest, context
@@ -136,6 +392,8 @@ class TraceSampler(
         Returns:
             ExportTraceServiceResponse: export response
         """
+        if self._batch_scoring:
+            return await self._export_batch(request)
 
         resource_spans_list = []
         for resource_spans in request.resource_spans:
@@ -144,7 +402,8 @@ class TraceSampler(
                 spans_list = []
                 for span in scope_spans.spans:
                     scored = False
-                    if self._skip_span_count:
+                    skipped = self._skip_span_count > 0
+                    if skipped:
                         self._skip_span_count -= 1
                         score = 0
                     else:
@@ -153,19 +412,30 @@ class TraceSampler(
                         )
                         service = extract_service(resource_spans)
                         operation = self.sanitize_operation(span.name)
-                        record = self.featurize(service, operation)
-                        record["dur"] = duration
-                        seen_count = self._seen_spans.get(operation, 0)
-                        if seen_count < 20: 
+                        service_encoding, operation_encoding = self.encoder.encode(
+                            service, operation
+                        )
+                        record = self.encoder.features(
+                            service_encoding, operation_encoding, duration
+                        )
+                        seen_count = self._seen_spans.get(operation_encoding, 0)
+                        if seen_count < self._min_train_count:
                             if duration < self._max_train_duration:
                                 self._hst.learn_one(record)
-                                self._seen_spans[operation] = seen_count + 1
+                                self._seen_spans[operation_encoding] = seen_count + 1
                             score = 1
                         else:
                             score = self._hst.score_one(record)
                             self._total_span_count += 1
                             scored = True
 
+                    if self._trace_buffer is not None and not skipped:
+                        self._trace_buffer.add_span(
+                            resource_spans,
+                            scope_spans,
+                            span,
+                            sampled=score > self._min_score,
+                        )
                     if score > self._min_score:
                         spans_list.append(span)
                         if scored:
@@ -198,18 +468,310 @@ class TraceSampler(
 
         if self._skip_span_count:
             logger.info("Skipping spans, %s remaining", self._skip_span_count)
+        elif self._trace_buffer is not None:
+            await self._flush_trace_buffer()
         elif resource_spans_list:
-            await self._stream.asend(TracesData(resource_spans=resource_spans_list))
+            await self._publish(TracesData(resource_spans=resource_spans_list))
 
         return trace_service_pb2.ExportTraceServiceResponse()
 
+    async def _score_batch(
+        self,
+        service_encodings: np.ndarray,
+        operation_encodings: np.ndarray,
+        durations: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Scores a batch of spans with the same rules as the per-span path of Export
+
+        Spans still covered by skip_span_count are dropped here, the rest are scored
+        by the in-process scorer, or by the scoring pool once it has been started.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: score of each span, and which spans were scored by a model
+        """
+        scores = np.zeros(len(durations))
+        scored = np.zeros(len(durations), dtype=bool)
+        skipped = min(self._skip_span_count, len(durations))
+        self._skip_span_count -= skipped
+        if skipped < len(durations):
+            if self._scoring_pool is None:
+                batch_scores, batch_scored = self._scorer.score(
+                    service_encodings[skipped:],
+                    operation_encodings[skipped:],
+                    durations[skipped:],
+                )
+            else:
+                batch_scores, batch_scored = await self._scoring_pool.score(
+                    service_encodings[skipped:],
+                    operation_encodings[skipped:],
+                    durations[skipped:],
+                )
+            scores[skipped:] = batch_scores
+            scored[skipped:] = batch_scored
+        self._total_span_count += int(np.count_nonzero(scored))
+        return scores, scored
+
+    async def _export_batch(
+        self, request: trace_service_pb2.ExportTraceServiceRequest
+    ) -> trace_service_pb2.ExportTraceServiceResponse:
+        """Batch version of Export: featurizes every span of the request into arrays
+        and scores them with a single VectorizedHalfSpaceTrees.score_many call
+        """
+        service_encodings = []
+        operation_encodings = []
+        durations = []
+        for resource_spans in request.resource_spans:
+            service = extract_service(resource_spans)
+            for scope_spans in resource_spans.scope_spans:
+                for span in scope_spans.spans:
+                    encodings = self.encoder.encode(service, self.sanitize_operation(span.name))
+                    service_encodings.append(encodings[0])
+                    operation_encodings.append(encodings[1])
+                    durations.append(
+                        1e-6 * (span.end_time_unix_nano - span.start_time_unix_nano)
+                    )
+
+        skipped = min(self._skip_span_count, len(durations))
+        scores, scored = await self._score_batch(
+            np.array(service_encodings, dtype=np.intp),
+            np.array(operation_encodings, dtype=np.intp),
+            np.array(durations, dtype=np.float64),
+        )
+        sampled = scores > self._min_score
+        sampled_spans = int(np.count_nonzero(sampled & scored))
+        self._sampled_span_count += sampled_spans
+
+        resource_spans_list = []
+        if self._trace_buffer is not None:
+            self._buffer_spans(request, sampled.tolist(), skipped)
+        else:
+            resource_spans_list = self._sampled_resource_spans(request, sampled.tolist())
+
+        if sampled_spans and self._total_span_count:
+            logger.info(
+                "Sampled %d of %d (%.1f%%) spans",
+                self._sampled_span_count,
+                self._total_span_count,
+                100 * (self._sampled_span_count / self._total_span_count),
+            )
+
+        if self._skip_span_count:
+            logger.info("Skipping spans, %s remaining", self._skip_span_count)
+        elif self._trace_buffer is not None:
+            await self._flush_trace_buffer()
+        elif resource_spans_list:
+            await self._publish(TracesData(resource_spans=resource_spans_list))
+
+        return trace_service_pb2.ExportTraceServiceResponse()
+
+    @staticmethod
+    def _sampled_resource_spans(
+        request: trace_service_pb2.ExportTraceServiceRequest, sampled: list[bool]
+    ) -> list[ResourceSpans]:
+        """Copies the structure of a request, keeping only the sampled spans"""
+        resource_spans_list = []
+        sampled_it = iter(sampled)
+        for resource_spans in request.resource_spans:
+            scope_spans_list = []
+            for scope_spans in resource_spans.scope_spans:
+                spans_list = [
+                    span for span in scope_spans.spans if next(sampled_it)
+                ]
+                if spans_list:
+                    scope_spans_list.append(
+                        ScopeSpans(
+                            scope=scope_spans.scope,
+                            schema_url=scope_spans.schema_url,
+                            spans=spans_list,
+                        )
+                    )
+            if scope_spans_list:
+                resource_spans_list.append(
+                    ResourceSpans(
+                        resource=resource_spans.resource,
+                        schema_url=resource_spans.schema_url,
+                        scope_spans=scope_spans_list,
+                    )
+                )
+        return resource_spans_list
+
+    def _buffer_spans(
+        self,
+        request: trace_service_pb2.ExportTraceServiceRequest,
+        sampled: list[bool],
+        skipped: int,
+    ) -> None:
+        """Adds the spans of a request to the trace buffer, except for the first skipped ones"""
+        spans = (
+            (resource_spans, scope_spans, span)
+            for resource_spans in request.resource_spans
+            for scope_spans in resource_spans.scope_spans
+            for span in scope_spans.spans
+        )
+        for (resource_spans, scope_spans, span), span_sampled in itertools.islice(
+            zip(spans, sampled), skipped, None
+        ):
+            self._trace_buffer.add_span(
+                resource_spans, scope_spans, span, sampled=span_sampled
+            )
+
+    async def _publish(self, traces_data: TracesData) -> None:
+        """Sends sampled trace data to the SampleTracesData subscribers, and the ids of
+        its traces that were not published recently to the SampleTraces subscribers.
+        Sharded subscribers only get the traces of their shard.
+        """
+        router = ShardRouter(traces_data)
+        await self._stream.publish(
+            traces_data, route=lambda subscription: router.traces_data(subscription.shard)
+        )
+
+        # a message usually holds many spans of the same trace, publish its id once
+        trace_ids = dict.fromkeys(
+            span.trace_id
+            for resource_spans in traces_data.resource_spans
+            for scope_spans in resource_spans.scope_spans
+            for span in scope_spans.spans
+        )
+        if self._trace_filter is not None:
+            trace_ids = [
+                trace_id for trace_id in trace_ids if self._trace_filter.check(trace_id)
+            ]
+        if trace_ids:
+
+            def route(subscription: Subscription) -> Optional[list[str]]:
+                shard_ids = [
+                    bytes.hex(trace_id)
+                    for trace_id in trace_ids
+                    if router.owns(subscription.shard, trace_id)
+                ]
+                return shard_ids or None
+
+            await self._trace_id_stream.publish(trace_ids, route=route)
+        if router.root_fallbacks:
+            self._log_root_fallbacks(router.root_fallbacks)
+
+    def _log_root_fallbacks(self, count: int) -> None:
+        """Counts traces routed by trace id because their root span was not published,
+        warning on the first one and then every 1000
+        """
+        previous = self._root_fallback_count
+        self._root_fallback_count += count
+        if not previous or previous // 1000 != self._root_fallback_count // 1000:
+            logger.warning(
+                "%d traces routed by trace id instead of root service, their root span "
+                "was not published yet",
+                self._root_fallback_count,
+            )
+
+    def log_trace_filter_stats(self) -> None:
+        if self._trace_filter is not None:
+            logger.info(
+                "Trace id filter: %d duplicates suppressed of %d ids, %d ids held",
+                self._trace_filter.suppressed,
+                self._trace_filter.checked,
+                len(self._trace_filter),
+            )
+
+    @staticmethod
+    def log_subscription_stats(subscription: Subscription) -> None:
+        log = logger.warning if subscription.dropped else logger.info
+        log(
+            "Subscriber %s: %d published, %d delivered, %d dropped (%s), %d behind",
+            subscription.name,
+            subscription.published,
+            subscription.delivered,
+            subscription.dropped,
+            subscription.policy,
+            subscription.lag,
+        )
+
+    async def report_subscriptions(self, interval: float = 60) -> None:
+        """Logs the lag and drops of every subscriber every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            for subscription in self._stream.subscriptions + self._trace_id_stream.subscriptions:
+                self.log_subscription_stats(subscription)
+
+    async def _flush_trace_buffer(self) -> None:
+        """Publishes the sampled traces whose linger time has passed, each exactly once
+        and with every span the sampler received for it, and drops the rest
+        """
+        for buffered in self._trace_buffer.pop_ready():
+            if buffered.sampled:
+                self._published_trace_count += 1
+                await self._publish(buffered.to_traces_data())
+
+    async def flush_trace_buffer(self) -> None:
+        """Publishes every sampled trace still held in the trace buffer, as if its
+        linger time had passed
+        """
+        if self._trace_buffer is None:
+            return
+        for buffered in self._trace_buffer.pop_all():
+            if buffered.sampled:
+                self._published_trace_count += 1
+                await self._publish(buffered.to_traces_data())
+
+    async def drain_trace_buffer(self) -> None:
+        """Periodically flushes the trace buffer so traces are not held
+        past their linger time when exports stop coming in
+        """
+        while True:
+            await asyncio.sleep(max(self._trace_linger / 2, 0.1))
+            await self._flush_trace_buffer()
+            logger.debug(
+                "Trace buffer: %d traces (%d spans) held, %d published, %d released early",
+                len(self._trace_buffer),
+                self._trace_buffer.span_count,
+                self._published_trace_count,
+                self._trace_buffer.overflow_count,
+            )
+
+    def subscribe_trace_ids(
+        self, name: str, shard: Optional[Shard] = None
+    ) -> Subscription[list[str]]:
+        """Subscribes to the hex ids of the sampled traces, as streamed by SampleTraces"""
+        return self._trace_id_stream.subscribe(name, shard)
+
+    def subscribe_traces_data(
+        self, name: str, shard: Optional[Shard] = None
+    ) -> Subscription[TracesData]:
+        """Subscribes to the sampled trace data, as streamed by SampleTracesData"""
+        return self._stream.subscribe(name, shard)
+
+    async def _subscription_shard(
+        self,
+        request: Union[sampler_pb2.SampleTracesRequest, sampler_pb2.SampleTracesDataRequest],
+        context,
+    ) -> Optional[Shard]:
+        """Reads the shard of a subscription request, rejecting shards that cannot be served
+
+        Routing by root service needs the root span of every published trace, which is
+        only the case when whole traces are published, with a linger time.
+        """
+        try:
+            shard = Shard.from_request(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        if (
+            shard is not None
+            and shard.key == sampler_pb2.SHARD_KEY_ROOT_SERVICE
+            and self._trace_linger <= 0
+        ):
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                "Sharding by root service needs the sampler to run with --trace_linger > 0, "
+                "use the trace id shard key instead",
+            )
+        return shard
+
     async def SampleTraces(
         self, request: sampler_pb2.SampleTracesRequest, context
     ) -> AsyncGenerator[TracesData, None]:
         """_summary_
 
         Args:
-            request (sampler_pb2.SampleTracesRequest): request object (ignored)
+            request (sampler_pb2.SampleTracesRequest): subscription request, with the shard to receive when sharded
             context (_type_): grpc context
 
         Returns:
@@ -218,24 +780,26 @@ class TraceSampler(
         Yields:
             Iterator[AsyncGenerator[TracesData, None]]: proto wrapper for trace ids
         """        
-        logger.info("Client connected")
+        shard = await self._subscription_shard(request, context)
+        if shard is None:
+            logger.info("Client connected")
+        else:
+            logger.info("Client connected for shard %d of %d", shard.index, shard.count)
 
-        observer = rx.AsyncIteratorObserver(self._stream)
-        loop = asyncio.get_running_loop()
+        subscription = self.subscribe_trace_ids(context.peer(), shard)
 
         def cancel(ctx):
-            loop.create_task(observer.dispose_async())
+            self._trace_id_stream.unsubscribe(subscription)
             logger.info("Client closed")
+            self.log_subscription_stats(subscription)
+            self.log_trace_filter_stats()
 
         context.add_done_callback(cancel)
 
-        async for traces_data in observer:
-            for resource_spans in traces_data.resource_spans:
-                for scope_spans in resource_spans.scope_spans:
-                    for span in scope_spans.spans:
-                        trace_id = bytes.hex(span.trace_id)
-                        logger.info("Publishing %s to client", trace_id)
-                        yield sampler_pb2.SampleTracesResponse(trace_id=trace_id)
+        async for trace_ids in subscription:
+            for trace_id in trace_ids:
+                logger.info("Publishing %s to client", trace_id)
+                yield sampler_pb2.SampleTracesResponse(trace_id=trace_id)
 
     async def SampleTracesData(
         self, request: sampler_pb2.SampleTracesDataRequest, context
@@ -243,7 +807,7 @@ class TraceSampler(
         """_summary_
 
         Args:
-            request (sampler_pb2.SampleTracesDataRequest): request object (ignored)
+            request (sampler_pb2.SampleTracesDataRequest): subscription request, with the shard to receive when sharded
             context (_type_): grpc context
 
         Returns:
@@ -252,17 +816,21 @@ class TraceSampler(
         Yields:
             Iterator[AsyncGenerator[TracesData, None]]: proto wrapper for trace data
         """        
-        logger.info("Client connected")
+        shard = await self._subscription_shard(request, context)
+        if shard is None:
+            logger.info("Client connected")
+        else:
+            logger.info("Client connected for shard %d of %d", shard.index, shard.count)
 
-        observer = rx.AsyncIteratorObserver(self._stream)
-        loop = asyncio.get_running_loop()
+        subscription = self.subscribe_traces_data(context.peer(), shard)
 
         def cancel(ctx):
-            loop.create_task(observer.dispose_async())
+            self._stream.unsubscribe(subscription)
             logger.info("Client closed")
+            self.log_subscription_stats(subscription)
 
         context.add_done_callback(cancel)
 
-        async for traces_data in observer:
+        async for traces_data in subscription:
             logger.info("Publishing traces data to client")
             yield traces_data
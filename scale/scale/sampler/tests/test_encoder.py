@@ -0,0 +1,39 @@
+import pickle
+
+import numpy as np
+
+from encoder import FeatureEncoder
+
+
+def test_encodings_in_order_of_first_appearance():
+    encoder = FeatureEncoder()
+    assert encoder.encode("cart", "GET /cart") == (0, 0)
+    assert encoder.encode("frontend", "GET /cart") == (1, 0)
+    assert encoder.encode("cart", "POST /cart") == (0, 1)
+    assert encoder.features(1, 1, 2.5) == {"s1": 1, "o1": 1, "dur": 2.5}
+
+
+def test_encode_many_matches_encode():
+    services = ["a", "b", "a", "c", "b"]
+    operations = ["x", "x", "y", "z", "y"]
+    expected = FeatureEncoder()
+    pairs = [expected.encode(s, o) for s, o in zip(services, operations)]
+
+    encoder = FeatureEncoder()
+    service_encodings, operation_encodings = encoder.encode_many(services, operations)
+    assert list(zip(service_encodings.tolist(), operation_encodings.tolist())) == pairs
+    assert service_encodings.dtype == np.intp
+    assert encoder.services == expected.services
+    assert encoder.operations == expected.operations
+
+
+def test_pickle_round_trip_interns_keys():
+    encoder = FeatureEncoder()
+    encoder.encode("cart", "GET /cart")
+    encoder.encode("ad", "GET /ad")
+    restored = pickle.loads(pickle.dumps(encoder))
+    assert restored.services == encoder.services
+    assert restored.operations == encoder.operations
+    assert restored.service_keys == ["s0", "s1"]
+    assert restored.service_keys[1] is encoder.service_keys[1]
+    assert restored.encode("new", "GET /new") == (2, 2)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from fanout import BLOCK, DROP_NEWEST, DROP_OLDEST, FanOut
+
+
+async def drain(subscription, count):
+    items = []
+    async for item in subscription:
+        items.append(item)
+        if len(items) == count:
+            return items
+
+
+def test_drop_oldest_keeps_latest_items():
+    async def run():
+        stream = FanOut(maxsize=2, policy=DROP_OLDEST)
+        subscription = stream.subscribe("slow")
+        for item in range(4):
+            await stream.publish(item)
+        assert await drain(subscription, 2) == [2, 3]
+        assert (subscription.published, subscription.delivered, subscription.dropped) == (4, 2, 2)
+
+    asyncio.run(run())
+
+
+def test_drop_newest_keeps_first_items():
+    async def run():
+        stream = FanOut(maxsize=2, policy=DROP_NEWEST)
+        subscription = stream.subscribe("slow")
+        for item in range(4):
+            await stream.publish(item)
+        assert await drain(subscription, 2) == [0, 1]
+        assert subscription.dropped == 2
+
+    asyncio.run(run())
+
+
+def test_block_waits_for_slow_subscriber_only():
+    async def run():
+        stream = FanOut(maxsize=1, policy=BLOCK)
+        slow = stream.subscribe("slow")
+        fast = stream.subscribe("fast")
+        await stream.publish(0)
+        publish = asyncio.ensure_future(stream.publish(1))
+        await asyncio.sleep(0)
+        assert not publish.done()
+        assert await drain(slow, 1) == [0]
+        assert await drain(fast, 1) == [0]
+        await asyncio.wait_for(publish, 1)
+        assert await drain(slow, 1) == [1]
+        assert slow.dropped == fast.dropped == 0
+
+    asyncio.run(run())
+
+
+def test_unsubscribe_releases_blocked_publisher():
+    async def run():
+        stream = FanOut(maxsize=1, policy=BLOCK)
+        subscription = stream.subscribe("gone")
+        await stream.publish(0)
+        publish = asyncio.ensure_future(stream.publish(1))
+        await asyncio.sleep(0)
+        stream.unsubscribe(subscription)
+        await asyncio.wait_for(publish, 1)
+        assert len(stream) == 0
+
+    asyncio.run(run())
+
+
+def test_route_skips_subscribers():
+    async def run():
+        stream = FanOut(maxsize=10)
+        even = stream.subscribe("even", shard=0)
+        odd = stream.subscribe("odd", shard=1)
+        for item in range(4):
+            await stream.publish(item, route=lambda s, item=item: item if item % 2 == s.shard else None)
+        assert await drain(even, 2) == [0, 2]
+        assert await drain(odd, 2) == [1, 3]
+
+    asyncio.run(run())
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FanOut(policy="drop_all").subscribe("any")
@@ -0,0 +1,50 @@
+import pytest
+
+from sanitizer import DEFAULT_PATTERNS, OperationSanitizer, load_patterns
+
+
+@pytest.mark.parametrize("combine", [False, True])
+def test_default_patterns(combine):
+    sanitizer = OperationSanitizer(DEFAULT_PATTERNS, combine=combine)
+    assert sanitizer.sanitize("GET /api/products/OLJCESPC7Z") == "GET /api/products"
+    assert sanitizer.sanitize("GET /api/cart?sessionId=1") == "GET /api/cart"
+    assert sanitizer.sanitize("POST /api/checkout") == "POST /api/checkout"
+
+
+def test_cache_hits_and_eviction():
+    sanitizer = OperationSanitizer(DEFAULT_PATTERNS, cache_size=2)
+    for name in ["a", "b", "a", "c", "b"]:
+        sanitizer.sanitize(name)
+    assert (sanitizer.hits, sanitizer.misses) == (1, 4)
+    assert sanitizer.hit_rate == pytest.approx(0.2)
+
+
+def test_pattern_without_group_is_rejected():
+    with pytest.raises(ValueError):
+        OperationSanitizer([r"/u/\d+"])
+
+
+def test_backreference_applied_per_pattern():
+    patterns = [r"/u/(\d+)", r"(a)\1x/\d+"]
+    assert OperationSanitizer(patterns).sanitize("aax/5") == "a"
+    with pytest.raises(ValueError, match="cannot be combined"):
+        OperationSanitizer(patterns, combine=True)
+
+
+def test_named_groups_cannot_be_combined():
+    patterns = [r"(?P<id>GET /u)/\d+", r"(?P<id>GET /p)/\d+"]
+    sanitizer = OperationSanitizer(patterns)
+    assert sanitizer.sanitize("GET /p/7") == "GET /p"
+    with pytest.raises(ValueError, match="cannot be combined"):
+        OperationSanitizer(patterns, combine=True)
+
+
+def test_escaped_backslash_is_not_a_reference():
+    sanitizer = OperationSanitizer([r"(a)\\1"], combine=True)
+    assert sanitizer.sanitize("a\\1") == "a"
+
+
+def test_load_patterns_skips_comments(tmp_path):
+    path = tmp_path / "patterns.txt"
+    path.write_text("# products\n(GET /api/products)/.*\n\n")
+    assert load_patterns(str(path)) == ["(GET /api/products)/.*"]
@@ -0,0 +1,96 @@
+import zlib
+
+import pytest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+
+from sharding import Shard, ShardRouter, sampler_pb2
+
+
+def add_resource_spans(traces_data, service, spans):
+    resource_spans = traces_data.resource_spans.add()
+    resource_spans.resource.attributes.append(
+        KeyValue(key="service.name", value=AnyValue(string_value=service))
+    )
+    scope_spans = resource_spans.scope_spans.add()
+    for trace_id, span_id, parent_span_id in spans:
+        scope_spans.spans.add(trace_id=trace_id, span_id=span_id, parent_span_id=parent_span_id)
+
+
+def make_traces_data():
+    traces_data = TracesData()
+    add_resource_spans(
+        traces_data,
+        "frontend",
+        [(bytes([i]) * 16, b"\x01" * 8, b"") for i in range(1, 9)],
+    )
+    # children of the same traces, exported by another service
+    add_resource_spans(
+        traces_data,
+        "cart",
+        [(bytes([i]) * 16, b"\x02" * 8, b"\x01" * 8) for i in range(1, 9)],
+    )
+    return traces_data
+
+
+def shard_of(traces_data, shard):
+    message = ShardRouter(traces_data).traces_data(shard)
+    if message is None:
+        return set()
+    return {
+        span.trace_id
+        for resource_spans in message.resource_spans
+        for scope_spans in resource_spans.scope_spans
+        for span in scope_spans.spans
+    }
+
+
+def test_trace_id_shards_split_by_crc():
+    traces_data = make_traces_data()
+    trace_ids = {bytes([i]) * 16 for i in range(1, 9)}
+    owned = [
+        shard_of(traces_data, Shard(index, 3, sampler_pb2.SHARD_KEY_TRACE_ID)) for index in range(3)
+    ]
+    assert set().union(*owned) == trace_ids
+    assert sum(len(ids) for ids in owned) == len(trace_ids)
+    for index, ids in enumerate(owned):
+        assert all(zlib.crc32(trace_id) % 3 == index for trace_id in ids)
+
+
+def test_whole_traces_stay_together():
+    traces_data = make_traces_data()
+    router = ShardRouter(traces_data)
+    message = router.traces_data(Shard(0, 2, sampler_pb2.SHARD_KEY_TRACE_ID))
+    for resource_spans in message.resource_spans:
+        spans = resource_spans.scope_spans[0].spans
+        assert {span.trace_id for span in spans} == shard_of(
+            traces_data, Shard(0, 2, sampler_pb2.SHARD_KEY_TRACE_ID)
+        )
+    assert router.traces_data(Shard(0, 2, sampler_pb2.SHARD_KEY_TRACE_ID)) is message
+
+
+def test_root_service_key_routes_every_trace_of_a_service_together():
+    traces_data = make_traces_data()
+    index = zlib.crc32(b"frontend") % 2
+    router = ShardRouter(traces_data)
+    assert router.traces_data(Shard(index, 2, sampler_pb2.SHARD_KEY_ROOT_SERVICE)) is not None
+    assert router.traces_data(Shard(1 - index, 2, sampler_pb2.SHARD_KEY_ROOT_SERVICE)) is None
+    assert router.root_fallbacks == 0
+
+
+def test_traces_without_root_fall_back_to_trace_id():
+    traces_data = TracesData()
+    add_resource_spans(traces_data, "cart", [(b"\x07" * 16, b"\x02" * 8, b"\x01" * 8)])
+    router = ShardRouter(traces_data)
+    shard = Shard(zlib.crc32(b"\x07" * 16) % 2, 2, sampler_pb2.SHARD_KEY_ROOT_SERVICE)
+    assert router.owns(shard, b"\x07" * 16)
+    assert router.root_fallbacks == 1
+
+
+def test_shard_from_request():
+    request = sampler_pb2.SampleTracesRequest(shard_index=1, shard_count=4)
+    assert Shard.from_request(request) == Shard(1, 4, sampler_pb2.SHARD_KEY_TRACE_ID)
+    assert Shard.from_request(sampler_pb2.SampleTracesRequest()) is None
+    assert ShardRouter(TracesData()).traces_data(None) is not None
+    with pytest.raises(ValueError):
+        Shard.from_request(sampler_pb2.SampleTracesRequest(shard_index=4, shard_count=4))
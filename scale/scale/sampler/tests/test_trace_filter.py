@@ -0,0 +1,46 @@
+from trace_filter import RecentTraceFilter, ScalableBloomFilter
+
+
+def test_duplicates_suppressed_within_ttl():
+    trace_filter = RecentTraceFilter(ttl=10)
+    assert trace_filter.check(b"a", now=0)
+    assert not trace_filter.check(b"a", now=9)
+    assert trace_filter.check(b"a", now=10)
+    assert (trace_filter.checked, trace_filter.suppressed) == (3, 1)
+
+
+def test_oldest_ids_evicted_past_max_entries():
+    trace_filter = RecentTraceFilter(ttl=10, max_entries=2)
+    for trace_id in [b"a", b"b", b"c"]:
+        assert trace_filter.check(trace_id, now=0)
+    assert len(trace_filter) == 2
+    assert trace_filter.check(b"a", now=1)
+
+
+def test_bloom_catches_evicted_ids():
+    trace_filter = RecentTraceFilter(ttl=10, max_entries=2, bloom_capacity=100)
+    for trace_id in [b"a", b"b", b"c"]:
+        trace_filter.check(trace_id, now=0)
+    assert not trace_filter.check(b"a", now=1)
+
+
+def test_bloom_generations_rotate_every_ttl():
+    trace_filter = RecentTraceFilter(ttl=10, max_entries=1, bloom_capacity=100)
+    trace_filter.check(b"a", now=0)
+    trace_filter.check(b"b", now=1)
+    # rotated once, the id is still in the previous generation
+    assert not trace_filter.check(b"a", now=12)
+    trace_filter.check(b"c", now=13)
+    # rotated twice, both generations were started after the id was added
+    assert trace_filter.check(b"a", now=22)
+
+
+def test_scalable_bloom_grows_without_false_negatives():
+    bloom = ScalableBloomFilter(initial_capacity=10, error_rate=0.01)
+    keys = [i.to_bytes(8, "little") for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert len(bloom._filters) > 1
+    assert all(key in bloom for key in keys)
+    false_positives = sum(i.to_bytes(8, "big") in bloom for i in range(1000, 11000))
+    assert false_positives < 150
@@ -3,6 +3,10 @@ from typing import Dict, List
 import pandas as pd
 from tabulate import tabulate
 import logging
+import base64
+from functools import cached_property
+from opentelemetry.proto.trace.v1 import trace_pb2
+from google.protobuf.json_format import MessageToDict
 
 
 
@@ -76,6 +80,8 @@ class Span(Node):
             Converts the Span instance to a dictionary.
         extract_from_dict(self, data: Dict={}, keys: List=[]):
             Extracts values from the provided dictionary for the specified keys.
+        from_proto(cls, span, resource_attributes, scope_name, scope_version):
+            Class method to create a Span instance directly from a protobuf span.
         to_df(self, flatten=False):
             Convert the Span instance to a Pandas DataFrame.
     """
@@ -93,14 +99,54 @@ class Span(Node):
         
         logging.debug(f"Span created: {self.span_id}")
 
+    def _decode(self, field):
+        # Spans built from a dictionary already hold every non-empty field
+        raw = self.__dict__.pop('_raw', None)
+        if raw is None:
+            return {} if field == 'status' else []
+        # decode every lazy field at once, so the serialized span can be released
+        span = trace_pb2.Span.FromString(raw)
+        for name in self.LAZY_FIELDS:
+            if name in self.__dict__:
+                continue
+            if name == 'status':
+                value = MessageToDict(span.status, preserving_proto_field_name=True) if span.HasField('status') else {}
+            else:
+                value = [MessageToDict(item, preserving_proto_field_name=True) for item in getattr(span, name)]
+            self.__dict__[name] = value
+        return self.__dict__[field]
+
+    # Fields from_proto leaves serialized until they are accessed
+    LAZY_FIELDS = ('attributes', 'events', 'links', 'status')
+
+    # cached_property gives way to a value already set in __dict__ by __init__
+    @cached_property
+    def attributes(self):
+        return self._decode('attributes')
+
+    @cached_property
+    def events(self):
+        return self._decode('events')
+
+    @cached_property
+    def links(self):
+        return self._decode('links')
+
+    @cached_property
+    def status(self):
+        return self._decode('status')
+
+    def _fields(self):
+        return {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
+
     def __repr__(self):
-        # Include all attributes from __dict__ in repr
-        attrs = ', '.join(f"{k}={repr(v)}" for k, v in self.__dict__.items())
+        # Include all public attributes from __dict__ in repr
+        attrs = ', '.join(f"{k}={repr(v)}" for k, v in self._fields().items())
         return f"Span({attrs})"
 
     def __str__(self):
-        # Include all attributes from __dict__ in str
-        attrs = ', '.join(f"{k}={v}" for k, v in self.__dict__.items())
+        # Include all public attributes from __dict__ in str
+        attrs = ', '.join(f"{k}={v}" for k, v in self._fields().items())
         return f"Span: {attrs}"
 
     @classmethod
@@ -116,6 +162,48 @@ class Span(Node):
         """
         return cls(**data)
 
+    @classmethod
+    def from_proto(cls, span: trace_pb2.Span, resource_attributes: Dict = {}, scope_name='', scope_version=''):
+        """
+        Create an instance of the class directly from a protobuf span, without MessageToDict.
+
+        The span fields hold the same values MessageToDict gives (base64 ids, enum names,
+        64-bit integers as strings, fields left at their default omitted), so spans are
+        the same as those built with from_dict. Attributes, events, links and status are 
+        kept serialized and only decoded when one of them is first accessed.
+
+        Args:
+            span (trace_pb2.Span): The protobuf span.
+            resource_attributes (Dict, optional): Resource attributes with snake_case keys (e.g., service_name).
+            scope_name (str, optional): Instrumentation scope name.
+            scope_version (str, optional): Instrumentation scope version.
+
+        Returns:
+            An instance of the class holding the span fields.
+        """
+        data = {}
+        lazy = False
+        for field, value in span.ListFields():
+            if field.name in cls.LAZY_FIELDS:
+                lazy = True
+            elif field.type == field.TYPE_BYTES:
+                data[field.name] = base64.b64encode(value).decode('utf-8')
+            elif field.type == field.TYPE_ENUM:
+                data[field.name] = field.enum_type.values_by_number[value].name
+            elif field.cpp_type in (field.CPPTYPE_INT64, field.CPPTYPE_UINT64):
+                data[field.name] = str(value)
+            else:
+                data[field.name] = value
+        # Add resource-level attributes (e.g., service.name), scope name and version
+        data.update(resource_attributes)
+        data['scope_name'] = scope_name
+        data['scope_version'] = scope_version
+
+        instance = cls(**data)
+        if lazy:
+            instance._raw = span.SerializeToString()
+        return instance
+
     def to_dict(self):
         """
         Converts the object's attributes to a dictionary.
@@ -123,7 +211,10 @@ class Span(Node):
         Returns:
             dict: A dictionary containing the object's attributes.
         """
-        return self.__dict__.copy()
+        for field in self.LAZY_FIELDS:
+            getattr(self, field)
+        # like MessageToDict, leave out fields that are empty
+        return {k: v for k, v in self._fields().items() if v or k not in self.LAZY_FIELDS}
 
     def extract_from_dict(self, data: Dict={}, keys: List=[]):
         """
@@ -161,7 +252,7 @@ class Span(Node):
                 attributes_dict[key] = value
             return attributes_dict
 
-        df = pd.DataFrame([self.__dict__])
+        df = pd.DataFrame([self.to_dict()])
 
         # drop 'id' and 'children' columns
         df = df.drop(['id', 'children'], axis=1)
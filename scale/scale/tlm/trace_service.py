@@ -83,10 +83,9 @@ class TraceService(trace_service_pb2_grpc.TraceServiceServicer):
         """
         Parses spans from the given request and processes them.
         This method iterates over resource spans, extracts resource attributes,
-        and processes each span within the scope spans. It converts each span
-        protobuf message to a dictionary, adds resource-level attributes, scope
-        name, and version to the span data, and then adds the span to the internal
-        storage.
+        and processes each span within the scope spans. It builds each span
+        directly from the protobuf message with the resource-level attributes,
+        scope name, and version, and then adds the span to the internal storage.
         Args:
             request: The request object containing resource spans to be parsed.
         Returns:
@@ -115,18 +114,8 @@ class TraceService(trace_service_pb2_grpc.TraceServiceServicer):
                 scope_version = scope.version
 
                 for span in scope_span.spans:
-
-                    # Convert span protobuf message to a dictionary
-                    span_dict = MessageToDict(span, preserving_proto_field_name=True)
-                    
-                    # Add resource-level attributes to the span data (e.g., service.name)
-                    span_dict.update(resource_attributes)
-                    
-                    # Add scope name and version
-                    span_dict['scope_name'] = scope_name
-                    span_dict['scope_version'] = scope_version
-
-                    self.add_span(Span.from_dict(span_dict))
+                    # Read the span fields directly, attributes are decoded on access
+                    self.add_span(Span.from_proto(span, resource_attributes, scope_name, scope_version))
                     span_count += 1
 
         logging.info(f"Extracted {span_count} spans from request.")